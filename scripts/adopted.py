@@ -0,0 +1,230 @@
+# Consistency of the adopted flag: exactly one adopted measurement per source
+#
+# Every table of the schema with both a source and an adopted column is
+# checked in a single UNION ALL statement. As in the original per-table tests
+# (HAVING sum(adopted) != 1), sources whose adopted flags are all NULL are not
+# flagged. `fix_adopted` can repair the flagged sources by adopting one row per
+# source with a configurable rule, and `create_adopted_indexes` adds a partial
+# index on (source) WHERE adopted to each table, which serves lookups of the
+# adopted row of a source and the fixes.
+#
+# Usage:
+#     python scripts/adopted.py [--fix smallest_error|newest_reference] [--create-indexes]
+
+import argparse
+import logging
+import sys
+
+from astrodb_utils import read_db_from_file
+from astropy.table import Table as AstropyTable
+from sqlalchemy import and_, case, func, literal, select, text, union_all
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.schema_cache import load_schema  # noqa: E402
+
+__all__ = [
+    "ADOPTION_RULES",
+    "adopted_tables",
+    "check_adopted",
+    "create_adopted_indexes",
+    "fix_adopted",
+]
+
+logger = logging.getLogger(__name__)
+
+ADOPTED_COLUMN = "adopted"
+INDEX_SUFFIX = "_adopted_source"
+
+
+def adopted_tables(felis_path="schema.yaml"):
+    """Names of the tables of a Felis schema with both source and adopted columns"""
+    schema = load_schema(felis_path)
+    return [
+        table.name
+        for table in schema.tables
+        if {"source", ADOPTED_COLUMN} <= {column.name for column in table.columns}
+    ]
+
+
+def _tables(db, tables, felis_path):
+    if tables is None:
+        tables = adopted_tables(felis_path)
+    return [db.metadata.tables[name] for name in tables if name in db.metadata.tables]
+
+
+def _check_query(tables):
+    selects = []
+    for table in tables:
+        adopted = table.columns[ADOPTED_COLUMN]
+        n_adopted = func.sum(case((adopted, 1), else_=0))
+        selects.append(
+            select(
+                literal(table.name).label("table"),
+                table.c.source,
+                func.count().label("n_rows"),
+                n_adopted.label("n_adopted"),
+            )
+            .group_by(table.c.source)
+            .having(and_(func.count(adopted) > 0, n_adopted != 1))
+        )
+    return union_all(*selects)
+
+
+def check_adopted(db, tables=None, felis_path="schema.yaml"):
+    """
+    Sources without exactly one adopted measurement, in all tables at once.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to check
+    tables : list of str
+        Tables to check. Default: every table of the schema with source and adopted columns
+    felis_path : str
+        Path to the Felis schema, used when tables is not given. Default: schema.yaml
+
+    Returns
+    -------
+    flagged : astropy.table.Table
+        One row per flagged source with the table, the source, the number of rows
+        for the source, and the number of adopted rows
+    """
+    sql_tables = _tables(db, tables, felis_path)
+    rows = []
+    if sql_tables:
+        with db.engine.connect() as conn:
+            rows = [tuple(row) for row in conn.execute(_check_query(sql_tables))]
+    return AstropyTable(rows=rows, names=["table", "source", "n_rows", "n_adopted"], dtype=[str, str, int, int])
+
+
+def _error_column(table):
+    errors = [column for column in table.columns.keys() if column.endswith("_error")]
+    return errors[0] if errors else None
+
+
+def _reference_years(conn, publications, references):
+    # Publication year from the bibcode (eg, 2016ApJ...); unknown years sort first
+    query = select(publications.c.reference, publications.c.bibcode).where(publications.c.reference.in_(references))
+    return {
+        reference: int(bibcode[:4]) if bibcode and bibcode[:4].isdigit() else -1
+        for reference, bibcode in conn.execute(query)
+    }
+
+
+def _smallest_error(rows, table, years):
+    error = _error_column(table)
+
+    def key(row):
+        value = row._mapping[error] if error else None
+        return (value is None, value if value is not None else 0.0, -years.get(row._mapping["reference"], -1))
+
+    return min(rows, key=key)
+
+
+def _newest_reference(rows, table, years):
+    return max(rows, key=lambda row: years.get(row._mapping["reference"], -1))
+
+
+ADOPTION_RULES = {
+    "smallest_error": _smallest_error,
+    "newest_reference": _newest_reference,
+}
+
+
+def fix_adopted(db, rule="smallest_error", tables=None, felis_path="schema.yaml", dry_run=False):
+    """
+    Adopt exactly one row for every flagged source.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to fix
+    rule : str or callable
+        How to pick the adopted row: smallest_error (smallest value of the first
+        *_error column, then newest reference), newest_reference (latest
+        publication year from the bibcode), or a function (rows, table, years)
+        returning one of the rows, where years maps references to publication years.
+        Default: smallest_error
+    tables : list of str
+        Tables to fix. Default: every table of the schema with source and adopted columns
+    felis_path : str
+        Path to the Felis schema, used when tables is not given. Default: schema.yaml
+    dry_run : bool
+        Only report the rows that would be adopted. Default: False
+
+    Returns
+    -------
+    adopted : astropy.table.Table
+        Table, source, and reference of each newly adopted row
+    """
+    choose = ADOPTION_RULES[rule] if isinstance(rule, str) else rule
+    flagged = check_adopted(db, tables=tables, felis_path=felis_path)
+
+    changes = []
+    with db.engine.begin() as conn:
+        for table_name in sorted(set(flagged["table"])):
+            table = db.metadata.tables[table_name]
+            sources = list(flagged["source"][flagged["table"] == table_name])
+            rows = conn.execute(select(table).where(table.c.source.in_(sources))).all()
+            references = sorted({row._mapping["reference"] for row in rows})
+            years = _reference_years(conn, db.metadata.tables["Publications"], references)
+            primary_key = [column.name for column in table.primary_key.columns]
+
+            for source in sources:
+                chosen = choose([row for row in rows if row._mapping["source"] == source], table, years)
+                changes.append((table_name, source, chosen._mapping["reference"]))
+                if dry_run:
+                    continue
+                conn.execute(table.update().where(table.c.source == source).values({ADOPTED_COLUMN: False}))
+                match = and_(*[table.columns[key] == chosen._mapping[key] for key in primary_key])
+                conn.execute(table.update().where(match).values({ADOPTED_COLUMN: True}))
+
+    logger.info(f"{'Would adopt' if dry_run else 'Adopted'} {len(changes)} row(s)")
+    return AstropyTable(rows=changes, names=["table", "source", "reference"], dtype=[str, str, str])
+
+
+def create_adopted_indexes(db, tables=None, felis_path="schema.yaml"):
+    """
+    Create a partial index on (source) WHERE adopted for each table with an adopted flag.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to index (SQLite or PostgreSQL)
+    tables : list of str
+        Tables to index. Default: every table of the schema with source and adopted columns
+    felis_path : str
+        Path to the Felis schema, used when tables is not given. Default: schema.yaml
+    """
+    with db.engine.begin() as conn:
+        for table in _tables(db, tables, felis_path):
+            conn.execute(
+                text(f'CREATE INDEX IF NOT EXISTS "{table.name}{INDEX_SUFFIX}" ON "{table.name}" (source) WHERE adopted')
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every source has exactly one adopted measurement.")
+    parser.add_argument(
+        "--db-name",
+        default="astrodb-template",
+        help="Name of the SQLite database, without the .sqlite extension (default: astrodb-template)",
+    )
+    parser.add_argument("--fix", choices=sorted(ADOPTION_RULES), help="Adopt one row per flagged source with this rule")
+    parser.add_argument("--create-indexes", action="store_true", help="Create the partial indexes on adopted rows")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = read_db_from_file(args.db_name)
+    if args.create_indexes:
+        create_adopted_indexes(db)
+    if args.fix:
+        fix_adopted(db, rule=args.fix).pprint_all()
+
+    flagged = check_adopted(db)
+    flagged.pprint_all()
+    return 0 if len(flagged) == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# Vectorized cross-match of external catalogs against Sources (and Positions)
+#
+# All database positions are loaded into NumPy arrays and indexed with a
+# KD-tree built on unit vectors, so a whole catalog is matched in a single
+# call. The tree is cached in .astrodb_cache next to the SQLite file and
+# rebuilt when the database file changes.
+#
+# Usage:
+#     from scripts.batch_crossmatch import SourceTree
+#     tree = SourceTree.from_database(db)
+#     matches = tree.match(catalog["ra"], catalog["dec"], radius=1 * u.arcsec)
+
+import logging
+import os
+import pickle
+import sys
+
+import numpy as np
+from astropy import units as u
+from astropy.table import Table as AstropyTable
+from scipy.spatial import cKDTree
+from sqlalchemy import select
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.cache_utils import cache_path, database_fingerprint  # noqa: E402
+
+__all__ = [
+    "SourceTree",
+    "batch_crossmatch",
+]
+
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = "kdtree.pkl"
+CACHE_VERSION = 1
+
+
+def _unit_vectors(ra, dec):
+    ra, dec = np.radians(ra), np.radians(dec)
+    cos_dec = np.cos(dec)
+    return np.column_stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)])
+
+
+def _to_degrees(value, unit):
+    if isinstance(value, u.Quantity):
+        return value.to_value(u.deg)
+    return (np.asarray(value, dtype=float) * unit).to_value(u.deg)
+
+
+class SourceTree:
+    """
+    KD-tree of database positions for vectorized cross-matching.
+
+    Parameters
+    ----------
+    sources : array of str
+        Source name for each position
+    ra, dec : array of float
+        Positions in degrees
+    fingerprint : str
+        Fingerprint of the database the positions were read from. Default: None
+    """
+
+    def __init__(self, sources, ra, dec, fingerprint=None):
+        self.sources = np.asarray(sources, dtype=str)
+        self.ra = np.asarray(ra, dtype=float)
+        self.dec = np.asarray(dec, dtype=float)
+        self.fingerprint = fingerprint
+        self.tree = cKDTree(_unit_vectors(self.ra, self.dec))
+        self.from_cache = False
+
+    def __len__(self):
+        return len(self.sources)
+
+    @staticmethod
+    def _read_positions(db, include_positions):
+        tables = [(db._primary_table, db._primary_table_key)]
+        if include_positions and "Positions" in db.metadata.tables:
+            tables.append(("Positions", db._foreign_key))
+
+        sources, ra, dec = [], [], []
+        with db.engine.connect() as conn:
+            for table_name, key in tables:
+                table = db.metadata.tables[table_name]
+                query = select(table.c[key], table.c.ra_deg, table.c.dec_deg).where(
+                    table.c.ra_deg.is_not(None), table.c.dec_deg.is_not(None)
+                )
+                for row in conn.execute(query):
+                    sources.append(row[0])
+                    ra.append(row[1])
+                    dec.append(row[2])
+        return sources, ra, dec
+
+    @classmethod
+    def from_database(cls, db, include_positions=True, use_cache=True, cache_dir=None):
+        """
+        Build the tree from the Sources table and, optionally, the Positions table.
+
+        Parameters
+        ----------
+        db : astrodbkit.astrodb.Database
+            Database to read positions from
+        include_positions : bool
+            Also index every row of the Positions table. Default: True
+        use_cache : bool
+            Load/store the tree in the on-disk cache (SQLite databases only). Default: True
+        cache_dir : str
+            Directory for the cache. Default: .astrodb_cache next to the database file
+
+        Returns
+        -------
+        tree : SourceTree
+        """
+        fingerprint = database_fingerprint(db)
+        path = None
+        if use_cache and fingerprint is not None:
+            suffix = CACHE_SUFFIX if include_positions else "sources." + CACHE_SUFFIX
+            path = cache_path(db, suffix, cache_dir=cache_dir)
+            try:
+                with open(path, "rb") as f:
+                    version, cached = pickle.load(f)
+                if version == CACHE_VERSION and cached.fingerprint == fingerprint:
+                    cached.from_cache = True
+                    return cached
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError, ValueError):
+                pass
+
+        logger.info("Building KD-tree of database positions")
+        tree = cls(*cls._read_positions(db, include_positions), fingerprint=fingerprint)
+
+        if path is not None:
+            # Write then rename, so concurrent readers never load a partial pickle
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump((CACHE_VERSION, tree), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        return tree
+
+    def match(self, ra, dec, radius=1 * u.arcsec, workers=-1):
+        """
+        Match a catalog of positions in one vectorized call.
+
+        Parameters
+        ----------
+        ra, dec : array of float or Quantity
+            Catalog positions. Floats are in degrees.
+        radius : float or Quantity
+            Match radius. Floats are in arcseconds. Default: 1 arcsec
+        workers : int
+            Number of threads used by the KD-tree queries. Default: -1, all CPUs
+
+        Returns
+        -------
+        matches : astropy.table.Table
+            One row per catalog entry with the index of the closest database position
+            (match_index, -1 if none), its source, the separation in arcsec, the number
+            of distinct sources within the radius (n_sources), and an ambiguous flag set
+            when more than one source is within the radius
+        """
+        ra = np.atleast_1d(_to_degrees(ra, u.deg))
+        dec = np.atleast_1d(_to_degrees(dec, u.deg))
+        radius = float(_to_degrees(radius, u.arcsec))
+        chord = 2 * np.sin(np.radians(radius) / 2)
+
+        n = len(ra)
+        match_index = np.full(n, -1, dtype=int)
+        separation = np.full(n, np.nan)
+        n_sources = np.zeros(n, dtype=int)
+
+        valid = np.isfinite(ra) & np.isfinite(dec)
+        if len(self) > 0 and valid.any():
+            xyz = _unit_vectors(ra[valid], dec[valid])
+            distance, index = self.tree.query(xyz, k=1, distance_upper_bound=chord, workers=workers)
+            found = np.isfinite(distance)
+
+            rows = np.flatnonzero(valid)
+            match_index[rows[found]] = index[found]
+            separation[rows[found]] = np.degrees(2 * np.arcsin(distance[found] / 2)) * 3600.0
+            n_sources[rows[found]] = 1
+
+            # Only catalog entries with several positions nearby need the full neighbour list
+            counts = self.tree.query_ball_point(xyz, chord, return_length=True, workers=workers)
+            multiple = np.flatnonzero(counts > 1)
+            if len(multiple) > 0:
+                neighbours = self.tree.query_ball_point(xyz[multiple], chord, workers=workers)
+                for i, indices in zip(multiple, neighbours):
+                    n_sources[rows[i]] = len(set(self.sources[indices]))
+
+        matched_sources = np.where(match_index >= 0, self.sources[match_index], "") if len(self) else np.full(n, "")
+
+        return AstropyTable(
+            [np.arange(n), match_index, matched_sources, separation, n_sources, n_sources > 1],
+            names=["catalog_index", "match_index", "source", "separation_arcsec", "n_sources", "ambiguous"],
+        )
+
+
+def batch_crossmatch(db, catalog, radius=1 * u.arcsec, ra_col="ra", dec_col="dec", include_positions=True):
+    """
+    Cross-match a whole catalog against the database positions.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to match against
+    catalog : astropy.table.Table, pandas.DataFrame, or dict
+        Catalog with right ascension and declination columns in degrees
+    radius : float or Quantity
+        Match radius. Floats are in arcseconds. Default: 1 arcsec
+    ra_col, dec_col : str
+        Names of the catalog position columns. Default: ra, dec
+    include_positions : bool
+        Also match against every row of the Positions table. Default: True
+
+    Returns
+    -------
+    matches : astropy.table.Table
+        See `SourceTree.match`
+    """
+    tree = SourceTree.from_database(db, include_positions=include_positions)
+    return tree.match(catalog[ra_col], catalog[dec_col], radius=radius)
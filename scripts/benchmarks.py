@@ -0,0 +1,404 @@
+# Benchmarks of the build, query, and validation paths on synthetic data
+#
+# Synthetic data (see scripts/synthetic_data.py) is generated once per number
+# of sources and seed in .astrodb_cache/benchmarks and reused by later runs.
+# Each case times one operation a few times and keeps the best and median
+# times; the query cases make one untimed call first, so that the timings do
+# not include compiling the statements. full_build is the bulk loader of
+# scripts/json_loader.py and serial_build the astrodbkit loader used by
+# astrodb_utils.build_db_from_json (Database.load_database), which inserts each
+# source file separately.
+#
+# Results can be stored as a baseline in benchmarks/baselines.json, per number
+# of sources, with the machine that recorded them and the time of a fixed
+# calibration workload on it. Later runs are compared with the baseline scaled
+# by the ratio of the calibration times, so that a baseline recorded on another
+# machine stays usable: a case is a regression when its best time is more than
+# the threshold (default 25%) above the scaled baseline time.
+#
+# The stored baselines cover 10^3 to 10^5 sources. 10^6 sources are left out:
+# the synthetic data alone is a million files (about 4 GB), and serial_build
+# takes hours at that size.
+#
+# Usage:
+#     python scripts/benchmarks.py [--n-sources 1000] [--cases full_build cone_search] [--save-baseline]
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+from astrodbkit.astrodb import Database
+from astropy.table import Table as AstropyTable
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.adopted import check_adopted  # noqa: E402
+from scripts.cache_utils import CACHE_DIRECTORY  # noqa: E402
+from scripts.cone_search import cone_search  # noqa: E402
+from scripts.dirty_save import source_filename  # noqa: E402
+from scripts.incremental_build import build_db_incremental  # noqa: E402
+from scripts.json_loader import SOURCE_DIRECTORY, build_db_parallel, read_settings  # noqa: E402
+from scripts.name_index import NameIndex  # noqa: E402
+from scripts.schema_cache import create_schema_tables  # noqa: E402
+from scripts.synthetic_data import generate_data, source_name  # noqa: E402
+from scripts.validation import validate_database  # noqa: E402
+
+__all__ = [
+    "BASELINE_FILE",
+    "CASES",
+    "compare_to_baseline",
+    "machine_info",
+    "read_baselines",
+    "run_benchmarks",
+    "save_baseline",
+]
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DIRECTORY = os.path.join(CACHE_DIRECTORY, "benchmarks")
+BASELINE_FILE = os.path.join("benchmarks", "baselines.json")
+THRESHOLD = 0.25  # allowed slowdown relative to the baseline
+REPEAT = 3
+N_CONES = 200
+CONE_RADIUS = 3600.0  # arcsec, large enough for the cones to hold sources at every size
+N_NAMES = 1000
+N_SEARCHES = 10
+EDITED_FRACTION = 0.01  # fraction of the source files changed before each incremental build
+CALIBRATION_ROWS = 200000
+MACHINE_KEY = "machine"  # key of the machine description in the baseline of each number of sources
+
+
+class _Context:
+    """Synthetic data and a database built from it, shared by the cases of a run"""
+
+    def __init__(self, n_sources, seed, work_dir, settings_file="database.toml"):
+        self.n_sources = n_sources
+        self.seed = seed
+        self.work_dir = work_dir
+        self.rng = random.Random(seed)
+        self.data_path = os.path.join(work_dir, f"data_{n_sources}_{seed}")
+        self._db = None
+
+        db_settings = read_settings(settings_file)
+        with open(db_settings.felis_path, "rb") as f:
+            schema_hash = hashlib.sha256(f.read()).hexdigest()
+        marker = {"n_sources": n_sources, "seed": seed, "schema": schema_hash}
+        marker_file = os.path.join(self.data_path, "synthetic.json")
+        if os.path.exists(marker_file):
+            with open(marker_file, "r", encoding="utf-8") as f:
+                if json.load(f) == marker:
+                    return
+
+        logger.info(f"Generating {n_sources} synthetic sources in {self.data_path}")
+        generate_data(self.data_path, n_sources, seed=seed, settings_file=settings_file, overwrite=True)
+        with open(marker_file, "w", encoding="utf-8") as f:
+            json.dump(marker, f)
+
+    @property
+    def db(self):
+        if self._db is None:
+            db_name = os.path.join(self.work_dir, f"bench_{self.n_sources}_{self.seed}")
+            self._db = build_db_parallel(db_name=db_name, data_path=self.data_path, bulk=True)
+        return self._db
+
+    def sample_names(self, k):
+        return [source_name(self.rng.randrange(self.n_sources)) for _ in range(k)]
+
+    def edit_sources(self, k, tag):
+        """Change the comments of k random source files"""
+        for name in self.sample_names(k):
+            path = os.path.join(self.data_path, SOURCE_DIRECTORY, source_filename(name))
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            data["Sources"][0]["comments"] = f"benchmark edit {tag}"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(data, indent=4))
+
+
+# Each case takes the context and returns (setup, run): setup (or None) is
+# called before each timed call of run
+
+
+def _full_build(ctx):
+    db_name = os.path.join(ctx.work_dir, "full_build")
+
+    def run():
+        build_db_parallel(db_name=db_name, data_path=ctx.data_path, bulk=True).engine.dispose()
+
+    return None, run
+
+
+def _serial_build(ctx):
+    # As in astrodb_utils.build_db_from_json, which ignores its data_path argument
+    db_file = os.path.join(ctx.work_dir, "serial_build.sqlite")
+    db_settings = read_settings(data_path=ctx.data_path)
+
+    def run():
+        if os.path.exists(db_file):
+            os.remove(db_file)
+        create_schema_tables("sqlite:///" + db_file, db_settings.felis_path)
+        db = Database("sqlite:///" + db_file, lookup_tables=db_settings.lookup_tables)
+        db.load_database(db_settings.data_path)
+        db.engine.dispose()
+
+    return None, run
+
+
+def _incremental_build(ctx):
+    db_name = os.path.join(ctx.work_dir, "incremental_build")
+    build_db_incremental(db_name=db_name, data_path=ctx.data_path).engine.dispose()
+    tags = itertools.count()
+
+    def setup():
+        ctx.edit_sources(max(1, int(ctx.n_sources * EDITED_FRACTION)), next(tags))
+
+    def run():
+        build_db_incremental(db_name=db_name, data_path=ctx.data_path).engine.dispose()
+
+    return setup, run
+
+
+def _cone_search(ctx):
+    db = ctx.db
+    cones = [(ctx.rng.uniform(0, 360), ctx.rng.uniform(-90, 90)) for _ in range(N_CONES)]
+
+    def run():
+        for ra, dec in cones:
+            cone_search(db, ra, dec, radius=CONE_RADIUS, fmt="default")
+
+    run()
+    return None, run
+
+
+def _name_resolution(ctx):
+    index = NameIndex.for_database(ctx.db, cache_dir=ctx.work_dir)
+    names = ctx.sample_names(N_NAMES)
+
+    def run():
+        index.resolve(names)
+
+    run()
+    return None, run
+
+
+def _search_object(ctx):
+    db = ctx.db
+    names = ctx.sample_names(N_SEARCHES)
+
+    def run():
+        for name in names:
+            db.search_object(name, fmt="astropy")
+
+    run()
+    return None, run
+
+
+def _validation(ctx):
+    db = ctx.db
+
+    def run():
+        validate_database(db)
+        check_adopted(db)
+
+    return None, run
+
+
+CASES = {
+    "full_build": _full_build,
+    "serial_build": _serial_build,
+    "incremental_build": _incremental_build,
+    "cone_search": _cone_search,
+    "name_resolution": _name_resolution,
+    "search_object": _search_object,
+    "validation": _validation,
+}
+
+
+def _measure(setup, run, repeat):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {"best": round(min(times), 6), "median": round(statistics.median(times), 6), "repeat": repeat}
+
+
+def run_benchmarks(n_sources=1000, cases=None, repeat=REPEAT, seed=0, work_dir=BENCHMARK_DIRECTORY):
+    """
+    Time each benchmark case on synthetic data.
+
+    Parameters
+    ----------
+    n_sources : int
+        Number of synthetic sources. Default: 1000
+    cases : list of str
+        Cases to run, see CASES. Default: all cases
+    repeat : int
+        Number of timed calls of each case. Default: 3
+    seed : int
+        Seed of the synthetic data and of the query positions and names. Default: 0
+    work_dir : str
+        Directory of the synthetic data and databases. Default: .astrodb_cache/benchmarks
+
+    Returns
+    -------
+    results : dict
+        best and median time in seconds, and number of calls (repeat), for each case
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    ctx = _Context(n_sources, seed, work_dir)
+    results = {}
+    try:
+        for case in cases or list(CASES):
+            logger.info(f"Running {case} with {n_sources} sources")
+            setup, run = CASES[case](ctx)
+            results[case] = _measure(setup, run, repeat)
+    finally:
+        if ctx._db is not None:
+            ctx._db.engine.dispose()
+    return results
+
+
+def _calibration_workload():
+    """Fixed workload timed on every machine: insert, index, and sort rows in an in-memory SQLite database"""
+    rng = random.Random(0)
+    rows = [(i, rng.random()) for i in range(CALIBRATION_ROWS)]
+    with sqlite3.connect(":memory:") as conn:
+        conn.execute("CREATE TABLE calibration (id INTEGER PRIMARY KEY, value REAL)")
+        conn.executemany("INSERT INTO calibration VALUES (?, ?)", rows)
+        conn.execute("CREATE INDEX calibration_value ON calibration (value)")
+        conn.execute("SELECT id FROM calibration ORDER BY value").fetchall()
+    sorted(rows, key=lambda row: row[1])
+
+
+def machine_info(repeat=REPEAT):
+    """Description of the current machine, with the best time in seconds of the calibration workload"""
+    calibration = _measure(None, _calibration_workload, repeat)["best"]
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "calibration": calibration,
+    }
+
+
+def read_baselines(path=BASELINE_FILE):
+    """Stored baselines: results of `run_benchmarks` and the machine, for each number of sources (as a string)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results, n_sources, machine=None, path=BASELINE_FILE):
+    """
+    Store results as the baseline for a number of sources, keeping the baselines of other cases and sizes.
+
+    Parameters
+    ----------
+    results : dict
+        Results of `run_benchmarks`
+    n_sources : int
+        Number of synthetic sources of the results
+    machine : dict
+        Machine that recorded the results, see `machine_info`. Default: None, measured now
+    path : str
+        Baselines file. Default: benchmarks/baselines.json
+    """
+    baselines = read_baselines(path)
+    baseline = baselines.setdefault(str(n_sources), {})
+    baseline.update(results)
+    baseline[MACHINE_KEY] = machine or machine_info()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(baselines, indent=4, sort_keys=True) + "\n")
+
+
+def compare_to_baseline(results, baseline, threshold=THRESHOLD, machine=None):
+    """
+    Compare results with a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        Results of `run_benchmarks`
+    baseline : dict
+        Baseline for the same number of sources
+    threshold : float
+        Allowed slowdown of the best time, as a fraction of the scaled baseline. Default: 0.25
+    machine : dict
+        Machine of the results, see `machine_info`. The baseline times are scaled by the ratio
+        of its calibration time to that of the baseline machine. Default: None, no scaling
+
+    Returns
+    -------
+    comparison : astropy.table.Table
+        One row per case with the scaled baseline and current best times in seconds,
+        their ratio, and whether the case regressed (False for cases without baseline)
+    """
+    scale = 1.0
+    reference_calibration = baseline.get(MACHINE_KEY, {}).get("calibration")
+    if machine is not None and reference_calibration:
+        scale = machine["calibration"] / reference_calibration
+    rows = []
+    for case, result in results.items():
+        reference = baseline.get(case, {}).get("best")
+        if reference:
+            reference = round(reference * scale, 6)
+        ratio = result["best"] / reference if reference else None
+        rows.append((case, reference, result["best"], ratio, ratio is not None and ratio > 1 + threshold))
+    return AstropyTable(
+        rows=rows,
+        names=["case", "baseline_s", "best_s", "ratio", "regression"],
+        dtype=[str, object, float, object, bool],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the database build, query, and validation paths.")
+    parser.add_argument("--n-sources", type=int, default=1000, help="Number of synthetic sources (default: 1000)")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), help="Cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help=f"Timed calls of each case (default: {REPEAT})")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data (default: 0)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help=f"Baselines file (default: {BASELINE_FILE})")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help=f"Allowed slowdown relative to the baseline (default: {THRESHOLD})",
+    )
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    results = run_benchmarks(args.n_sources, cases=args.cases, repeat=args.repeat, seed=args.seed)
+    machine = machine_info()
+
+    baseline = read_baselines(args.baseline).get(str(args.n_sources), {})
+    if baseline.get(MACHINE_KEY, {}).get("platform") not in (None, machine["platform"]):
+        logger.info(f"Baseline recorded on {baseline[MACHINE_KEY]['platform']}, scaled by the calibration times")
+    comparison = compare_to_baseline(results, baseline, threshold=args.threshold, machine=machine)
+    comparison.pprint_all()
+
+    if args.save_baseline:
+        save_baseline(results, args.n_sources, machine=machine, path=args.baseline)
+        logger.info(f"Saved the baseline for {args.n_sources} sources to {args.baseline}")
+        return 0
+    return 1 if any(comparison["regression"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
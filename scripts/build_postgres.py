@@ -1,13 +1,19 @@
 # Python script to build the database from the shema.yaml file
 
 import os
-import yaml
-from astrodbkit.astrodb import Database, create_database
+import sys
+from astrodbkit.astrodb import Database
 from dotenv import load_dotenv
-import subprocess
 
 from sqlalchemy import create_engine
-from sqlalchemy.schema import CreateSchema, DropSchema
+from sqlalchemy.schema import DropSchema
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.adopted import create_adopted_indexes  # noqa: E402
+from scripts.pg_blue_green import blue_green_build  # noqa: E402
+from scripts.pg_copy_loader import copy_load_database  # noqa: E402
+from scripts.schema_cache import create_schema_tables, load_schema, read_schema_yaml  # noqa: E402
+from scripts.tap_metadata import sync_tap_schema  # noqa: E402
 
 DB_PATH = "data"
 SCHEMA_NAME = "astrodb_template"
@@ -26,13 +32,22 @@ REFERENCE_TABLES = [
 ]
 DELETE_SCHEMA = True
 LOAD_DATABASE = True
+USE_COPY = True  # bulk load with COPY (scripts/pg_copy_loader.py) instead of ORM inserts
+BLUE_GREEN = False  # build a versioned shadow schema and swap it in (scripts/pg_blue_green.py) instead of rebuilding in place
 
 # Get information from .env file in root directory
 load_dotenv()
 connection_string = os.environ.get("TEMPLATE_CONNECTION_STRING")
 
-# Get schema name
-data = yaml.safe_load(open(SCHEMA_PATH, "r"))
+# Zero-downtime rebuild: the live schema and TAP_SCHEMA are only replaced once the new version validates
+if BLUE_GREEN:
+    version = blue_green_build(connection_string, schema=SCHEMA_NAME)
+    print(f"Database ready, version {version} is live")
+    sys.exit(0)
+
+# Get schema name; the validated schema is reused for the TAP metadata
+data = read_schema_yaml(SCHEMA_PATH)
+felis_schema = load_schema(SCHEMA_PATH)
 print(f"Preparing for database schema {SCHEMA_NAME}")
 
 # Clear database/schema if requested. Postgres is case-sensitive!
@@ -46,32 +61,26 @@ if DELETE_SCHEMA:
 
 # AstrodbKit version of creating and connecting to the database
 print(f"Creating {SCHEMA_NAME}")
-create_database(connection_string=connection_string, felis_schema=SCHEMA_PATH)
+create_schema_tables(connection_string, SCHEMA_PATH)
 
-# Create TAP_SCHEMA for later use
-print("Creating TAP_SCHEMA")
 db = Database(
     connection_string=connection_string,
     schema=SCHEMA_NAME,
     reference_tables=REFERENCE_TABLES,
 )
-with db.engine.connect() as conn:
-    conn.execute(CreateSchema("TAP_SCHEMA", if_not_exists=True))
-    conn.commit()
 
-# TAP metadata initialization and load
-# Requires the schema to be created first and specified in the call
-commands = f"""
-echo "Loading TAP_SCHEMA..."
-felis init-tap {connection_string} --tap-schema-name=TAP_SCHEMA
-felis load-tap --engine-url={connection_string} --tap-schema-name=TAP_SCHEMA schema/schema.yaml
-"""
-# Run the commands
-subprocess.run(commands, shell=True, check=True)
+# TAP metadata, written in-process over the same engine (scripts/tap_metadata.py)
+print("Loading TAP_SCHEMA")
+sync_tap_schema(db.engine, felis_schema, "TAP_SCHEMA")
 
 # Actually try to load some data
 if LOAD_DATABASE:
     print("Loading database")
-    db.load_database(DB_PATH, verbose=False)
+    if USE_COPY:
+        copy_load_database(db, DB_PATH, schema=SCHEMA_NAME)
+    else:
+        db.load_database(DB_PATH, verbose=False)
+    # Partial indexes on adopted rows, which Felis cannot declare (scripts/adopted.py)
+    create_adopted_indexes(db, felis_path=SCHEMA_PATH)
 
 print("Database ready")
@@ -1,121 +1,234 @@
 # Script to build markdown documentation from the schema.yaml file
+#
+# Docs are generated incrementally: each table's YAML subtree is hashed and
+# only tables whose definition (or this script) changed since the last run, or
+# whose markdown file was touched since, are rendered again. Tables are
+# rendered in parallel and a file is only written when its contents differ.
+# The hashes are kept in .astrodb_cache/schema_docs.json.
+#
+# Usage:
+#     python scripts/build_schema_docs.py [--force] [--workers N]
+
+import argparse
+import hashlib
+import json
 import os
-import yaml
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.cache_utils import CACHE_DIRECTORY  # noqa: E402
+from scripts.schema_cache import read_schema_yaml  # noqa: E402
 
 SCHEMA_PATH = "schema.yaml"
 DOCS_DIR = "docs/"
 SCHEMA_DIAGRAM = "figures/schema_erd.png"
 SCHEMA_SUB_DIR = "schema/"
 SCHEMA_TOC_NAME = "README.md"
+MANIFEST_PATH = os.path.join(CACHE_DIRECTORY, "schema_docs.json")
+PARALLEL_MIN_TABLES = 8  # below this, starting worker processes costs more than rendering
+
+
+def render_table(table):
+    """Markdown page of one table of the schema"""
+    table_name = table["name"]
+    table_primary_key_list = [key.replace(f"#{table_name}.", "") for key in table.get("primaryKey") or []]
+
+    lines = [
+        f"# {table_name}\n",
+        f"{table['description']}\n",
+        "\n\nColumns marked with an exclamation mark (❗️) may not be empty.\n",
+        "| Column Name | Description | Datatype | Length | Units  | UCD |\n",
+        "| --- | --- | --- | --- | --- | --- |\n",
+    ]
+
+    # Loop over column names to get the column information
+    for column in table["columns"]:
+        # Get the unit from the fits or ivoa tags
+        units = column.get("fits:tunit", "")
+        if units == "":
+            units = column.get("ivoa:unit", "")
+
+        # If the column is a primary key, underline the name
+        if column["name"] in table_primary_key_list:
+            column_name = f"<ins>{column['name']}</ins>"
+        else:
+            column_name = column["name"]
+
+        # If the column is required, add an exclamation mark to the name
+        if column.get("nullable", "True") is False:
+            column_name = f"❗️ {column_name}"
+        else:
+            column_name = column["name"]
+
+        lines.append(
+            f"| {column_name} | {column['description']} | {column['datatype']} | {column.get('length', '')} | {units} | {column.get('ivoa:ucd', '')}  |\n"
+        )
+    lines.append("\n")
+
+    #  Make the indexes table
+    if "indexes" in table:
+        lines += ["## Indexes\n", "| Name | Columns | Description |\n", "| --- | --- | --- |\n"]
+        lines += [
+            f"| {index['name']} | {index['columns']} | {index.get('description', '')} |\n"
+            for index in table["indexes"]
+        ]
+        lines.append("\n")
+
+    #  Make the constraints table
+    if "constraints" in table:
+        foreign_keys = ["## Foreign Keys\n", "| Description | Columns | Referenced Columns |\n", "| --- | --- | --- |\n"]
+        checks = ["## Checks\n", "| Description | Expression |\n", "| --- | --- |\n"]
+        n_foreign_keys = n_checks = 0
+        for constraint in table["constraints"]:
+            if constraint.get("@type") == "ForeignKey":
+                n_foreign_keys += 1
+                foreign_keys.append(
+                    f"| {constraint['description']} | {constraint.get('columns', '')} | {constraint.get('referencedColumns', '')} |\n"
+                )
+            elif constraint.get("@type") == "Check":
+                n_checks += 1
+                checks.append(f"| {constraint['description']} | {constraint.get('expression', '')} |\n")
+            else:
+                print(f"Unknown constraint type {constraint.get('@type')} in table {table_name}")
+
+        if n_foreign_keys:
+            lines += foreign_keys
+        if n_checks:
+            lines += checks
+
+    return "".join(lines)
+
+
+def render_toc(table_names, docs_dir=DOCS_DIR):
+    """Markdown table of contents of the schema documentation"""
+    lines = [
+        "# Schema Documentation\n",
+        f"This documentation is generated from the [schema.yaml]({SCHEMA_PATH}) file using [build_schema_docs.py](scripts/build_schema_docs.py).\n",
+        "\n## Tables\n",
+    ]
+    lines += [f"- [{name}]({os.path.join(SCHEMA_SUB_DIR, f'{name}.md')})\n" for name in table_names]
+    lines.append("\n")
+
+    if os.path.exists(os.path.join(docs_dir, SCHEMA_DIAGRAM)):
+        lines.append(
+            "## Schema Diagram\n"
+            f"This diagram is generated from the [schema.yaml]({SCHEMA_PATH}) file using [make_schema_erd.py](scripts/make_schema_erd.py).\n"
+            f"![Schema Diagram]({SCHEMA_DIAGRAM})\n"
+        )
+    return "".join(lines)
+
+
+def _renderer_hash():
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def table_hash(table, renderer=""):
+    """Hash of a table's YAML subtree (and of the renderer), to detect tables whose page must change"""
+    content = json.dumps(table, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(f"{renderer}|{content}".encode("utf-8")).hexdigest()
+
+
+def _file_state(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def write_if_changed(path, content):
+    """Write a file only if its contents differ; returns True if it was written"""
+    data = content.encode("utf-8")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def build_docs(  # noqa: PLR0913
+    schema_path=SCHEMA_PATH,
+    docs_dir=DOCS_DIR,
+    manifest_path=MANIFEST_PATH,
+    force=False,
+    workers=None,
+):
+    """
+    Write the markdown page of each table and the table of contents, for the tables that changed.
+
+    Parameters
+    ----------
+    schema_path : str
+        Path to the Felis schema. Default: schema.yaml
+    docs_dir : str
+        Documentation directory. Default: docs/
+    manifest_path : str
+        File keeping the table hashes between runs. Default: .astrodb_cache/schema_docs.json
+    force : bool
+        Render every table, ignoring the hashes. Default: False
+    workers : int
+        Number of rendering processes. Default: None, uses the number of CPUs
+
+    Returns
+    -------
+    written : list of str
+        Paths of the files that were written
+    """
+    schema = read_schema_yaml(schema_path)
+    renderer = _renderer_hash()
+    manifest = {}
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    # Tables whose definition changed, or whose page is missing or was modified since the last run
+    pages, stale = {}, []
+    for table in schema["tables"]:
+        path = os.path.join(docs_dir, SCHEMA_SUB_DIR, f"{table['name']}.md")
+        pages[path] = table_hash(table, renderer)
+        entry = manifest.get(path)
+        if entry is None or entry["hash"] != pages[path] or entry["file"] != _file_state(path):
+            stale.append((path, table))
+
+    workers = workers or os.cpu_count() or 1
+    tables = [table for _, table in stale]
+    if workers == 1 or len(stale) < PARALLEL_MIN_TABLES:
+        rendered = list(map(render_table, tables))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(render_table, tables))
+
+    os.makedirs(os.path.join(docs_dir, SCHEMA_SUB_DIR), exist_ok=True)
+    written = [path for (path, _), content in zip(stale, rendered) if write_if_changed(path, content)]
+
+    # Make a table of contents-type file
+    toc_path = os.path.join(docs_dir, SCHEMA_TOC_NAME)
+    if write_if_changed(toc_path, render_toc([table["name"] for table in schema["tables"]], docs_dir)):
+        written.append(toc_path)
 
-# Loop over each table in the schema
-with open(SCHEMA_PATH, "r") as schema_file:
-    schema = yaml.safe_load(schema_file)
+    manifest = {path: {"hash": pages[path], "file": _file_state(path)} for path in pages}
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return written
 
-    for table in schema["tables"]:
-        table_name = table["name"]
-        table_path = os.path.join(DOCS_DIR, SCHEMA_SUB_DIR, f"{table_name}.md")
 
-        table_primary_key_list = table.get("primaryKey")
-        table_primary_key_list = [
-            key.replace(f"#{table_name}.", "") for key in table_primary_key_list
-        ]
+def main():
+    parser = argparse.ArgumentParser(description="Build the markdown documentation of the schema.")
+    parser.add_argument("--force", action="store_true", help="Render every table, even if unchanged")
+    parser.add_argument("--workers", type=int, help="Number of rendering processes (default: number of CPUs)")
+    args = parser.parse_args()
 
-        # Prepare a markdown file per table
-        with open(table_path, "w") as out_file:
-            out_file.write(f"# {table_name}\n")
-            out_file.write(f"{table['description']}\n")
-            out_file.write(
-                "\n\nColumns marked with an exclamation mark (❗️) may not be empty.\n"
-            )
-            out_file.write(
-                "| Column Name | Description | Datatype | Length | Units  | UCD |\n"
-            )
-            out_file.write("| --- | --- | --- | --- | --- | --- |\n")
-
-            # Loop over column names to get the column information
-            for column in table["columns"]:
-                # Get the unit from the fits or ivoa tags
-                units = column.get("fits:tunit", "")
-                if units == "":
-                    units = column.get("ivoa:unit", "")
-
-                # If the column is a primary key, underline the name
-                if column["name"] in table_primary_key_list:
-                    column_name = f"<ins>{column['name']}</ins>"
-                else:
-                    column_name = column["name"]
-
-                # If the column is required, add an exclamation mark to the name
-                if column.get("nullable", "True") is False:
-                    column_name = f"❗️ {column_name}"
-                else:
-                    column_name = column["name"]
-
-                # Write out the column
-                out_file.write(
-                    f"| {column_name} | {column['description']} | {column['datatype']} | {column.get('length', '')} | {units} | {column.get('ivoa:ucd', '')}  |\n"
-                )
-            out_file.write("\n")
-
-            #  Make the indexes table
-            if "indexes" in table:
-                out_file.write("## Indexes\n")
-                out_file.write("| Name | Columns | Description |\n")
-                out_file.write("| --- | --- | --- |\n")
-                for index in table["indexes"]:
-                    out_file.write(
-                        f"| {index['name']} | {index['columns']} | {index.get('description', '')} |\n"
-                    )
-                out_file.write("\n")
-
-            #  Make the constraints table
-            foreign_keys_exists = False
-            checks_exists = False
-            if "constraints" in table:
-
-                # Do Foreign Keys
-                foreign_key_table = "## Foreign Keys\n"
-                foreign_key_table += "| Description | Columns | Referenced Columns |\n"
-                foreign_key_table += "| --- | --- | --- |\n"
-
-                checks_table = "## Checks\n"
-                checks_table += "| Description | Expression |\n"
-                checks_table += "| --- | --- |\n"
-
-                for constraint in table["constraints"]:
-                    if constraint.get("@type") == "ForeignKey":
-                        foreign_keys_exists = True
-                        foreign_key_table += f"| {constraint['description']} | {constraint.get('columns', '')} | {constraint.get('referencedColumns', '')} |\n"
-                    elif constraint.get("@type") == "Check":
-                        checks_exists = True
-                        checks_table += f"| {constraint['description']} | {constraint.get('expression', '')} |\n"
-                    else:
-                        print(
-                            f"Unknown constraint type {constraint.get('@type')} in table {table_name}"
-                        )
-
-                if foreign_keys_exists:
-                    out_file.write(foreign_key_table)
-                if checks_exists:
-                    out_file.write(checks_table)
+    written = build_docs(force=args.force, workers=args.workers)
+    for path in written:
+        print(f"Wrote {path}")
+    return 0
 
-    # Make a table of contents-type file
-    with open(os.path.join(DOCS_DIR, SCHEMA_TOC_NAME), "w") as out_file:
-        out_file.write("# Schema Documentation\n")
-        out_file.write(
-            f"This documentation is generated from the [schema.yaml]({SCHEMA_PATH}) file using [build_schema_docs.py](scripts/build_schema_docs.py).\n"
-        )
-        out_file.write("\n## Tables\n")
-        for table in schema["tables"]:
-            table_name = table["name"]
-            table_path = os.path.join(SCHEMA_SUB_DIR, f"{table_name}.md")
-            out_file.write(f"- [{table_name}]({table_path})\n")
-        out_file.write("\n")
-
-        if os.path.exists(os.path.join(DOCS_DIR, SCHEMA_DIAGRAM)):
-            out_file.write(
-                "## Schema Diagram\n"
-                f"This diagram is generated from the [schema.yaml]({SCHEMA_PATH}) file using [make_schema_erd.py](scripts/make_schema_erd.py).\n"
-                f"![Schema Diagram]({SCHEMA_DIAGRAM})\n"
-            )
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# Helpers for on-disk caches derived from the database
+#
+# Caches live in a .astrodb_cache directory next to the SQLite file and are
+# keyed on a fingerprint of the database file, so any write to the database
+# invalidates them.
+
+import hashlib
+import os
+from urllib.parse import unquote
+
+__all__ = [
+    "CACHE_DIRECTORY",
+    "cache_path",
+    "database_file",
+    "database_fingerprint",
+]
+
+CACHE_DIRECTORY = ".astrodb_cache"
+
+
+def database_file(db):
+    """Path of the SQLite file behind a Database, or None for other backends or in-memory databases"""
+    url = db.engine.url
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    path = url.database
+    if path.startswith("file:"):  # SQLite URI, percent-encoded (see scripts.db_snapshot.sqlite_uri)
+        path = unquote(path[len("file:") :])
+    return path
+
+
+def database_fingerprint(db):
+    """
+    Fingerprint of the SQLite file behind a Database.
+
+    Built from the size and modification time of the database file (and its WAL
+    file, if any), so it changes whenever the database is written to.
+    Returns None when the database is not an SQLite file.
+    """
+    path = database_file(db)
+    if path is None or not os.path.exists(path):
+        return None
+
+    parts = [os.path.abspath(path)]
+    for file in (path, path + "-wal"):
+        if os.path.exists(file):
+            stat = os.stat(file)
+            parts += [str(stat.st_size), str(stat.st_mtime_ns)]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def cache_path(db, suffix, cache_dir=None):
+    """
+    Path of a cache file for a database, eg .astrodb_cache/astrodb-template.kdtree.pkl
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database the cache is derived from
+    suffix : str
+        Suffix identifying the cache, eg kdtree.pkl
+    cache_dir : str
+        Directory for the cache. Default: .astrodb_cache next to the database file
+    """
+    path = database_file(db)
+    if path is None:
+        return None
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path), CACHE_DIRECTORY)
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}.{suffix}")
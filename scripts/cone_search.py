@@ -0,0 +1,237 @@
+# Indexed cone search and cross-match against Sources and Positions
+#
+# Both tables carry a (dec_deg, ra_deg) index declared in schema.yaml
+# (IDX_Sources_dec_deg_ra_deg, IDX_Positions_dec_deg_ra_deg), which SQLite and
+# Postgres maintain on every insert. A cone search selects the
+# declination strip and the right ascension range around the target (split in
+# two at RA=0/360) through that index, and computes exact separations only for
+# the few candidate rows. This is the "zones" approach of Gray et al. (2007),
+# using the index itself instead of a separate pixel column.
+#
+# `crossmatch` joins the search windows of a whole catalog (a VALUES list) with
+# the table in one query, so each catalog row is one index lookup of that query
+# rather than a query of its own. For large catalogs, `scripts.batch_crossmatch`
+# matches against an in-memory KD-tree instead.
+#
+# Usage:
+#     from scripts.cone_search import cone_search, crossmatch
+#     t = cone_search(db, 92.6442, -21.8646, 10 * u.arcsec)
+
+import numpy as np
+from astropy import units as u
+from astropy.table import Table as AstropyTable
+from sqlalchemy import Float, Integer, and_, between, column, or_, select, values
+
+__all__ = [
+    "cone_search",
+    "crossmatch",
+]
+
+RA_COLUMN = "ra_deg"
+DEC_COLUMN = "dec_deg"
+WINDOWS_PER_QUERY = 2000  # search windows per crossmatch query, 5 bound parameters each
+
+
+def _degrees(value, unit=u.deg):
+    if isinstance(value, u.Quantity):
+        return value.to_value(u.deg)
+    return (value * unit).to_value(u.deg)
+
+
+def _search_ranges(ra, dec, radius):
+    """
+    Declination range and right ascension ranges, in degrees, containing a cone.
+
+    The right ascension half-width follows Gray et al. (2007). When the cone
+    contains a pole the whole right ascension range is returned.
+    """
+    dec_min = max(dec - radius, -90.0)
+    dec_max = min(dec + radius, 90.0)
+    r, d = np.radians(radius), np.radians(dec)
+    # Zero at a pole, and the half-width tends to 90 degrees as the cone gets close to one
+    cos_product = np.cos(d - r) * np.cos(d + r)
+    if dec_min == -90.0 or dec_max == 90.0 or cos_product <= 0.0:
+        return (dec_min, dec_max), [(0.0, 360.0)]
+
+    alpha = np.degrees(np.arctan(np.sin(r) / np.sqrt(cos_product)))
+
+    ra_min, ra_max = ra - alpha, ra + alpha
+    if ra_min < 0.0:
+        return (dec_min, dec_max), [(ra_min + 360.0, 360.0), (0.0, ra_max)]
+    if ra_max > 360.0:
+        return (dec_min, dec_max), [(ra_min, 360.0), (0.0, ra_max - 360.0)]
+    return (dec_min, dec_max), [(ra_min, ra_max)]
+
+
+def _separation(ra1, dec1, ra2, dec2):
+    """Angular separation in degrees (haversine formula, all inputs in degrees)"""
+    ra1, dec1, ra2, dec2 = map(np.radians, (ra1, dec1, ra2, dec2))
+    h = np.sin((dec2 - dec1) / 2) ** 2 + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(h, 0, 1))))
+
+
+def _cone_query(table, ra, dec, radius):
+    (dec_min, dec_max), ra_ranges = _search_ranges(ra, dec, radius)
+    ra_column, dec_column = table.columns[RA_COLUMN], table.columns[DEC_COLUMN]
+    return select(table).where(
+        and_(
+            between(dec_column, dec_min, dec_max),
+            or_(*[between(ra_column, low, high) for low, high in ra_ranges]),
+        )
+    )
+
+
+def _matches(conn, table, ra, dec, radius):
+    """Rows of table within radius (degrees) of ra, dec and their separations in degrees"""
+    rows = conn.execute(_cone_query(table, ra, dec, radius)).all()
+    if len(rows) == 0:
+        return [], np.array([])
+
+    ra_values = np.array([row._mapping[RA_COLUMN] for row in rows], dtype=float)
+    dec_values = np.array([row._mapping[DEC_COLUMN] for row in rows], dtype=float)
+    separations = _separation(ra, dec, ra_values, dec_values)
+
+    keep = np.flatnonzero(separations <= radius)
+    keep = keep[np.argsort(separations[keep], kind="stable")]
+    return [rows[i] for i in keep], separations[keep]
+
+
+def cone_search(db, ra, dec, radius=10 * u.arcsec, table="Sources", fmt="table"):
+    """
+    Return the rows of a table within a radius of a position, closest first.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to search
+    ra, dec : float or Quantity
+        Position to search around. Floats are in degrees.
+    radius : float or Quantity
+        Search radius. Floats are in arcseconds, as in `Database.query_region`. Default: 10 arcsec
+    table : str
+        Table with ra_deg and dec_deg columns to search (eg, Sources or Positions). Default: Sources
+    fmt : str
+        Format to return results in (pandas, astropy/table, default). Default is astropy table
+
+    Returns
+    -------
+    results
+        Matching rows with an additional separation_arcsec column
+        (for the default format, a list of (row, separation in arcsec) tuples)
+    """
+    if table not in db.metadata.tables:
+        raise RuntimeError(f"Table {table} is not in the database")
+
+    ra, dec = _degrees(ra), _degrees(dec)
+    radius = _degrees(radius, unit=u.arcsec)
+
+    with db.engine.connect() as conn:
+        rows, separations = _matches(conn, db.metadata.tables[table], ra, dec, radius)
+    separations = separations * 3600.0
+
+    if fmt.lower() not in ("astropy", "table", "pandas"):
+        return list(zip(rows, separations))
+
+    results = db._handle_format(rows, "astropy")
+    if len(rows) == 0:
+        results = AstropyTable(names=db.metadata.tables[table].columns.keys() + ["separation_arcsec"])
+    else:
+        results["separation_arcsec"] = separations
+    if fmt.lower() == "pandas":
+        return results.to_pandas()
+    return results
+
+
+def _windows_query(table, key, windows):
+    """Rows of table within the (catalog_index, dec_min, dec_max, ra_min, ra_max) windows, in one join"""
+    window = values(
+        column("catalog_index", Integer),
+        column("dec_min", Float),
+        column("dec_max", Float),
+        column("ra_min", Float),
+        column("ra_max", Float),
+        name="windows",
+    ).data(windows).cte()  # WITH windows(...) AS (VALUES ...), which SQLite accepts unlike a VALUES subquery
+    ra_column, dec_column = table.columns[RA_COLUMN], table.columns[DEC_COLUMN]
+    return select(window.c.catalog_index, table.columns[key], ra_column, dec_column).join_from(
+        window,
+        table,
+        and_(
+            between(dec_column, window.c.dec_min, window.c.dec_max),
+            between(ra_column, window.c.ra_min, window.c.ra_max),
+        ),
+    )
+
+
+def crossmatch(db, catalog, radius=1 * u.arcsec, table="Sources", ra_col="ra", dec_col="dec", nearest=False):
+    """
+    Cross-match a catalog of positions against a table, joining the search windows of all rows in one query.
+
+    Each catalog row is matched through the (dec_deg, ra_deg) index, so this suits
+    catalogs up to a few thousand rows (one query per 2000 rows); for larger ones
+    see `scripts.batch_crossmatch.batch_crossmatch`.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to match against
+    catalog : astropy.table.Table, pandas.DataFrame, dict, or SkyCoord
+        Positions to match, in degrees, with columns named by ra_col and dec_col
+    radius : float or Quantity
+        Match radius. Floats are in arcseconds. Default: 1 arcsec
+    table : str
+        Table with ra_deg and dec_deg columns to match against. Default: Sources
+    ra_col, dec_col : str
+        Names of the catalog position columns. Default: ra, dec
+    nearest : bool
+        Only keep the closest match for each catalog row. Default: False
+
+    Returns
+    -------
+    matches : astropy.table.Table
+        One row per match with the catalog row index (catalog_index), the matched
+        source, its ra_deg and dec_deg, and the separation in arcsec
+    """
+    if table not in db.metadata.tables:
+        raise RuntimeError(f"Table {table} is not in the database")
+
+    if hasattr(catalog, "ra") and hasattr(catalog, "dec") and hasattr(catalog, "frame"):
+        ra_values, dec_values = catalog.icrs.ra.deg, catalog.icrs.dec.deg
+    else:
+        ra_values = np.atleast_1d(np.asarray(catalog[ra_col], dtype=float))
+        dec_values = np.atleast_1d(np.asarray(catalog[dec_col], dtype=float))
+    radius = _degrees(radius, unit=u.arcsec)
+
+    sql_table = db.metadata.tables[table]
+    key = db._primary_table_key if table == db._primary_table else db._foreign_key
+
+    # Search windows of every catalog row: two when the cone crosses RA=0/360
+    windows = []
+    for i, (ra, dec) in enumerate(zip(ra_values, dec_values)):
+        if not (np.isfinite(ra) and np.isfinite(dec)):
+            continue
+        (dec_min, dec_max), ra_ranges = _search_ranges(float(ra), float(dec), radius)
+        windows += [(i, dec_min, dec_max, ra_min, ra_max) for ra_min, ra_max in ra_ranges]
+
+    rows = []
+    with db.engine.connect() as conn:
+        for start in range(0, len(windows), WINDOWS_PER_QUERY):
+            chunk = windows[start : start + WINDOWS_PER_QUERY]
+            rows += conn.execute(_windows_query(sql_table, key, chunk)).all()
+
+    index = np.array([row[0] for row in rows], dtype=int)
+    ras = np.array([row[2] for row in rows], dtype=float)
+    decs = np.array([row[3] for row in rows], dtype=float)
+    separations = _separation(ra_values[index], dec_values[index], ras, decs)
+
+    # Closest first within each catalog row
+    keep = np.flatnonzero(separations <= radius)
+    keep = keep[np.lexsort((separations[keep], index[keep]))]
+    if nearest:
+        keep = keep[np.unique(index[keep], return_index=True)[1]]
+
+    return AstropyTable(
+        [index[keep], [rows[i][1] for i in keep], ras[keep], decs[keep], separations[keep] * 3600.0],
+        names=["catalog_index", key, RA_COLUMN, DEC_COLUMN, "separation_arcsec"],
+        dtype=[int, str, float, float, float],
+    )
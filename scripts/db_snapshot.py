@@ -0,0 +1,253 @@
+# Cached snapshots of the database built from the JSON files
+#
+# The database is built once and kept in .astrodb_cache/snapshots, under a key
+# hashed from schema.yaml, the lookup table names, and every JSON file of the
+# data directory. The per-file hashes come from the manifest of
+# scripts/incremental_build.py, stored next to the snapshot, so unchanged files
+# are only stat'ed. When nothing changed, restoring the database is a file copy.
+# `memory_copy` loads a snapshot into an independent in-memory database with the
+# SQLite backup API, for code that writes without touching the snapshot (eg, tests).
+#
+# Usage:
+#     python scripts/db_snapshot.py [database.toml] [--cache-dir DIR]
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import uuid
+from urllib.parse import quote, urlencode
+
+from astrodbkit.astrodb import Database
+from sqlalchemy import event
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.adopted import create_adopted_indexes  # noqa: E402
+from scripts.cache_utils import CACHE_DIRECTORY  # noqa: E402
+from scripts.incremental_build import _read_manifest, _write_manifest, build_manifest  # noqa: E402
+from scripts.json_loader import read_settings  # noqa: E402
+from scripts.schema_cache import create_schema_tables  # noqa: E402
+
+__all__ = [
+    "SNAPSHOT_DIRECTORY",
+    "build_snapshot",
+    "memory_copy",
+    "read_only_database",
+    "restore_snapshot",
+    "snapshot_key",
+    "sqlite_uri",
+    "sqlite_url",
+]
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIRECTORY = os.path.join(CACHE_DIRECTORY, "snapshots")
+SNAPSHOT_VERSION = 2  # bump when the way snapshots are built changes
+
+
+def snapshot_key(manifest, lookup_tables):
+    """Short hash identifying the schema, lookup tables, and data files of a manifest"""
+    content = {
+        "version": SNAPSHOT_VERSION,
+        "lookup_tables": sorted(lookup_tables),
+        "schema": manifest["schema"]["sha256"],
+        "reference": {table: entry["sha256"] for table, entry in manifest["reference"].items()},
+        "source": {file: entry["sha256"] for file, entry in manifest["source"].items()},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def build_snapshot(  # noqa: PLR0913
+    settings_file="database.toml",
+    *,
+    base_path=".",
+    db_name=None,
+    felis_path=None,
+    data_path=None,
+    lookup_tables=None,
+    cache_dir=SNAPSHOT_DIRECTORY,
+):
+    """
+    Path of the snapshot for the current schema and data, building it if needed.
+
+    The database is loaded with astrodbkit, as in `astrodb_utils.build_db_from_json`,
+    with the partial indexes of `scripts.adopted.create_adopted_indexes`,
+    into a temporary file that is renamed once complete, so a snapshot is never
+    seen half-written.
+    Older snapshots of the same database are removed.
+
+    Parameters
+    ----------
+    settings_file, base_path, db_name, felis_path, data_path, lookup_tables
+        Database settings, see `scripts.json_loader.build_db_parallel`
+    cache_dir : str
+        Directory of the snapshots. Default: .astrodb_cache/snapshots
+
+    Returns
+    -------
+    path : str
+        Path of the snapshot, eg .astrodb_cache/snapshots/astrodb-template.<key>.sqlite
+    """
+    db_settings = read_settings(settings_file, base_path, db_name, felis_path, data_path, lookup_tables)
+    stem = os.path.basename(db_settings.db_name)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    manifest_file = os.path.join(cache_dir, f"{stem}.manifest.json")
+    manifest = build_manifest(db_settings, previous=_read_manifest(manifest_file))
+    _write_manifest(manifest_file, manifest)
+
+    path = os.path.join(cache_dir, f"{stem}.{snapshot_key(manifest, db_settings.lookup_tables)}.sqlite")
+    if os.path.exists(path):
+        logger.info(f"Reusing database snapshot {path}")
+        return path
+
+    logger.info(f"Building database snapshot {path}")
+    tmp_file = os.path.join(cache_dir, f"{stem}.{uuid.uuid4().hex}.tmp")
+    create_schema_tables("sqlite:///" + tmp_file, db_settings.felis_path)
+    db = Database("sqlite:///" + tmp_file, lookup_tables=db_settings.lookup_tables)
+    db.load_database(db_settings.data_path)
+    create_adopted_indexes(db, felis_path=db_settings.felis_path)
+    db.engine.dispose()
+    os.replace(tmp_file, path)
+
+    for old in glob.glob(os.path.join(cache_dir, f"{glob.escape(stem)}.*.sqlite")):
+        if old != path:
+            os.remove(old)
+    return path
+
+
+def restore_snapshot(snapshot, db_file, lookup_tables=None):
+    """
+    Copy a snapshot to a database file and connect to it.
+
+    The modification time of the snapshot is kept, so caches fingerprinted on the
+    database file (see scripts/cache_utils.py) stay valid from one restore to the next.
+
+    Parameters
+    ----------
+    snapshot : str
+        Path of the snapshot, see `build_snapshot`
+    db_file : str
+        Path of the database file to write, eg astrodb-template.sqlite
+    lookup_tables : list
+        Lookup tables of the database. Default: None, reads from database.toml
+
+    Returns
+    -------
+    db : astrodbkit.astrodb.Database
+        Database connected to db_file
+    """
+    if lookup_tables is None:
+        lookup_tables = read_settings().lookup_tables
+    tmp_file = f"{db_file}.{uuid.uuid4().hex}.tmp"
+    shutil.copy2(snapshot, tmp_file)
+    os.replace(tmp_file, db_file)
+    return Database("sqlite:///" + db_file, lookup_tables=lookup_tables)
+
+
+def sqlite_uri(db_file, **parameters):
+    """SQLite URI of a database file, with the path percent-encoded, eg file:astrodb-template.sqlite?mode=ro"""
+    uri = "file:" + quote(os.fspath(db_file).replace(os.sep, "/"))
+    return f"{uri}?{urlencode(parameters)}" if parameters else uri
+
+
+def sqlite_url(uri):
+    """SQLAlchemy URL of an SQLite URI; SQLAlchemy unquotes the database part once, so it is quoted again"""
+    path, _, query = uri.partition("?")
+    return f"sqlite:///{quote(path, safe=':/')}?{query + '&' if query else ''}uri=true"
+
+
+def read_only_database(db_file, lookup_tables=None):
+    """
+    Read-only connection to a database file that does not change while it is open.
+
+    The file is opened with the mode=ro&immutable=1 URI parameters: SQLite takes
+    no locks and never checks for changes, so any number of processes can read
+    it concurrently (eg, pytest-xdist workers). Writes fail with "attempt to
+    write a readonly database".
+
+    Parameters
+    ----------
+    db_file : str
+        Path of the SQLite database file, eg astrodb-template.sqlite
+    lookup_tables : list
+        Lookup tables of the database. Default: None, reads from database.toml
+
+    Returns
+    -------
+    db : astrodbkit.astrodb.Database
+    """
+    if lookup_tables is None:
+        lookup_tables = read_settings().lookup_tables
+    return Database(sqlite_url(sqlite_uri(db_file, mode="ro", immutable=1)), lookup_tables=lookup_tables)
+
+
+def memory_copy(snapshot, lookup_tables=None):
+    """
+    Independent in-memory copy of a snapshot, made with the SQLite backup API.
+
+    Writes to the copy never reach the snapshot and the copy is discarded when
+    its engine is disposed (db.engine.dispose()).
+
+    Parameters
+    ----------
+    snapshot : str
+        Path of the snapshot (or of any SQLite database file)
+    lookup_tables : list
+        Lookup tables of the database. Default: None, reads from database.toml
+
+    Returns
+    -------
+    db : astrodbkit.astrodb.Database
+        Database connected to the in-memory copy
+    """
+    if lookup_tables is None:
+        lookup_tables = read_settings().lookup_tables
+
+    # A named, shared-cache memory database lives as long as one connection to it is open
+    name = f"astrodb_copy_{uuid.uuid4().hex}"
+    keeper = sqlite3.connect(f"file:{name}?mode=memory&cache=shared", uri=True, check_same_thread=False)
+    source = sqlite3.connect(sqlite_uri(snapshot, mode="ro"), uri=True)
+    try:
+        source.backup(keeper)
+    finally:
+        source.close()
+
+    db = Database(f"sqlite:///file:{name}?mode=memory&cache=shared&uri=true", lookup_tables=lookup_tables)
+    event.listen(db.engine, "engine_disposed", lambda engine: keeper.close())
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Restore the database from a cached snapshot, building the snapshot only if the data changed."
+    )
+    parser.add_argument(
+        "settings_file",
+        nargs="?",
+        default="database.toml",
+        help="Name of the TOML file containing database settings (default: database.toml)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=SNAPSHOT_DIRECTORY,
+        help=f"Directory of the snapshots (default: {SNAPSHOT_DIRECTORY})",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db_settings = read_settings(args.settings_file)
+    snapshot = build_snapshot(args.settings_file, cache_dir=args.cache_dir)
+    db = restore_snapshot(snapshot, db_settings.db_name + ".sqlite", lookup_tables=db_settings.lookup_tables)
+    logger.info(f"Restored {db_settings.db_name}.sqlite from {snapshot}")
+    db.engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+# Save only the JSON files touched during a session
+#
+# `track_changes(db)` installs temporary SQLite triggers on every connection of
+# the database engine. Inserts, updates, and deletes on tables that reference
+# Sources.source record the source name, and changes to lookup tables record
+# the table name. `save_database` then rewrites only those source JSON files
+# and lookup tables instead of re-serializing the whole database.
+# Sources are saved to their conventional file name (`source_filename`).
+# Sources created during the session get that file name directly; only an
+# existing source without a file of that name (eg, a hand-written JSON file)
+# makes the tracker parse the source directory once, to find its file. That
+# name-to-file index is then kept up to date as files are written.
+#
+# Usage (eg, at the end of an ingest script):
+#     tracker = track_changes(db)
+#     ...  # ingest_source, ingest_names, direct inserts, etc.
+#     tracker.save_database("data/")
+
+import json
+import logging
+import os
+
+from sqlalchemy import event
+
+__all__ = [
+    "ChangeTracker",
+    "source_filename",
+    "track_changes",
+]
+
+logger = logging.getLogger(__name__)
+
+MARK_SOURCE_FUNCTION = "_astrodb_mark_source"
+MARK_TABLE_FUNCTION = "_astrodb_mark_table"
+MARK_CREATED_FUNCTION = "_astrodb_mark_created"
+MARK_DELETED_FUNCTION = "_astrodb_mark_deleted"
+TRIGGER_PREFIX = "_astrodb_dirty"
+
+
+def source_filename(source_name):
+    """JSON file name used by astrodbkit's save_json for a source"""
+    return source_name.lower().replace(" ", "_").replace("*", "").strip() + ".json"
+
+
+class ChangeTracker:
+    """
+    Record the sources and lookup tables modified through a database engine.
+
+    Only SQLite databases are supported, as the triggers call Python functions
+    registered on each connection. Changes that are rolled back are still
+    recorded; saving them again simply rewrites the unchanged files.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to track
+    """
+
+    def __init__(self, db):
+        if db.engine.dialect.name != "sqlite":
+            raise RuntimeError("Change tracking is only available for SQLite databases")
+
+        self.db = db
+        self.sources = set()
+        self.lookup_tables = set()
+        # Names added to or removed from the primary table (eg, Sources) during the session
+        self.created = set()
+        self.deleted = set()
+        self._file_index = None  # source directory and the file of each source in it, once parsed
+
+        event.listen(db.engine, "connect", self._install)
+
+        # Connections opened before tracking started do not have the triggers
+        db.session.close()
+        db.engine.dispose()
+
+    def _trigger_statements(self):
+        db = self.db
+        statements = []
+        for table in db.metadata.sorted_tables:
+            if table.name in db._lookup_tables:
+                call = f"SELECT {MARK_TABLE_FUNCTION}('{table.name}');"
+                bodies = {"INSERT": call, "UPDATE": call, "DELETE": call}
+            else:
+                if table.name == db._primary_table:
+                    key = db._primary_table_key
+                elif db._foreign_key in table.columns:
+                    key = db._foreign_key
+                else:
+                    continue
+                new = f'SELECT {MARK_SOURCE_FUNCTION}(NEW."{key}");'
+                old = f'SELECT {MARK_SOURCE_FUNCTION}(OLD."{key}");'
+                bodies = {"INSERT": new, "UPDATE": old + " " + new, "DELETE": old}
+                if table.name == db._primary_table:
+                    renamed = f'WHERE NEW."{key}" IS NOT OLD."{key}";'
+                    bodies["INSERT"] += f' SELECT {MARK_CREATED_FUNCTION}(NEW."{key}");'
+                    bodies["UPDATE"] += (
+                        f' SELECT {MARK_CREATED_FUNCTION}(NEW."{key}") {renamed}'
+                        f' SELECT {MARK_DELETED_FUNCTION}(OLD."{key}") {renamed}'
+                    )
+                    bodies["DELETE"] += f' SELECT {MARK_DELETED_FUNCTION}(OLD."{key}");'
+
+            for operation, body in bodies.items():
+                statements.append(
+                    f'CREATE TEMP TRIGGER IF NOT EXISTS "{TRIGGER_PREFIX}_{table.name}_{operation.lower()}" '
+                    f'AFTER {operation} ON main."{table.name}" BEGIN {body} END'
+                )
+        return statements
+
+    def _install(self, dbapi_connection, connection_record):
+        # pylint: disable=unused-argument
+        dbapi_connection.create_function(MARK_SOURCE_FUNCTION, 1, self.sources.add)
+        dbapi_connection.create_function(MARK_TABLE_FUNCTION, 1, self.lookup_tables.add)
+        dbapi_connection.create_function(MARK_CREATED_FUNCTION, 1, self.created.add)
+        dbapi_connection.create_function(MARK_DELETED_FUNCTION, 1, self.deleted.add)
+        cursor = dbapi_connection.cursor()
+        for statement in self._trigger_statements():
+            cursor.execute(statement)
+        cursor.close()
+
+    def stop(self):
+        """Stop recording changes on new connections"""
+        event.remove(self.db.engine, "connect", self._install)
+        self.db.session.close()
+        self.db.engine.dispose()
+
+    def _existing_sources(self, names):
+        table = self.db.metadata.tables[self.db._primary_table]
+        column = table.columns[self.db._primary_table_key]
+        existing = set()
+        names = sorted(names)
+        for i in range(0, len(names), 10000):
+            chunk = names[i : i + 10000]
+            existing.update(row[0] for row in self.db.query(column).filter(column.in_(chunk)).all())
+        return existing
+
+    def _files(self, directory):
+        """File of each source in directory, parsing every file the first time only"""
+        if self._file_index is None or self._file_index[0] != directory:
+            index = {}
+            for file in os.listdir(directory):
+                if not file.endswith(".json"):
+                    continue
+                with open(os.path.join(directory, file), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                index[data[self.db._primary_table][0][self.db._primary_table_key]] = file
+            self._file_index = (directory, index)
+        return self._file_index[1]
+
+    def _current_file(self, directory, name):
+        """Existing JSON file of a source, or None"""
+        filename = source_filename(name)
+        if os.path.exists(os.path.join(directory, filename)):
+            return filename
+        if self._file_index is None and name in self.created and name not in self.deleted:
+            return None  # created during the session: no file yet
+        # Not named after the source (eg, hand-written JSON)
+        return self._files(directory).get(name)
+
+    def save_database(self, directory: str, reference_directory: str = "reference", source_directory: str = "source"):
+        """
+        Write the JSON files of modified sources and lookup tables.
+
+        Sources that no longer exist have their JSON file removed.
+        Lookup tables that became empty have their JSON file removed.
+
+        Parameters
+        ----------
+        directory : str
+            Name of top-level directory in which to save the output JSON
+        reference_directory : str
+            Name of sub-directory to use for reference JSON files (eg, data/reference)
+        source_directory : str
+            Name of sub-directory to use for source JSON files (eg, data/source)
+        """
+        db = self.db
+
+        for table in sorted(self.lookup_tables):
+            path = os.path.join(directory, reference_directory, table + ".json")
+            db.save_reference_table(table, directory, reference_directory=reference_directory)
+            if db.query(db.metadata.tables[table]).count() == 0 and os.path.exists(path):
+                os.remove(path)
+
+        source_path = os.path.join(directory, source_directory)
+        if not os.path.isdir(source_path):
+            os.makedirs(source_path)
+
+        dirty = {name for name in self.sources if name is not None}
+        existing = self._existing_sources(dirty)
+
+        for name in sorted(dirty):
+            filename = source_filename(name)
+            current = self._current_file(source_path, name)
+            if current is not None and (current != filename or name not in existing):
+                os.remove(os.path.join(source_path, current))
+            if name in existing:
+                db.save_json(name, source_path)
+
+            if self._file_index is not None:
+                files = self._file_index[1]
+                if name in existing:
+                    files[name] = filename
+                else:
+                    files.pop(name, None)
+
+        logger.info(f"Saved {len(dirty)} source(s) and {len(self.lookup_tables)} lookup table(s) to {directory}")
+
+        self.sources.clear()
+        self.lookup_tables.clear()
+        self.created.clear()
+        self.deleted.clear()
+
+
+def track_changes(db):
+    """
+    Start recording which sources and lookup tables are modified.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        SQLite database to track
+
+    Returns
+    -------
+    tracker : ChangeTracker
+        Tracker whose `save_database` writes only the modified JSON files
+    """
+    return ChangeTracker(db)
@@ -0,0 +1,299 @@
+# Script to incrementally rebuild the SQLite database from the JSON files
+#
+# A manifest of per-file content hashes is kept next to the database file
+# (eg, astrodb-template.manifest.json). On each run only the sources whose
+# JSON files were added, changed, or removed are deleted and re-inserted.
+# A full rebuild happens when schema.yaml or any lookup table changes,
+# or when the database/manifest is missing.
+#
+# Usage:
+#     python scripts/incremental_build.py [database.toml] [--full]
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+
+from astrodbkit.astrodb import Database
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.adopted import create_adopted_indexes  # noqa: E402
+from scripts.json_loader import (  # noqa: E402
+    _parse_files,
+    _write_batch,
+    load_database_parallel,
+    read_settings,
+    reference_file,
+    source_files,
+)
+from scripts.schema_cache import create_schema_tables  # noqa: E402
+from scripts.units import store_parameter_units  # noqa: E402
+
+__all__ = [
+    "build_db_incremental",
+    "build_manifest",
+    "manifest_path",
+]
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+DELETE_CHUNK_SIZE = 10000  # keep IN (...) lists below the SQLite variable limit
+
+
+def manifest_path(db_file):
+    """Path of the manifest stored next to a database file"""
+    return os.path.splitext(db_file)[0] + ".manifest.json"
+
+
+def _file_hash(path, previous=None):
+    """
+    Return the content hash entry for a file.
+
+    Hashing is skipped when the size and modification time match the previous
+    entry, so unchanged trees can be checked with a single stat per file.
+    """
+    stat = os.stat(path)
+    if (
+        previous is not None
+        and previous.get("size") == stat.st_size
+        and previous.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        return dict(previous)
+
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_manifest(db_settings, previous=None):
+    """
+    Hash the schema, lookup tables, and source files described by the database settings.
+
+    Parameters
+    ----------
+    db_settings : astrodb_utils.loaders.DatabaseSettings
+        Settings read from the TOML file, see `scripts.json_loader.read_settings`
+    previous : dict
+        Previously stored manifest, used to skip re-hashing unchanged files. Default: None
+
+    Returns
+    -------
+    manifest : dict
+        Dictionary with the schema hash and per-file hashes for lookup and source files
+    """
+    previous = previous or {}
+    previous_reference = previous.get("reference", {})
+    previous_source = previous.get("source", {})
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "schema": _file_hash(db_settings.felis_path, previous.get("schema")),
+        "reference": {},
+        "source": {},
+    }
+
+    for table in db_settings.lookup_tables:
+        path = reference_file(db_settings.data_path, table)
+        if os.path.exists(path):
+            manifest["reference"][table] = _file_hash(path, previous_reference.get(table))
+
+    directory, files = source_files(db_settings.data_path, db_settings.lookup_tables)
+    for file in files:
+        entry = _file_hash(os.path.join(directory, file), previous_source.get(file))
+        manifest["source"][file] = entry
+
+    return manifest
+
+
+def _full_build(db_settings, db_file):
+    """Create a new database file and load every JSON file. Returns the database and the source name of each file."""
+    if os.path.exists(db_file):
+        os.remove(db_file)
+        logger.info(f"Removed old database file {db_file}.")
+
+    db_connection_string = "sqlite:///" + db_file
+    create_schema_tables(db_connection_string, db_settings.felis_path)
+    db = Database(db_connection_string, lookup_tables=db_settings.lookup_tables)
+    sources = load_database_parallel(db, db_settings.data_path, bulk=True)
+    create_adopted_indexes(db, felis_path=db_settings.felis_path)
+    store_parameter_units(db)
+    return db, sources
+
+
+def _read_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def _write_manifest(path, manifest):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(manifest, indent=4, sort_keys=True))
+
+
+def _needs_full_rebuild(old, new):
+    if old is None:
+        return "no previous manifest"
+    if old["schema"]["sha256"] != new["schema"]["sha256"]:
+        return "schema changed"
+
+    old_reference = {k: v["sha256"] for k, v in old["reference"].items()}
+    new_reference = {k: v["sha256"] for k, v in new["reference"].items()}
+    if old_reference != new_reference:
+        return "lookup tables changed"
+
+    return None
+
+
+def _delete_sources(db, source_names):
+    """Delete every row belonging to the given sources, children before Sources"""
+    if len(source_names) == 0:
+        return
+
+    with db.engine.begin() as conn:
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name in db._lookup_tables:
+                continue
+            if table.name == db._primary_table:
+                column = table.columns[db._primary_table_key]
+            elif db._foreign_key in table.columns:
+                column = table.columns[db._foreign_key]
+            else:
+                continue
+            for i in range(0, len(source_names), DELETE_CHUNK_SIZE):
+                chunk = source_names[i : i + DELETE_CHUNK_SIZE]
+                conn.execute(table.delete().where(column.in_(chunk)))
+
+
+def build_db_incremental(  # noqa: PLR0913
+    settings_file: str = "database.toml",
+    *,
+    base_path: str = ".",
+    db_name: str = None,
+    felis_path: str = None,
+    data_path: str = None,
+    lookup_tables: list = None,
+    full: bool = False,
+):
+    """
+    Build or update an SQLite database from JSON files, reloading only changed sources.
+
+    Takes the same settings as `astrodb_utils.build_db_from_json`, with explicit
+    arguments taking precedence over the TOML file. Falls back to
+    a full rebuild when the schema or any lookup table changed, or if the
+    database file or its manifest is missing.
+
+    Parameters
+    ----------
+    settings_file : str
+        Name of the TOML file containing the database settings. Default: database.toml
+    base_path : str
+        Path to the directory containing the TOML file. Default: current directory
+    db_name : str
+        Name of the database file (without .sqlite extension). Default: None, reads from TOML file
+    felis_path : str
+        Path to the Felis schema file. Default: None, reads from TOML file
+    data_path : str
+        Path to the data directory containing the JSON files. Default: None, reads from TOML file
+    lookup_tables : list
+        List of tables to consider as lookup tables. Default: None, reads from TOML file
+    full : bool
+        Force a full rebuild. Default: False
+
+    Returns
+    -------
+    db : astrodbkit.astrodb.Database
+        Astrodbkit Database object
+    """
+
+    db_settings = read_settings(settings_file, base_path, db_name, felis_path, data_path, lookup_tables)
+    db_file = db_settings.db_name + ".sqlite"
+    manifest_file = manifest_path(db_file)
+
+    old_manifest = _read_manifest(manifest_file) if os.path.exists(db_file) else None
+    new_manifest = build_manifest(db_settings, previous=old_manifest)
+
+    reason = "requested" if full else _needs_full_rebuild(old_manifest, new_manifest)
+
+    # Remove the manifest while the database is being modified so that an
+    # interrupted build always falls back to a full rebuild next time
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+    if reason is not None:
+        logger.info(f"Full rebuild of {db_file}: {reason}")
+        db, sources = _full_build(db_settings, db_file)
+        # The source name is stored so rows can be removed once the file is gone
+        for file, entry in new_manifest["source"].items():
+            entry["source"] = sources[file]
+        _write_manifest(manifest_file, new_manifest)
+        return db
+
+    db = Database("sqlite:///" + db_file, lookup_tables=db_settings.lookup_tables)
+    directory, _ = source_files(db_settings.data_path, db_settings.lookup_tables)
+
+    old_sources = old_manifest["source"]
+    new_sources = new_manifest["source"]
+    removed = sorted(set(old_sources) - set(new_sources))
+    added = sorted(set(new_sources) - set(old_sources))
+    changed = sorted(
+        file
+        for file in set(old_sources) & set(new_sources)
+        if old_sources[file]["sha256"] != new_sources[file]["sha256"]
+    )
+
+    for file in set(new_sources) - set(added) - set(changed):
+        new_sources[file]["source"] = old_sources[file]["source"]
+
+    logger.info(
+        f"Incremental update of {db_file}: "
+        f"{len(added)} added, {len(changed)} changed, {len(removed)} removed"
+    )
+
+    # Delete everything from the old versions of changed/removed files first
+    # so that sources can move between files
+    _delete_sources(db, [old_sources[file]["source"] for file in removed + changed])
+
+    files = added + changed
+    parsed = list(_parse_files(db, [os.path.join(directory, file) for file in files], workers=1))
+    with db.engine.begin() as conn:
+        _write_batch(db, conn, parsed)
+    for file, data in zip(files, parsed):
+        new_sources[file]["source"] = data[db._primary_table][0][db._primary_table_key]
+
+    store_parameter_units(db)
+    _write_manifest(manifest_file, new_manifest)
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Incrementally rebuild an SQLite database from JSON files using a TOML configuration."
+    )
+    parser.add_argument(
+        "settings_file",
+        nargs="?",
+        default="database.toml",
+        help="Name of the TOML file containing database settings (default: database.toml)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Force a full rebuild even if the manifest is up to date",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_db_incremental(args.settings_file, full=args.full)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# Report foreign keys without a supporting index
+#
+# The indexes on foreign keys are declared in schema.yaml (the `indexes` of each
+# table), so they are built by both the SQLite and the PostgreSQL builds; the
+# only other indexes are the partial indexes on adopted rows, which Felis cannot
+# declare and which every build creates with `scripts.adopted`. A foreign
+# key is covered when the primary key or an index starts with its columns (in
+# any order); otherwise deleting a referenced row, or filtering on the key (eg,
+# every "by reference" query), scans the whole table. This script lists the
+# foreign keys of the schema and the index covering each, can print the YAML of
+# the missing indexes, and shows the query plan (EXPLAIN QUERY PLAN on SQLite,
+# EXPLAIN on PostgreSQL) of a lookup on each foreign key in a database.
+#
+# Usage:
+#     python scripts/index_report.py [--felis-path schema.yaml] [--suggest] [--plans] [--db-name NAME]
+
+import argparse
+import logging
+import sys
+
+from astrodb_utils import read_db_from_file
+from astropy.table import Table as AstropyTable
+from sqlalchemy import and_, select
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.schema_cache import load_schema  # noqa: E402
+
+__all__ = [
+    "foreign_key_indexes",
+    "query_plans",
+    "suggested_indexes",
+    "unindexed_foreign_keys",
+]
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_KEY = "primary key"
+
+
+def _column_name(column_id):
+    return column_id.split(".", 1)[1]
+
+
+def _indexes(table):
+    """(name, column names) of the primary key and the declared indexes of a Felis table"""
+    indexes = [(PRIMARY_KEY, [_column_name(column) for column in table.primary_key or []])]
+    indexes += [(index.name, [_column_name(column) for column in index.columns or []]) for index in table.indexes]
+    return indexes
+
+
+def foreign_key_indexes(felis_path="schema.yaml"):
+    """
+    Foreign keys of a Felis schema and the index covering each.
+
+    Parameters
+    ----------
+    felis_path : str
+        Path to the Felis schema. Default: schema.yaml
+
+    Returns
+    -------
+    report : astropy.table.Table
+        Table, constraint name, columns (comma-separated), referenced table, and
+        the covering index ("primary key", an index name, or "" when unindexed)
+    """
+    rows = []
+    for table in load_schema(felis_path).tables:
+        indexes = _indexes(table)
+        for constraint in table.constraints:
+            if constraint.type != "ForeignKey":
+                continue
+            columns = [_column_name(column) for column in constraint.columns]
+            referenced = constraint.referenced_columns[0].lstrip("#").split(".", 1)[0]
+            covering = [name for name, index in indexes if set(index[: len(columns)]) == set(columns)]
+            rows.append((table.name, constraint.name, ",".join(columns), referenced, covering[0] if covering else ""))
+    return AstropyTable(
+        rows=rows,
+        names=["table", "constraint", "columns", "referenced_table", "index"],
+        dtype=[str, str, str, str, str],
+    )
+
+
+def unindexed_foreign_keys(felis_path="schema.yaml"):
+    """Rows of `foreign_key_indexes` without a covering index"""
+    report = foreign_key_indexes(felis_path)
+    return report[report["index"] == ""]
+
+
+def _index_yaml(table, columns, description):
+    name = f"IDX_{table}_{'_'.join(columns)}"
+    lines = [
+        f"- name: {name}",
+        f'  "@id": "#{name}"',
+        f"  description: {description}",
+        "  columns:",
+    ]
+    return lines + [f'  - "#{table}.{column}"' for column in columns]
+
+
+def suggested_indexes(report):
+    """
+    YAML of the indexes covering the unindexed foreign keys of a report, per table.
+
+    A composite foreign key is indexed with a single-column foreign key of the
+    same table first when it has one, so that one index covers both.
+
+    Returns
+    -------
+    indexes : dict
+        YAML lines of the indexes (list items, without indentation) for each table
+    """
+    indexes = {}
+    for table in dict.fromkeys(report["table"]):
+        rows = report[(report["table"] == table) & (report["index"] == "")]
+        foreign_keys = [(row["columns"].split(","), row["referenced_table"]) for row in rows]
+        singles = {columns[0] for columns, _ in foreign_keys if len(columns) == 1}
+        covered = set()
+        for columns, referenced in sorted(foreign_keys, key=lambda fk: -len(fk[0])):
+            if len(columns) == 1 and columns[0] in covered:
+                continue
+            lead = [column for column in columns if column in singles - covered][:1]
+            columns = lead + [column for column in columns if column not in lead]
+            covered.update(lead)
+            description = f"Index on the foreign key to {referenced}"
+            if lead and len(columns) > 1:
+                description += f", also covering the foreign key on {lead[0]}"
+            indexes.setdefault(table, []).append(_index_yaml(table, columns, description))
+    return {table: [line for index in items for line in index] for table, items in indexes.items()}
+
+
+def query_plans(db, felis_path="schema.yaml"):
+    """
+    Query plan of a lookup on each foreign key of the schema, eg SELECT * FROM Photometry WHERE band = ''.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to explain the queries in (SQLite or PostgreSQL)
+    felis_path : str
+        Path to the Felis schema. Default: schema.yaml
+
+    Returns
+    -------
+    plans : astropy.table.Table
+        Table, columns, query plan, and whether the plan scans the whole table.
+        PostgreSQL may prefer a sequential scan on small tables even when an index exists.
+    """
+    postgres = db.engine.dialect.name == "postgresql"
+    rows = []
+    with db.engine.connect() as conn:
+        for row in foreign_key_indexes(felis_path):
+            if row["table"] not in db.metadata.tables:
+                continue
+            table = db.metadata.tables[row["table"]]
+            columns = row["columns"].split(",")
+            statement = select(table).where(and_(*[table.c[column] == "" for column in columns]))
+            sql = str(statement.compile(conn, compile_kwargs={"literal_binds": True}))
+            if postgres:
+                plan = [line for (line,) in conn.exec_driver_sql(f"EXPLAIN {sql}")]
+                full_scan = any("Seq Scan" in line for line in plan)
+            else:
+                plan = [detail for *_, detail in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+                full_scan = any(line.startswith("SCAN") for line in plan)
+            rows.append((row["table"], row["columns"], "; ".join(line.strip() for line in plan), full_scan))
+    return AstropyTable(rows=rows, names=["table", "columns", "plan", "full_scan"], dtype=[str, str, str, bool])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report foreign keys without a supporting index.")
+    parser.add_argument("--felis-path", default="schema.yaml", help="Path to the Felis schema (default: schema.yaml)")
+    parser.add_argument("--suggest", action="store_true", help="Print the YAML of the missing indexes")
+    parser.add_argument("--plans", action="store_true", help="Show the query plan of a lookup on each foreign key")
+    parser.add_argument(
+        "--db-name",
+        default="astrodb-template",
+        help="Name of the SQLite database, without the .sqlite extension (default: astrodb-template)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = foreign_key_indexes(args.felis_path)
+    report.pprint_all()
+    unindexed = report[report["index"] == ""]
+    if args.suggest:
+        for table, lines in suggested_indexes(unindexed).items():
+            print(f"\n# {table}\n" + "\n".join(lines))
+
+    full_scans = 0
+    if args.plans:
+        plans = query_plans(read_db_from_file(args.db_name), felis_path=args.felis_path)
+        plans.pprint_all(max_width=-1)
+        full_scans = sum(plans["full_scan"])
+    return 0 if len(unindexed) == 0 and full_scans == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
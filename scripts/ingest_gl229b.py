@@ -4,10 +4,15 @@
 # Gl 229b: https://simbad.cds.unistra.fr/simbad/sim-id?Ident=Gl+229b
 # Gl 229b in SIMPLE: https://simple-bd-archive.org/load_solo/Gl%20229B
 
+import sys
+
 from astrodb_utils import load_astrodb
 from astrodb_utils.sources import ingest_source, ingest_names
 from astrodb_utils.publications import ingest_publication
 
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.dirty_save import track_changes  # noqa: E402
+
 # Load the database
 DB_NAME = "tests/astrodb_template_tests.sqlite"
 SCHEMA_PATH = "schema/schema.yaml"
@@ -32,6 +37,9 @@ db = load_astrodb(
     reference_tables=REFERENCE_TABLES,
 )
 
+# Record which sources and lookup tables are modified so only those JSON files are saved
+tracker = track_changes(db)
+
 
 def ingest_gl229b(db):
     ingest_publication(db, doi="10.1038/378463a0")
@@ -179,4 +187,4 @@ ingest_names(db, "Gl 229b", "HD 42581b")
 
 
 if DB_SAVE:
-    db.save_database("data/")
+    tracker.save_database("data/")
@@ -0,0 +1,429 @@
+# Script to load the database from the JSON files, parsing source files in parallel
+#
+# Source JSON files are parsed and normalized in a process pool and handed
+# in order to a single writer, which inserts batched rows per table following
+# the foreign key dependency order of the schema.
+# The result does not depend on the number of workers.
+#
+# In bulk mode the rows of all source files are grouped by table and written
+# with one executemany per table, with SQLite tuned for bulk loading
+# (no rollback journal, no fsync, deferred foreign key checks).
+#
+# Usage:
+#     python scripts/json_loader.py [database.toml] [--workers N] [--batch-size N] [--bulk]
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from astrodb_utils.loaders import DatabaseSettings
+from astrodbkit.astrodb import Database
+from astrodbkit.utils import datetime_json_parser
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.adopted import create_adopted_indexes  # noqa: E402
+from scripts.schema_cache import create_schema_tables  # noqa: E402
+from scripts.units import store_parameter_units  # noqa: E402
+
+__all__ = [
+    "build_db_parallel",
+    "bulk_load_pragmas",
+    "load_database_parallel",
+    "read_settings",
+    "read_source_file",
+    "reference_file",
+    "source_files",
+]
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_DIRECTORY = "reference"
+SOURCE_DIRECTORY = "source"
+BATCH_SIZE = 1000  # number of source files whose rows are inserted together
+CHUNK_SIZE = 64  # number of files sent to a worker at a time
+BULK_JOURNAL_MODES = ("OFF", "WAL", "MEMORY")
+
+
+def read_settings(  # noqa: PLR0913
+    settings_file="database.toml",
+    base_path=".",
+    db_name=None,
+    felis_path=None,
+    data_path=None,
+    lookup_tables=None,
+):
+    """
+    Read the database settings, letting explicit arguments override the TOML file.
+
+    Returns
+    -------
+    db_settings : astrodb_utils.loaders.DatabaseSettings
+        Database settings
+    """
+    db_settings = DatabaseSettings(settings_file=settings_file, base_path=base_path, db_name=db_name)
+    if felis_path is not None:
+        db_settings.felis_path = felis_path
+    if data_path is not None:
+        db_settings.data_path = data_path
+    if lookup_tables is not None:
+        db_settings.lookup_tables = lookup_tables
+    return db_settings
+
+
+def reference_file(data_path, table):
+    """Path to the JSON file of a lookup table, preferring the reference sub-directory"""
+    path = os.path.join(data_path, REFERENCE_DIRECTORY, table + ".json")
+    if os.path.exists(path):
+        return path
+    return os.path.join(data_path, table + ".json")
+
+
+def source_files(data_path, lookup_tables):
+    """
+    List the source JSON files in sorted order.
+
+    Mirrors astrodbkit: the source sub-directory is used when present,
+    and lookup tables, hidden files, and non-JSON files are skipped.
+
+    Returns
+    -------
+    directory : str
+        Directory containing the source files
+    files : list
+        Sorted list of file names
+    """
+    directory = os.path.join(data_path, SOURCE_DIRECTORY)
+    if not os.path.isdir(directory):
+        directory = data_path
+
+    files = []
+    for file in sorted(os.listdir(directory)):
+        if not file.endswith(".json") or file.startswith("."):
+            continue
+        if file.replace(".json", "") in lookup_tables:
+            continue
+        files.append(file)
+    return directory, files
+
+
+def read_source_file(path, primary_table="Sources", primary_table_key="source", foreign_key="source"):
+    """
+    Parse a single source JSON file into rows per table.
+
+    Rows of every table other than the primary table get the foreign key
+    set to the source name, as `astrodbkit.astrodb.Database.load_json` does.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSON file
+    primary_table : str
+        Name of the primary table. Default: Sources
+    primary_table_key : str
+        Name of the primary key in the primary table. Default: source
+    foreign_key : str
+        Name of the foreign key in other tables. Default: source
+
+    Returns
+    -------
+    data : dict
+        Dictionary of table name: list of row dictionaries
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f, object_hook=datetime_json_parser)
+
+    source = data[primary_table][0][primary_table_key]
+    for table, rows in data.items():
+        if table == primary_table:
+            continue
+        for row in rows:
+            row[foreign_key] = source
+
+    return data
+
+
+def _parse_files(db, paths, workers):
+    """Yield parsed source files in the order of paths"""
+    reader = partial(
+        read_source_file,
+        primary_table=db._primary_table,
+        primary_table_key=db._primary_table_key,
+        foreign_key=db._foreign_key,
+    )
+
+    if workers == 1:
+        yield from map(reader, paths)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(reader, paths, chunksize=CHUNK_SIZE)
+
+
+def _insert_rows(conn, table, rows):
+    # executemany needs the same keys in every row. Columns without defaults are
+    # filled with None, which is what omitting them does; any remaining
+    # differences are handled by inserting runs of rows with identical keys.
+    nullable = [
+        column.name
+        for column in table.columns
+        if column.default is None and column.server_default is None
+    ]
+    for row in rows:
+        for name in nullable:
+            row.setdefault(name, None)
+
+    for _, group in itertools.groupby(rows, key=lambda row: tuple(sorted(row))):
+        conn.execute(table.insert(), list(group))
+
+
+def _write_batch(db, conn, batch):
+    """Insert the rows of a batch of files, grouped by table and in foreign key order"""
+    rows = {}
+    for data in batch:
+        for table, table_rows in data.items():
+            rows.setdefault(table, []).extend(table_rows)
+
+    unknown = set(rows) - set(db.metadata.tables)
+    if unknown:
+        raise KeyError(f"Tables not in the database: {sorted(unknown)}")
+
+    for table in db.metadata.sorted_tables:
+        if rows.get(table.name):
+            _insert_rows(conn, table, rows[table.name])
+
+
+@contextmanager
+def bulk_load_pragmas(conn, journal_mode="OFF"):
+    """
+    Tune an SQLite connection for bulk loading and restore the previous settings afterwards.
+
+    Sets the journal mode (OFF by default, so an interrupted load leaves a
+    corrupt file; only use it when building from scratch) and `synchronous=OFF`.
+    Foreign key checks are deferred to the end of each transaction.
+    Does nothing for other database backends.
+
+    Parameters
+    ----------
+    conn : sqlalchemy.engine.Connection
+        Connection used for the load; must not be inside a transaction
+    journal_mode : str
+        One of OFF, WAL, or MEMORY. Default: OFF
+    """
+    if conn.dialect.name != "sqlite":
+        yield conn
+        return
+
+    journal_mode = journal_mode.upper()
+    if journal_mode not in BULK_JOURNAL_MODES:
+        raise ValueError(f"journal_mode must be one of {BULK_JOURNAL_MODES}, not {journal_mode}")
+
+    previous_journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    previous_synchronous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+    conn.exec_driver_sql(f"PRAGMA journal_mode={journal_mode}")
+    conn.exec_driver_sql("PRAGMA synchronous=OFF")
+    conn.commit()
+    try:
+        # Reset by SQLite at every commit, so it only applies to the next transaction
+        conn.exec_driver_sql("PRAGMA defer_foreign_keys=ON")
+        yield conn
+    finally:
+        conn.rollback()
+        conn.exec_driver_sql(f"PRAGMA journal_mode={previous_journal_mode}")
+        conn.exec_driver_sql(f"PRAGMA synchronous={previous_synchronous}")
+        conn.commit()
+
+
+def load_database_parallel(
+    db,
+    directory: str,
+    workers: int = None,
+    batch_size: int = BATCH_SIZE,
+    verbose: bool = False,
+    bulk: bool = False,
+    journal_mode: str = "OFF",
+):
+    """
+    Reload the entire database from a directory of JSON files, parsing source files in parallel.
+
+    Equivalent to `astrodbkit.astrodb.Database.load_database`: existing tables are cleared
+    and the lookup tables are loaded before the source files.
+    Source files are read in sorted order and inserted by a single writer, so the
+    resulting database is identical for any number of workers.
+
+    With `bulk=True` the rows of all source files are grouped by table and inserted
+    in a single transaction with one executemany per table, using `bulk_load_pragmas`.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to load into
+    directory : str
+        Name of top-level directory containing the JSON files
+    workers : int
+        Number of parser processes. Default: None, uses the number of CPUs.
+        With 1 the files are parsed in this process.
+    batch_size : int
+        Number of source files inserted per transaction. Default: 1000. Ignored in bulk mode.
+    verbose : bool
+        Flag to enable diagnostic messages
+    bulk : bool
+        Insert all source files in one transaction tuned for bulk loading. Default: False
+    journal_mode : str
+        SQLite journal mode used in bulk mode, see `bulk_load_pragmas`. Default: OFF
+
+    Returns
+    -------
+    sources : dict
+        Source name of each source file, by file name
+    """
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # Clear existing database contents, children first
+    with db.engine.begin() as conn:
+        for table in reversed(db.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+    for table in db._lookup_tables:
+        if verbose:
+            print(f"Loading {table} table")
+        path = reference_file(directory, table)
+        db.load_table(table, os.path.dirname(path), verbose=verbose)
+
+    source_directory, files = source_files(directory, db._lookup_tables)
+    paths = [os.path.join(source_directory, file) for file in files]
+    if verbose:
+        print(f"Loading {len(paths)} source files with {workers} worker(s)")
+
+    sources = {}
+
+    def named(parsed):
+        for file, data in zip(files, parsed):
+            sources[file] = data[db._primary_table][0][db._primary_table_key]
+            yield data
+
+    parsed = named(_parse_files(db, paths, workers))
+
+    if bulk:
+        with db.engine.connect() as conn, bulk_load_pragmas(conn, journal_mode=journal_mode):
+            _write_batch(db, conn, parsed)
+            conn.commit()
+        return sources
+
+    while True:
+        batch = list(itertools.islice(parsed, batch_size))
+        if len(batch) == 0:
+            break
+        with db.engine.begin() as conn:
+            _write_batch(db, conn, batch)
+    return sources
+
+
+def build_db_parallel(  # noqa: PLR0913
+    settings_file: str = "database.toml",
+    *,
+    base_path: str = ".",
+    db_name: str = None,
+    felis_path: str = None,
+    data_path: str = None,
+    lookup_tables: list = None,
+    workers: int = None,
+    batch_size: int = BATCH_SIZE,
+    bulk: bool = False,
+):
+    """
+    Build an SQLite database from JSON files, parsing source files in parallel.
+
+    Takes the same settings as `astrodb_utils.build_db_from_json`, with explicit
+    arguments taking precedence over the TOML file.
+    If a database file with the same name already exists, it is removed.
+
+    Parameters
+    ----------
+    settings_file : str
+        Name of the TOML file containing the database settings. Default: database.toml
+    base_path : str
+        Path to the directory containing the TOML file. Default: current directory
+    db_name : str
+        Name of the database file (without .sqlite extension). Default: None, reads from TOML file
+    felis_path : str
+        Path to the Felis schema file. Default: None, reads from TOML file
+    data_path : str
+        Path to the data directory containing the JSON files. Default: None, reads from TOML file
+    lookup_tables : list
+        List of tables to consider as lookup tables. Default: None, reads from TOML file
+    workers : int
+        Number of parser processes. Default: None, uses the number of CPUs
+    batch_size : int
+        Number of source files inserted per transaction. Default: 1000
+    bulk : bool
+        Load all source files in one transaction tuned for bulk loading. Default: False
+
+    Returns
+    -------
+    db : astrodbkit.astrodb.Database
+        Astrodbkit Database object
+    """
+
+    db_settings = read_settings(settings_file, base_path, db_name, felis_path, data_path, lookup_tables)
+    db_file = db_settings.db_name + ".sqlite"
+
+    if os.path.exists(db_file):
+        os.remove(db_file)
+        logger.info(f"Removed old database file {db_file}.")
+
+    logger.info(f"Creating new database file: {db_file}")
+    db_connection_string = "sqlite:///" + db_file
+    create_schema_tables(db_connection_string, db_settings.felis_path)
+
+    db = Database(db_connection_string, lookup_tables=db_settings.lookup_tables)
+    load_database_parallel(db, db_settings.data_path, workers=workers, batch_size=batch_size, bulk=bulk)
+    create_adopted_indexes(db, felis_path=db_settings.felis_path)
+    store_parameter_units(db)
+
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build an SQLite database from JSON files, parsing source files in parallel."
+    )
+    parser.add_argument(
+        "settings_file",
+        nargs="?",
+        default="database.toml",
+        help="Name of the TOML file containing database settings (default: database.toml)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of parser processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help=f"Number of source files inserted per transaction (default: {BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Load all source files in one transaction with SQLite tuned for bulk loading",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_db_parallel(args.settings_file, workers=args.workers, batch_size=args.batch_size, bulk=args.bulk)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+# Concurrent link-health checks for Spectra.access_url
+#
+# URLs are checked with HEAD requests from a thread pool sharing one pooled
+# HTTP session (keep-alive), with a cap on concurrent requests per host,
+# timeouts, and exponential backoff on connection errors, 429 and 5xx responses.
+# Results (status, time checked, ETag and Last-Modified) are stored in the
+# urls table of .astrodb_cache/responses.sqlite. Later runs only recheck URLs
+# whose result is older than the time-to-live, with conditional requests so
+# unchanged files answer 304 Not Modified. Failed checks (timeouts, 5xx, 404)
+# are often transient and are trusted for an hour only.
+#
+# Usage:
+#     python scripts/link_check.py [--max-age DAYS] [--failure-max-age HOURS] [--workers N] [--per-host N]
+
+import argparse
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from astrodb_utils import read_db_from_file
+from astropy.table import Table as AstropyTable
+from requests.adapters import HTTPAdapter
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.response_cache import DEFAULT_CACHE_FILE, ResponseCache  # noqa: E402
+
+__all__ = [
+    "LinkChecker",
+    "check_spectra_urls",
+    "check_urls",
+]
+
+logger = logging.getLogger(__name__)
+
+CACHE_TABLE = "urls"
+CACHE_TTL = 7 * 86400
+FAILURE_TTL = 3600  # failed checks are rechecked sooner than working URLs
+OK_STATUS = (200, 301, 304)  # cuny academic commons links give 301 status code
+RETRY_STATUS = (429, 500, 502, 503, 504)
+WORKERS = 16
+PER_HOST = 4
+TIMEOUT = 10  # seconds
+RETRIES = 3
+BACKOFF = 0.5  # seconds, doubled after each retry
+
+
+class LinkChecker:
+    """
+    Check URLs concurrently with HEAD requests.
+
+    Parameters
+    ----------
+    workers : int
+        Maximum number of concurrent requests. Default: 16
+    per_host : int
+        Maximum number of concurrent requests to the same host. Default: 4
+    timeout : float
+        Connect and read timeout of each request in seconds. Default: 10
+    retries : int
+        Number of retries after a connection error or a 429/5xx response. Default: 3
+    backoff : float
+        Delay before the first retry in seconds, doubled after each retry. Default: 0.5
+    """
+
+    def __init__(self, workers=WORKERS, per_host=PER_HOST, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._host_lock = threading.Lock()
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+
+    def close(self):
+        self.session.close()
+
+    def _slot(self, url):
+        with self._host_lock:
+            return self._host_slots[urlparse(url).netloc]
+
+    def check(self, url, previous=None):
+        """
+        Check one URL.
+
+        Parameters
+        ----------
+        url : str
+            URL to check
+        previous : dict
+            Previous result for this URL; its ETag and Last-Modified make the request conditional
+
+        Returns
+        -------
+        result : dict
+            status (None if the URL could not be reached), ok, etag, last_modified, and error
+        """
+        headers = {}
+        if previous and previous.get("ok"):
+            if previous.get("etag"):
+                headers["If-None-Match"] = previous["etag"]
+            if previous.get("last_modified"):
+                headers["If-Modified-Since"] = previous["last_modified"]
+
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            error, response = None, None
+            try:
+                with self._slot(url):
+                    response = self.session.head(url, headers=headers, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                error = f"{type(e).__name__}: {e}"
+
+            if response is not None and response.status_code not in RETRY_STATUS:
+                break
+            if attempt < self.retries:
+                time.sleep(delay)
+                delay *= 2
+
+        if response is None:
+            return {"status": None, "ok": False, "etag": None, "last_modified": None, "error": error}
+
+        result = {
+            "status": response.status_code,
+            "ok": response.status_code in OK_STATUS,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "error": None,
+        }
+        if response.status_code == 304 and previous:
+            # Not Modified responses may omit the validators
+            result["etag"] = result["etag"] or previous.get("etag")
+            result["last_modified"] = result["last_modified"] or previous.get("last_modified")
+        return result
+
+    def check_many(self, urls, previous=None):
+        """
+        Check many URLs concurrently.
+
+        Parameters
+        ----------
+        urls : list of str
+            URLs to check
+        previous : dict
+            Previous result for each URL, if any
+
+        Returns
+        -------
+        results : dict
+            Result for each URL, see `check`
+        """
+        previous = previous or {}
+        urls = list(dict.fromkeys(urls))
+        if len(urls) == 0:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls))) as executor:
+            results = executor.map(lambda url: self.check(url, previous.get(url)), urls)
+            return dict(zip(urls, results))
+
+
+def check_urls(urls, cache=None, checker=None, failure_ttl=FAILURE_TTL):
+    """
+    Health of each URL, rechecking only URLs whose cached result is stale.
+
+    Parameters
+    ----------
+    urls : list of str
+        URLs to check
+    cache : ResponseCache
+        Cache of results; its time-to-live sets when URLs are rechecked.
+        Default: the urls table of .astrodb_cache/responses.sqlite with a 7-day TTL
+    checker : LinkChecker
+        Checker to use. Default: a LinkChecker with default settings
+    failure_ttl : float
+        Seconds after which failed checks are rechecked, when shorter than the cache TTL. Default: 3600
+
+    Returns
+    -------
+    results : dict
+        Result for each URL (see `LinkChecker.check`), with the time it was checked (last_checked)
+    """
+    own_cache = cache is None
+    if own_cache:
+        cache = ResponseCache(DEFAULT_CACHE_FILE, CACHE_TABLE, ttl=CACHE_TTL)
+
+    urls = list(dict.fromkeys(urls))
+    try:
+        results = cache.get_many(urls)
+        # Failed checks are only trusted for failure_ttl
+        oldest_failure = time.time() - failure_ttl
+        for url, checked_at in cache.fetched_at([url for url, result in results.items() if not result["ok"]]).items():
+            if checked_at < oldest_failure:
+                del results[url]
+        stale = [url for url in urls if url not in results]
+        if stale:
+            logger.info(f"Checking {len(stale)} of {len(urls)} URL(s)")
+            own_checker = checker is None
+            checker = checker or LinkChecker()
+            try:
+                checked = checker.check_many(stale, previous=cache.get_many(stale, include_stale=True))
+            finally:
+                if own_checker:
+                    checker.close()
+            cache.put_many(checked)
+            results.update(checked)
+
+        checked_at = cache.fetched_at(urls)
+    finally:
+        if own_cache:
+            cache.close()
+    return {url: dict(results[url], last_checked=checked_at.get(url)) for url in urls}
+
+
+def check_spectra_urls(db, cache=None, checker=None, failure_ttl=FAILURE_TTL):
+    """
+    Check every Spectra.access_url.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to check
+    cache, checker, failure_ttl
+        See `check_urls`
+
+    Returns
+    -------
+    report : astropy.table.Table
+        One row per URL with its status, ok flag, time checked, ETag, Last-Modified, and error
+    """
+    urls = [row[0] for row in db.query(db.Spectra.c.access_url).distinct().all()]
+    results = check_urls(urls, cache=cache, checker=checker, failure_ttl=failure_ttl)
+    columns = ["status", "ok", "last_checked", "etag", "last_modified", "error"]
+    return AstropyTable(
+        [urls] + [[results[url][column] for url in urls] for column in columns],
+        names=["access_url"] + columns,
+        dtype=[str, object, bool, float, object, object, object],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every Spectra.access_url is reachable.")
+    parser.add_argument(
+        "--db-name",
+        default="astrodb-template",
+        help="Name of the SQLite database, without the .sqlite extension (default: astrodb-template)",
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=CACHE_TTL / 86400,
+        help=f"Recheck URLs checked more than this many days ago (default: {CACHE_TTL / 86400:g})",
+    )
+    parser.add_argument(
+        "--failure-max-age",
+        type=float,
+        default=FAILURE_TTL / 3600,
+        help=f"Recheck failed URLs checked more than this many hours ago (default: {FAILURE_TTL / 3600:g})",
+    )
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"Concurrent requests (default: {WORKERS})")
+    parser.add_argument(
+        "--per-host", type=int, default=PER_HOST, help=f"Concurrent requests per host (default: {PER_HOST})"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = read_db_from_file(args.db_name)
+    cache = ResponseCache(DEFAULT_CACHE_FILE, CACHE_TABLE, ttl=args.max_age * 86400)
+    checker = LinkChecker(workers=args.workers, per_host=args.per_host)
+    try:
+        report = check_spectra_urls(db, cache=cache, checker=checker, failure_ttl=args.failure_max_age * 3600)
+    finally:
+        checker.close()
+        cache.close()
+
+    broken = report[~report["ok"]]
+    print(f"found {len(broken)} broken spectra urls out of {len(report)}")
+    if len(broken) > 0:
+        broken["access_url", "status", "error"].pprint_all()
+    return 0 if len(broken) == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
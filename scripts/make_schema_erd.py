@@ -1,21 +1,234 @@
 # Script to generate an Entity-Relation Diagram (ERD) for the database
+#
+# Besides the diagram of the whole schema, smaller diagrams of groups of
+# tables (see GROUPS) can be made, each showing the tables of the group and the
+# tables they reference. A diagram is only rendered again when what it shows
+# changes: the hash of its tables, their columns, and their foreign keys is
+# kept in .astrodb_cache/schema_erd.json, so editing descriptions, or tables of
+# other groups, does not trigger a render. Stale diagrams are rendered in parallel.
+#
+# Usage:
+#     python scripts/make_schema_erd.py [--format png|svg] [--groups] [--force] [--workers N]
 
+import argparse
+import hashlib
+import json
+import os
+import re
 import sys
-
-import yaml
-from eralchemy2 import render_er
-from felis.datamodel import Schema
-from felis.metadata import MetaDataBuilder
+from concurrent.futures import ProcessPoolExecutor
 
 sys.path.append("./")  # needed for github actions to find the template module
+from scripts.cache_utils import CACHE_DIRECTORY  # noqa: E402
+from scripts.schema_cache import load_metadata, load_schema  # noqa: E402
+
+SCHEMA_PATH = "schema.yaml"
+FIGURES_DIR = "docs/figures"
+DIAGRAM_NAME = "schema_erd"
+MANIFEST_PATH = os.path.join(CACHE_DIRECTORY, "schema_erd.json")
+FORMATS = ["png", "svg"]
+GROUPS = {
+    "lookup": [
+        "Publications",
+        "Telescopes",
+        "Instruments",
+        "PhotometryFilters",
+        "Versions",
+        "RegimeList",
+        "AssociationList",
+        "ParameterList",
+        "CompanionList",
+        "SourceTypeList",
+    ],
+    "kinematics": ["Positions", "Parallaxes", "ProperMotions", "RadialVelocities"],
+    "parameters": ["ModeledParameters", "RotationalParameters", "Morphology"],
+    "companions": ["CompanionRelationships", "CompanionParameters"],
+}
+
+
+def _referenced_table(column_id):
+    return column_id.lstrip("#").split(".", 1)[0]
+
+
+def diagram_tables(schema, group_tables=None):
+    """Tables shown in a diagram: the tables of a group and the tables they reference, or the whole schema"""
+    if group_tables is None:
+        return [table.name for table in schema.tables]
+    shown = set(group_tables)
+    for table in schema.tables:
+        if table.name in group_tables:
+            for constraint in table.constraints:
+                if constraint.type == "ForeignKey":
+                    shown.update(_referenced_table(column) for column in constraint.referenced_columns)
+    return [table.name for table in schema.tables if table.name in shown]
+
+
+def diagram_hash(schema, tables, fmt):
+    """Hash of what a diagram shows: its tables, their columns, and the foreign keys between them"""
+    graph = []
+    for table in schema.tables:
+        if table.name not in tables:
+            continue
+        graph.append(
+            {
+                "table": table.name,
+                "primary_key": table.primary_key,
+                "columns": [
+                    [column.name, column.datatype.value, column.length, column.nullable] for column in table.columns
+                ],
+                "foreign_keys": [
+                    [constraint.columns, constraint.referenced_columns]
+                    for constraint in table.constraints
+                    if constraint.type == "ForeignKey"
+                    and all(_referenced_table(column) in tables for column in constraint.referenced_columns)
+                ],
+            }
+        )
+    content = json.dumps({"format": fmt, "graph": graph}, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def plan_diagrams(schema_path=SCHEMA_PATH, figures_dir=FIGURES_DIR, fmt="png", groups=False):
+    """
+    Diagrams to make.
+
+    Returns
+    -------
+    diagrams : dict
+        (tables or None for the whole schema, hash) for each output file
+    """
+    schema = load_schema(schema_path)
+    diagrams = {
+        os.path.join(figures_dir, f"{DIAGRAM_NAME}.{fmt}"): (None, diagram_hash(schema, diagram_tables(schema), fmt))
+    }
+    if groups:
+        for group, group_tables in GROUPS.items():
+            tables = diagram_tables(schema, group_tables)
+            diagrams[os.path.join(figures_dir, f"{DIAGRAM_NAME}_{group}.{fmt}")] = (
+                tables,
+                diagram_hash(schema, tables, fmt),
+            )
+    return diagrams
+
+
+def _file_state(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def include_patterns(metadata, tables):
+    """
+    Patterns of eralchemy2's include_tables selecting tables of the MetaData.
+
+    eralchemy2 names tables by their full name, qualified with the schema name
+    (eg, astrodb_template.Positions), and matches the patterns as regular expressions.
+
+    Returns
+    -------
+    patterns : list or None
+        Escaped full names of the tables, or None for every table
+    """
+    if tables is None:
+        return None
+    return [re.escape(table.fullname) for table in metadata.tables.values() if table.name in tables]
+
+
+def render_diagram(schema_path, tables, filename):
+    """Render a diagram with eralchemy2 (and graphviz); the format follows the file extension"""
+    from eralchemy2 import render_er  # noqa: PLC0415 (only needed when something is rendered)
+
+    # Load the SQLAlchemy metadata of the Felis schema (parsed and validated once, then cached)
+    metadata = load_metadata(schema_path)
+    render_er(metadata, filename, include_tables=include_patterns(metadata, tables))
+    return filename
+
+
+def make_erd(  # noqa: PLR0913
+    schema_path=SCHEMA_PATH,
+    figures_dir=FIGURES_DIR,
+    fmt="png",
+    groups=False,
+    manifest_path=MANIFEST_PATH,
+    force=False,
+    workers=None,
+):
+    """
+    Render the diagrams whose tables, columns, or foreign keys changed since they were last rendered.
+
+    Parameters
+    ----------
+    schema_path : str
+        Path to the Felis schema. Default: schema.yaml
+    figures_dir : str
+        Output directory. Default: docs/figures
+    fmt : str
+        Image format, png or svg. Default: png
+    groups : bool
+        Also make a diagram for each group of GROUPS. Default: False
+    manifest_path : str
+        File keeping the diagram hashes between runs. Default: .astrodb_cache/schema_erd.json
+    force : bool
+        Render every diagram, ignoring the hashes. Default: False
+    workers : int
+        Number of rendering processes. Default: None, uses the number of CPUs
+
+    Returns
+    -------
+    rendered : list of str
+        Paths of the diagrams that were rendered
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of {FORMATS}")
+    diagrams = plan_diagrams(schema_path, figures_dir, fmt, groups)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    stale = [
+        (path, tables)
+        for path, (tables, digest) in diagrams.items()
+        if force
+        or manifest.get(path, {}).get("hash") != digest
+        or manifest[path].get("file") != _file_state(path)
+    ]
+
+    os.makedirs(figures_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(stale), 1))
+    if workers == 1:
+        rendered = [render_diagram(schema_path, tables, path) for path, tables in stale]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(render_diagram, schema_path, tables, path) for path, tables in stale]
+            rendered = [future.result() for future in futures]
+
+    for path, (_, digest) in diagrams.items():
+        manifest[path] = {"hash": digest, "file": _file_state(path)}
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return rendered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Make entity-relation diagrams of the schema.")
+    parser.add_argument("--format", choices=FORMATS, default="png", help="Image format (default: png)")
+    parser.add_argument("--groups", action="store_true", help=f"Also make diagrams of {', '.join(GROUPS)} tables")
+    parser.add_argument("--force", action="store_true", help="Render every diagram, even if unchanged")
+    parser.add_argument("--workers", type=int, help="Number of rendering processes (default: number of CPUs)")
+    args = parser.parse_args()
 
-# Load up schema
-data = yaml.safe_load(open("schema.yaml", "r"))
-schema = Schema.model_validate(data)
+    rendered = make_erd(fmt=args.format, groups=args.groups, force=args.force, workers=args.workers)
+    for path in rendered:
+        print(f"Rendered {path}")
+    if not rendered:
+        print("Diagrams are up to date")
+    return 0
 
-# Create from Felis schema
-metadata = MetaDataBuilder(schema).build()
 
-# Create ER model from the database metadata
-filename = "docs/figures/schema_erd.png"
-render_er(metadata, filename)
+if __name__ == "__main__":
+    sys.exit(main())
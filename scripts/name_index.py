@@ -0,0 +1,349 @@
+# Normalized name index for resolving identifiers against Sources and Names
+#
+# Every Sources.source and Names.other_name is normalized with the same rules
+# as astrodbkit's _name_formatter (repeated whitespace, SIMBAD prefixes such
+# as "V* " or "NAME "), then case-folded with all whitespace removed.
+# The normalized keys are stored with a B-tree index in a side SQLite file in
+# .astrodb_cache, rebuilt whenever the database file changes, so the database
+# schema itself is untouched. An optional FTS5 trigram table supports fuzzy lookups.
+#
+# Usage:
+#     from scripts.name_index import resolve_names
+#     t = resolve_names(db, ["gl 229 b", "HD 42581b", "NAME Crab Nebula"])
+# or
+#     python scripts/name_index.py "Gl 229b" "HD 42581b" [--fuzzy TEXT]
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import sys
+import uuid
+
+from astrodb_utils import read_db_from_file
+from astrodbkit.utils import _name_formatter
+from astropy.table import Table as AstropyTable
+from sqlalchemy import select
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.cache_utils import cache_path, database_fingerprint  # noqa: E402
+
+__all__ = [
+    "NameIndex",
+    "normalize_name",
+    "resolve_names",
+]
+
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = "names.sqlite"
+INDEX_VERSION = "1"
+
+
+def normalize_name(name):
+    """
+    Normalized lookup key for an object name.
+
+    Applies astrodbkit's `_name_formatter`, then removes all whitespace and case-folds.
+    Returns None for empty or hidden SIMBAD names.
+    """
+    if name is None:
+        return None
+    name = _name_formatter(str(name))
+    if name is None:
+        return None
+    key = re.sub(r"\s+", "", name).casefold()
+    return key or None
+
+
+def _fts5_trigram_available():
+    try:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(name, tokenize='trigram')")
+        conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+class NameIndex:
+    """
+    Side index of normalized names for a database.
+
+    Use `NameIndex.for_database` to open (or build) the index of a Database.
+
+    Parameters
+    ----------
+    path : str
+        Path of the SQLite file holding the index
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+
+    def close(self):
+        self.conn.close()
+
+    def _meta(self, key):
+        try:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+
+    @property
+    def fingerprint(self):
+        return self._meta("fingerprint")
+
+    @property
+    def fuzzy(self):
+        return self._meta("fuzzy") == "1"
+
+    @staticmethod
+    def _read_names(db):
+        primary = db.metadata.tables[db._primary_table]
+        queries = [select(primary.c[db._primary_table_key], primary.c[db._primary_table_key])]
+        if "Names" in db.metadata.tables:
+            names = db.metadata.tables["Names"]
+            queries.append(select(names.c.other_name, names.c[db._foreign_key]))
+
+        with db.engine.connect() as conn:
+            for query in queries:
+                for name, source in conn.execute(query):
+                    key = normalize_name(name)
+                    if key is not None:
+                        yield key, name, source
+
+    def _create(self, conn, db, fingerprint, fuzzy):
+        with conn:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE names (name_key TEXT NOT NULL, name TEXT NOT NULL, source TEXT NOT NULL)")
+            conn.executemany("INSERT INTO names VALUES (?, ?, ?)", self._read_names(db))
+            conn.execute("CREATE INDEX names_name_key ON names (name_key, source)")
+            if fuzzy:
+                conn.execute("CREATE VIRTUAL TABLE names_fts USING fts5(name, source UNINDEXED, tokenize='trigram')")
+                conn.execute("INSERT INTO names_fts (name, source) SELECT DISTINCT name, source FROM names")
+            conn.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [("version", INDEX_VERSION), ("fingerprint", fingerprint or ""), ("fuzzy", "1" if fuzzy else "0")],
+            )
+
+    def build(self, db, fingerprint=None, fuzzy=False):
+        """
+        (Re)build the index from the Sources and Names tables.
+
+        The index is written to a temporary file that then replaces the index
+        file, so processes building it at the same time do not interfere, and
+        readers see either the old or the new index.
+
+        Parameters
+        ----------
+        db : astrodbkit.astrodb.Database
+            Database to index
+        fingerprint : str
+            Database fingerprint stored with the index. Default: None
+        fuzzy : bool
+            Also build an FTS5 trigram table for fuzzy lookups. Default: False
+        """
+        if fuzzy and not _fts5_trigram_available():
+            raise RuntimeError("This SQLite build does not support the FTS5 trigram tokenizer")
+
+        if self.path == ":memory:":
+            with self.conn:
+                for table in ("names", "names_fts", "meta"):
+                    self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._create(self.conn, db, fingerprint, fuzzy)
+            return
+
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                self._create(conn, db, fingerprint, fuzzy)
+            finally:
+                conn.close()
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.conn.close()
+        self.conn = sqlite3.connect(self.path)
+
+    @classmethod
+    def for_database(cls, db, fuzzy=False, cache_dir=None):
+        """
+        Open the name index of a database, rebuilding it if the database changed.
+
+        Parameters
+        ----------
+        db : astrodbkit.astrodb.Database
+            Database to index
+        fuzzy : bool
+            Make sure the FTS5 trigram table for fuzzy lookups is present. Default: False
+        cache_dir : str
+            Directory for the index file. Default: .astrodb_cache next to the database file.
+            For non-SQLite databases an in-memory index is built.
+
+        Returns
+        -------
+        index : NameIndex
+        """
+        fingerprint = database_fingerprint(db)
+        path = cache_path(db, CACHE_SUFFIX, cache_dir=cache_dir) if fingerprint is not None else None
+
+        index = cls(path or ":memory:")
+        up_to_date = (
+            path is not None
+            and index._meta("version") == INDEX_VERSION
+            and index.fingerprint == fingerprint
+            and (index.fuzzy or not fuzzy)
+        )
+        if not up_to_date:
+            logger.info(f"Building name index {path or 'in memory'}")
+            index.build(db, fingerprint=fingerprint, fuzzy=fuzzy)
+        return index
+
+    def _resolve_keys(self, keys):
+        # keys: (position, name_key) pairs; returns the sorted distinct sources of each position
+        conn = self.conn
+        with conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS query (position INTEGER NOT NULL, name_key TEXT)")
+            conn.execute("DELETE FROM query")
+            conn.executemany("INSERT INTO query VALUES (?, ?)", keys)
+            rows = conn.execute(
+                "SELECT q.position, n.source FROM query q LEFT JOIN names n ON n.name_key = q.name_key "
+                "GROUP BY q.position, n.source ORDER BY q.position, n.source"
+            ).fetchall()
+
+        sources = {}
+        for position, source in rows:
+            matches = sources.setdefault(position, [])
+            if source is not None:
+                matches.append(source)
+        return sources
+
+    def resolve(self, names):
+        """
+        Resolve a list of names to sources with a single query.
+
+        Parameters
+        ----------
+        names : list of str
+            Names to resolve
+
+        Returns
+        -------
+        results : astropy.table.Table
+            One row per input with the input name, the matched source ('' when there
+            is no match or the match is ambiguous), and the number of distinct
+            matching sources (n_sources)
+        """
+        names = list(names)
+        matches = self._resolve_keys((i, normalize_name(name)) for i, name in enumerate(names))
+
+        n_sources = [len(matches[i]) for i in range(len(names))]
+        sources = [matches[i][0] if n == 1 else "" for i, n in enumerate(n_sources)]
+        return AstropyTable(
+            [names, sources, n_sources],
+            names=["name", "source", "n_sources"],
+            dtype=[str, str, int],
+        )
+
+    def resolve_sets(self, name_sets):
+        """
+        Resolve sets of alternative names (eg, all identifiers of an object) with a single query.
+
+        Parameters
+        ----------
+        name_sets : list of list of str
+            Names to resolve, grouped by object
+
+        Returns
+        -------
+        sources : list of list of str
+            Sorted distinct sources matching any name of each set
+        """
+        name_sets = list(name_sets)
+        keys = ((i, normalize_name(name)) for i, names in enumerate(name_sets) for name in (names or [None]))
+        matches = self._resolve_keys(keys)
+        return [matches[i] for i in range(len(name_sets))]
+
+    def search(self, text, limit=10):
+        """
+        Fuzzy search for names containing a string, using the FTS5 trigram table.
+
+        Parameters
+        ----------
+        text : str
+            Text to search for; at least three characters
+        limit : int
+            Maximum number of results. Default: 10
+
+        Returns
+        -------
+        results : list of tuple
+            (name, source) pairs, best matches first
+        """
+        if not self.fuzzy:
+            raise RuntimeError("Build the index with fuzzy=True to use fuzzy search")
+        query = '"' + text.replace('"', '""') + '"'
+        return self.conn.execute(
+            "SELECT name, source FROM names_fts WHERE names_fts MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit),
+        ).fetchall()
+
+
+def resolve_names(db, names, cache_dir=None):
+    """
+    Resolve many names to sources in a single query against the normalized name index.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to resolve names against
+    names : list of str
+        Names to resolve
+    cache_dir : str
+        Directory for the index file. Default: .astrodb_cache next to the database file
+
+    Returns
+    -------
+    results : astropy.table.Table
+        See `NameIndex.resolve`
+    """
+    index = NameIndex.for_database(db, cache_dir=cache_dir)
+    try:
+        return index.resolve(names)
+    finally:
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve object names to sources with the normalized name index.")
+    parser.add_argument("names", nargs="*", help="Names to resolve")
+    parser.add_argument(
+        "--db-name",
+        default="astrodb-template",
+        help="Name of the SQLite database, without the .sqlite extension (default: astrodb-template)",
+    )
+    parser.add_argument("--fuzzy", metavar="TEXT", help="Fuzzy search for names containing TEXT")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = read_db_from_file(args.db_name)
+    index = NameIndex.for_database(db, fuzzy=args.fuzzy is not None)
+    try:
+        if args.names:
+            index.resolve(args.names).pprint_all()
+        if args.fuzzy is not None:
+            for name, source in index.search(args.fuzzy):
+                print(f"{name}\t{source}")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
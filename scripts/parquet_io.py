@@ -0,0 +1,392 @@
+# Export the database to Parquet files and load it back
+#
+# Each table is written to Parquet with pyarrow, with the Arrow types mapped from
+# the Felis datatypes of schema.yaml (see ARROW_TYPES), so string, double,
+# boolean, and timestamp columns keep their types, and analysts can read whole
+# tables with pyarrow, pandas, or polars without going through the database.
+# Tables with at least PARTITION_ROWS rows are split into PARTITIONS files by a
+# stable hash of the source name, so that all rows of a source are in the same
+# file. A manifest.json lists the files and row counts of every table.
+#
+# Loading reads the files memory-mapped, batch by batch, and inserts each batch
+# with a single executemany (SQLite, in a transaction tuned with
+# scripts.json_loader.bulk_load_pragmas) or COPY (PostgreSQL, with
+# scripts.pg_copy_loader), in foreign key order.
+#
+# pyarrow is optional: it is only imported when exporting or loading.
+#
+# Usage:
+#     python scripts/parquet_io.py export [--db-name NAME] [--directory parquet]
+#     python scripts/parquet_io.py import [--db-name NAME] [--directory parquet]
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import uuid
+
+from astrodbkit.astrodb import Database
+from sqlalchemy import func, select
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.adopted import create_adopted_indexes  # noqa: E402
+from scripts.json_loader import bulk_load_pragmas, read_settings  # noqa: E402
+from scripts.schema_cache import create_schema_tables, load_schema  # noqa: E402
+
+__all__ = [
+    "ARROW_TYPES",
+    "arrow_schema",
+    "build_db_from_parquet",
+    "export_parquet",
+    "import_parquet",
+    "read_manifest",
+    "source_partition",
+]
+
+logger = logging.getLogger(__name__)
+
+PARQUET_FORMAT_VERSION = 1  # bump when the layout of the export changes
+MANIFEST_NAME = "manifest.json"
+PARQUET_DIRECTORY = "parquet"
+PARTITIONS = 16  # files of a partitioned table
+PARTITION_ROWS = 100_000  # tables with at least this many rows are partitioned by source
+BATCH_ROWS = 65_536  # rows read from the database or from a Parquet file at a time
+COMPRESSION = "zstd"
+# Arrow type (as a pyarrow alias) of each Felis datatype
+ARROW_TYPES = {
+    "boolean": "bool",
+    "byte": "int8",
+    "short": "int16",
+    "int": "int32",
+    "long": "int64",
+    "float": "float",
+    "double": "double",
+    "char": "string",
+    "string": "string",
+    "unicode": "string",
+    "text": "string",
+    "binary": "binary",
+    "timestamp": "timestamp[us]",
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow  # noqa: PLC0415
+        import pyarrow.compute  # noqa: PLC0415
+        import pyarrow.parquet  # noqa: PLC0415
+    except ImportError as e:
+        raise ImportError("Parquet export and import need pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def source_partition(source, partitions=PARTITIONS):
+    """Partition of a source name, from a hash that is the same in every process and on every machine"""
+    digest = hashlib.blake2b(source.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % partitions
+
+
+def arrow_schema(felis_table):
+    """
+    Arrow schema of a Felis table.
+
+    Parameters
+    ----------
+    felis_table : felis.datamodel.Table
+        Table of the Felis schema
+
+    Returns
+    -------
+    schema : pyarrow.Schema
+        One field per column, typed from ARROW_TYPES, nullable as in the Felis
+        schema, with the Felis datatype in the field metadata
+    """
+    pa = _import_pyarrow()
+    return pa.schema(
+        [
+            pa.field(
+                column.name,
+                pa.type_for_alias(ARROW_TYPES[column.datatype.value]),
+                nullable=column.nullable is not False,
+                metadata={"felis:datatype": column.datatype.value},
+            )
+            for column in felis_table.columns
+        ],
+        metadata={"felis:table": felis_table.name},
+    )
+
+
+def _partition_key(db, table):
+    if table.name == db._primary_table:
+        return db._primary_table_key
+    return db._foreign_key if db._foreign_key in table.columns else None
+
+
+def _write_table(conn, table, schema, directory, partitions, key):
+    """Write the rows of a table to one Parquet file, or to one file per partition of the key"""
+    pa = _import_pyarrow()
+    writers = {}
+
+    def writer(partition):
+        if partition not in writers:
+            if key is None:
+                path = f"{table.name}.parquet"
+            else:
+                path = os.path.join(table.name, f"part-{partition:02d}.parquet")
+            os.makedirs(os.path.dirname(os.path.join(directory, path)), exist_ok=True)
+            parquet_writer = pa.parquet.ParquetWriter(os.path.join(directory, path), schema, compression=COMPRESSION)
+            writers[partition] = (path, parquet_writer)
+        return writers[partition][1]
+
+    statement = select(*[table.c[name] for name in schema.names]).order_by(*table.primary_key.columns)
+    result = conn.execution_options(yield_per=BATCH_ROWS).execute(statement)
+    try:
+        if key is None:
+            writer(0)  # also written when the table is empty, for its schema
+        for rows in result.partitions():
+            columns = list(zip(*rows))
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            )
+            if key is None:
+                writer(0).write_batch(batch)
+                continue
+            parts = pa.array([source_partition(source, partitions) for source in columns[schema.get_field_index(key)]])
+            for partition in sorted(set(parts.to_pylist())):
+                writer(partition).write_batch(batch.filter(pa.compute.equal(parts, partition)))
+    finally:
+        for _, parquet_writer in writers.values():
+            parquet_writer.close()
+    return sorted(path for path, _ in writers.values())
+
+
+def export_parquet(db, directory=PARQUET_DIRECTORY, felis_path="schema.yaml", partitions=PARTITIONS):
+    """
+    Write every table of the database to Parquet files.
+
+    The files are written to a temporary directory that replaces the previous
+    export once complete.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to export (SQLite or PostgreSQL)
+    directory : str
+        Output directory. Default: parquet
+    felis_path : str
+        Path to the Felis schema giving the column types. Default: schema.yaml
+    partitions : int
+        Number of files of the tables with at least PARTITION_ROWS rows. Default: 16
+
+    Returns
+    -------
+    manifest : dict
+        Contents of manifest.json: the files and number of rows of each table
+    """
+    _import_pyarrow()
+    exported = os.path.exists(os.path.join(directory, MANIFEST_NAME))
+    if os.path.isdir(directory) and os.listdir(directory) and not exported:
+        raise ValueError(f"{directory} is not empty and is not a Parquet export")
+
+    felis_schema = load_schema(felis_path)
+    felis_tables = {table.name: table for table in felis_schema.tables}
+    unknown = set(db.metadata.tables) - set(felis_tables)
+    if unknown:
+        raise KeyError(f"Tables not in {felis_path}: {sorted(unknown)}")
+
+    manifest = {"version": PARQUET_FORMAT_VERSION, "schema": felis_schema.name, "tables": {}}
+    tmp_dir = f"{directory.rstrip(os.sep)}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_dir)
+    try:
+        with db.engine.connect() as conn:
+            for table in db.metadata.sorted_tables:
+                n_rows = conn.execute(select(func.count()).select_from(table)).scalar()
+                key = _partition_key(db, table) if n_rows >= PARTITION_ROWS else None
+                schema = arrow_schema(felis_tables[table.name])
+                files = _write_table(conn, table, schema, tmp_dir, partitions, key)
+                manifest["tables"][table.name] = {"rows": n_rows, "partition_key": key, "files": files}
+                logger.info(f"Exported {n_rows} rows of {table.name} to {len(files)} file(s)")
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp_dir, directory)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(directory=PARQUET_DIRECTORY):
+    """Contents of the manifest.json of a Parquet export"""
+    with open(os.path.join(directory, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != PARQUET_FORMAT_VERSION:
+        raise ValueError(f"Unsupported Parquet export version {manifest.get('version')} in {directory}")
+    return manifest
+
+
+def _batches(directory, files):
+    """Record batches of the files of a table, read memory-mapped"""
+    pa = _import_pyarrow()
+    for path in files:
+        parquet_file = pa.parquet.ParquetFile(os.path.join(directory, path), memory_map=True)
+        yield from parquet_file.iter_batches(batch_size=BATCH_ROWS)
+
+
+def _insert_batch(conn, table, batch):
+    """Insert a record batch with one executemany, converting values as SQLAlchemy would"""
+    unknown = set(batch.schema.names) - set(table.columns.keys())
+    if unknown:
+        raise KeyError(f"Columns not in table {table.name}: {sorted(unknown)}")
+
+    columns = []
+    for name, array in zip(batch.schema.names, batch.columns):
+        values = array.to_pylist()
+        processor = table.c[name].type.dialect_impl(conn.dialect).bind_processor(conn.dialect)
+        columns.append([processor(value) for value in values] if processor else values)
+    sql = str(table.insert().compile(dialect=conn.dialect, column_keys=batch.schema.names))
+    conn.exec_driver_sql(sql, list(zip(*columns)))
+
+
+def _load_postgres(db, directory, manifest, schema, manage_indexes):
+    from scripts.pg_copy_loader import _TableSpool, copy_load_spools  # noqa: PLC0415
+
+    spools = {table.name: _TableSpool(table) for table in db.metadata.sorted_tables}
+    try:
+        for name, entry in manifest["tables"].items():
+            for batch in _batches(directory, entry["files"]):
+                spools[name].add(batch.to_pylist())
+        return copy_load_spools(db, spools, schema=schema, manage_indexes=manage_indexes)
+    finally:
+        for spool in spools.values():
+            spool.close()
+
+
+def _sqlite_secondary_indexes(conn, tables):
+    """(name, CREATE INDEX statement) of the indexes of tables not backing a primary key or unique constraint"""
+    query = (
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND tbl_name IN ({', '.join('?' for _ in tables)}) ORDER BY tbl_name, name"
+    )
+    return [tuple(row) for row in conn.exec_driver_sql(query, tuple(tables))]
+
+
+def import_parquet(db, directory=PARQUET_DIRECTORY, schema=None, journal_mode="OFF", manage_indexes=True):
+    """
+    Replace the contents of the database with a Parquet export.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to load into (SQLite or PostgreSQL), with the tables already created
+    directory : str
+        Directory of the export, see `export_parquet`. Default: parquet
+    schema : str
+        PostgreSQL schema of the tables. Default: None, the current schema of the connection
+    journal_mode : str
+        SQLite journal mode during the load, see `scripts.json_loader.bulk_load_pragmas`. Default: OFF
+    manage_indexes : bool
+        Drop the secondary indexes during the load and recreate them afterwards. Default: True
+
+    Returns
+    -------
+    counts : dict
+        Number of rows loaded into each table
+    """
+    _import_pyarrow()
+    manifest = read_manifest(directory)
+    unknown = set(manifest["tables"]) - set(db.metadata.tables)
+    if unknown:
+        raise KeyError(f"Tables not in the database: {sorted(unknown)}")
+
+    if db.engine.dialect.name == "postgresql":
+        return _load_postgres(db, directory, manifest, schema, manage_indexes)
+
+    counts = {}
+    with db.engine.connect() as conn, bulk_load_pragmas(conn, journal_mode=journal_mode):
+        for table in reversed(db.metadata.sorted_tables):
+            conn.execute(table.delete())
+        indexes = _sqlite_secondary_indexes(conn, list(db.metadata.tables)) if manage_indexes else []
+        for name, _ in indexes:
+            conn.exec_driver_sql(f'DROP INDEX "{name}"')
+        for table in db.metadata.sorted_tables:
+            counts[table.name] = 0
+            if table.name not in manifest["tables"]:
+                continue
+            for batch in _batches(directory, manifest["tables"][table.name]["files"]):
+                _insert_batch(conn, table, batch)
+                counts[table.name] += batch.num_rows
+            logger.info(f"Loaded {counts[table.name]} rows into {table.name}")
+        for _, definition in indexes:
+            conn.exec_driver_sql(definition)
+        conn.commit()
+    return counts
+
+
+def build_db_from_parquet(directory=PARQUET_DIRECTORY, settings_file="database.toml", *, db_name=None, felis_path=None):
+    """
+    Build an SQLite database from a Parquet export.
+
+    If a database file with the same name already exists, it is removed.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the export. Default: parquet
+    settings_file : str
+        Name of the TOML file containing the database settings. Default: database.toml
+    db_name : str
+        Name of the database file (without .sqlite extension). Default: None, reads from TOML file
+    felis_path : str
+        Path to the Felis schema file. Default: None, reads from TOML file
+
+    Returns
+    -------
+    db : astrodbkit.astrodb.Database
+        Astrodbkit Database object
+    """
+    db_settings = read_settings(settings_file, db_name=db_name, felis_path=felis_path)
+    db_file = db_settings.db_name + ".sqlite"
+    if os.path.exists(db_file):
+        os.remove(db_file)
+        logger.info(f"Removed old database file {db_file}.")
+
+    create_schema_tables("sqlite:///" + db_file, db_settings.felis_path)
+    db = Database("sqlite:///" + db_file, lookup_tables=db_settings.lookup_tables)
+    import_parquet(db, directory)
+    create_adopted_indexes(db, felis_path=db_settings.felis_path)
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the database to Parquet files, or build it from them.")
+    parser.add_argument("action", choices=["export", "import"], help="Export the database, or build it from an export")
+    parser.add_argument(
+        "--directory",
+        default=PARQUET_DIRECTORY,
+        help=f"Directory of the Parquet files (default: {PARQUET_DIRECTORY})",
+    )
+    parser.add_argument(
+        "--db-name",
+        default=None,
+        help="Name of the SQLite database, without the .sqlite extension (default: from database.toml)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db_settings = read_settings(db_name=args.db_name)
+    if args.action == "export":
+        db = Database("sqlite:///" + db_settings.db_name + ".sqlite", lookup_tables=db_settings.lookup_tables)
+        manifest = export_parquet(db, args.directory, felis_path=db_settings.felis_path)
+        print(f"Exported {sum(entry['rows'] for entry in manifest['tables'].values())} rows to {args.directory}")
+    else:
+        build_db_from_parquet(args.directory, db_name=args.db_name)
+        print(f"Built {db_settings.db_name}.sqlite from {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
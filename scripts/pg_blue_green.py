@@ -0,0 +1,405 @@
+# Blue/green rebuilds of the PostgreSQL deployment
+#
+# Instead of dropping and rebuilding the live schema, the database is loaded
+# into a versioned shadow schema (eg, astrodb_template_v1a2b3c4d5e6f7a8b, where
+# the version is a hash of schema.yaml and the data files) with its own
+# TAP_SCHEMA metadata (TAP_SCHEMA_v1a2b3c4d5e6f7a8b). The shadow is validated
+# (schema rules and adopted flags, see scripts/validation.py and scripts/adopted.py)
+# and then swapped in by renaming schemas in a single transaction:
+#     astrodb_template          -> astrodb_template_v<previous version>
+#     astrodb_template_v<new>   -> astrodb_template
+# and the same for TAP_SCHEMA. Renames only touch the catalog, so queries keep
+# running on the old tables until the commit and then see the new ones. The
+# previous versions are kept (KEEP_VERSIONS) for instant rollback.
+# Each schema carries a JSON comment with its version and when it went live or was retired.
+#
+# Usage:
+#     python scripts/pg_blue_green.py [database.toml] [--keep N]
+#     python scripts/pg_blue_green.py --list
+#     python scripts/pg_blue_green.py --rollback [VERSION]
+# The connection string is read from TEMPLATE_CONNECTION_STRING (or a .env file).
+
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+from astrodb_utils import AstroDBError
+from astrodbkit.astrodb import Database
+from astropy.table import Table as AstropyTable
+from sqlalchemy import create_engine, text
+from sqlalchemy.schema import CreateSchema, DropSchema
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.adopted import check_adopted, create_adopted_indexes  # noqa: E402
+from scripts.db_snapshot import snapshot_key  # noqa: E402
+from scripts.incremental_build import build_manifest  # noqa: E402
+from scripts.json_loader import read_settings  # noqa: E402
+from scripts.pg_copy_loader import copy_load_database  # noqa: E402
+from scripts.schema_cache import load_metadata, load_schema, read_schema_yaml  # noqa: E402
+from scripts.tap_metadata import TAP_SCHEMA_NAME, sync_tap_schema  # noqa: E402
+from scripts.validation import failed_rules, validate_database  # noqa: E402
+
+__all__ = [
+    "blue_green_build",
+    "data_version",
+    "list_versions",
+    "rollback",
+    "swap_in",
+    "validate_shadow",
+]
+
+logger = logging.getLogger(__name__)
+
+KEEP_VERSIONS = 1  # previous versions kept for rollback
+LOCK_TIMEOUT_MS = 5000  # give up the swap rather than queue behind long-running DDL
+
+
+def data_version(db_settings):
+    """Version of the database: hash of the schema, lookup tables, and data files (see scripts/db_snapshot.py)"""
+    return snapshot_key(build_manifest(db_settings), db_settings.lookup_tables)
+
+
+def _versioned(name, version):
+    return f"{name}_v{version}"
+
+
+def _quote(conn, *names):
+    preparer = conn.dialect.identifier_preparer
+    return ".".join(preparer.quote(name) for name in names)
+
+
+def _comment(conn, schema):
+    """JSON comment of a schema: None if the schema does not exist, {} if it has no comment"""
+    row = conn.execute(
+        text("SELECT obj_description(oid, 'pg_namespace') FROM pg_namespace WHERE nspname = :schema"),
+        {"schema": schema},
+    ).one_or_none()
+    if row is None:
+        return None
+    try:
+        return json.loads(row[0]) if row[0] else {}
+    except ValueError:
+        return {}
+
+
+def _set_comment(conn, schema, info):
+    conn.execute(text(f"COMMENT ON SCHEMA {_quote(conn, schema)} IS {_literal(json.dumps(info, sort_keys=True))}"))
+
+
+def _literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _rename(conn, old, new):
+    conn.execute(text(f"ALTER SCHEMA {_quote(conn, old)} RENAME TO {_quote(conn, new)}"))
+
+
+def list_versions(engine, schema, tap_schema=TAP_SCHEMA_NAME):
+    """
+    Live and kept versions of the database.
+
+    Returns
+    -------
+    versions : astropy.table.Table
+        Schema name, version, whether it is live, whether its TAP_SCHEMA exists,
+        and when it went live and was retired, most recent first
+    """
+    with engine.connect() as conn:
+        names = [
+            row[0]
+            for row in conn.execute(
+                text("SELECT nspname FROM pg_namespace WHERE nspname = :live OR starts_with(nspname, :prefix)"),
+                {"live": schema, "prefix": schema + "_v"},
+            )
+        ]
+        rows = []
+        for name in names:
+            info = _comment(conn, name) or {}
+            version = info.get("version", "")
+            tap = tap_schema if name == schema else _versioned(tap_schema, version)
+            rows.append(
+                (
+                    name,
+                    version,
+                    name == schema,
+                    _comment(conn, tap) is not None,
+                    info.get("live_since", ""),
+                    info.get("retired", ""),
+                )
+            )
+    live = [row for row in rows if row[2]]
+    rows = live + sorted([row for row in rows if not row[2]], key=lambda row: row[5], reverse=True)
+    return AstropyTable(
+        rows=rows,
+        names=["schema", "version", "live", "tap_schema", "live_since", "retired"],
+        dtype=[str, str, bool, bool, str, str],
+    )
+
+
+def build_shadow(connection_string, db_settings, version, schema, tap_schema=TAP_SCHEMA_NAME, workers=None):
+    """
+    Create and load the shadow schema of a version, with its TAP_SCHEMA.
+
+    Parameters
+    ----------
+    connection_string : str
+        SQLAlchemy connection string of the PostgreSQL database
+    db_settings : astrodb_utils.loaders.DatabaseSettings
+        Database settings, see `scripts.json_loader.read_settings`
+    version : str
+        Version of the database, see `data_version`
+    schema : str
+        Name of the live schema
+    tap_schema : str
+        Name of the live TAP_SCHEMA. Default: TAP_SCHEMA
+    workers : int
+        Number of parser processes. Default: None, uses the number of CPUs
+
+    Returns
+    -------
+    db : astrodbkit.astrodb.Database
+        Database connected to the shadow schema
+    counts : dict
+        Number of rows loaded into each table
+    """
+    shadow, shadow_tap = _versioned(schema, version), _versioned(tap_schema, version)
+    felis_schema = load_schema(db_settings.felis_path)
+
+    engine = create_engine(connection_string)
+    with engine.begin() as conn:
+        for name in (shadow, shadow_tap):
+            conn.execute(DropSchema(name, cascade=True, if_exists=True))
+        conn.execute(CreateSchema(shadow))
+        metadata = load_metadata(db_settings.felis_path)
+        metadata.create_all(conn.execution_options(schema_translate_map={felis_schema.name: shadow}))
+        _set_comment(conn, shadow, {"version": version, "built": _now()})
+        # The TAP metadata names the live schema, which is what the shadow becomes
+        sync_tap_schema(engine, felis_schema, shadow_tap, conn=conn)
+    engine.dispose()
+
+    logger.info(f"Loading {shadow}")
+    db = Database(connection_string, schema=shadow, lookup_tables=db_settings.lookup_tables)
+    counts = copy_load_database(db, db_settings.data_path, schema=shadow, workers=workers)
+    create_adopted_indexes(db, felis_path=db_settings.felis_path)
+    return db, counts
+
+
+def validate_shadow(db, counts, felis_path="schema.yaml"):
+    """
+    Check a shadow schema before it goes live.
+
+    Raises
+    ------
+    AstroDBError
+        If a table failed to load, any schema rule is violated, or a source does
+        not have exactly one adopted measurement
+    """
+    problems = []
+    if not counts.get(db._primary_table):
+        problems.append(f"{db._primary_table} is empty")
+    loaded = {name: db.query(db.metadata.tables[name]).count() for name in counts if name in db.metadata.tables}
+    problems += [f"{name}: {loaded[name]} rows, expected {n}" for name, n in counts.items() if loaded.get(name) != n]
+
+    failed = failed_rules(validate_database(db, felis_path=felis_path))
+    problems += [f"{row['table']}.{row['rule']}: {row['n_violations']} rows" for row in failed]
+    flagged = check_adopted(db, felis_path=felis_path)
+    problems += [f"{row['table']}: {row['source']} has {row['n_adopted']} adopted rows" for row in flagged]
+
+    if problems:
+        raise AstroDBError("Shadow schema failed validation:\n" + "\n".join(problems))
+
+
+def _drop_version(conn, schema, tap_schema, version):
+    for name in (_versioned(schema, version), _versioned(tap_schema, version)):
+        conn.execute(DropSchema(name, cascade=True, if_exists=True))
+
+
+def _swap(conn, schema, tap_schema, new_schema, new_tap):
+    """Retire the live schemas and rename new_schema and new_tap to the live names, in the transaction of conn"""
+    conn.execute(text(f"SET LOCAL lock_timeout = {int(LOCK_TIMEOUT_MS)}"))
+    live = _comment(conn, schema)
+    if live is not None:
+        old_version = live.get("version") or datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        retired_schema, retired_tap = _versioned(schema, old_version), _versioned(tap_schema, old_version)
+        _rename(conn, schema, retired_schema)
+        _set_comment(conn, retired_schema, dict(live, version=old_version, retired=_now()))
+        if _comment(conn, tap_schema) is not None:
+            _rename(conn, tap_schema, retired_tap)
+
+    info = _comment(conn, new_schema)
+    _rename(conn, new_schema, schema)
+    info.pop("retired", None)
+    _set_comment(conn, schema, dict(info, live_since=_now()))
+    _rename(conn, new_tap, tap_schema)
+
+
+def swap_in(engine, version, schema, tap_schema=TAP_SCHEMA_NAME, keep=KEEP_VERSIONS):
+    """
+    Make the shadow schemas of a version live, in one transaction, and drop old versions.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Engine of the PostgreSQL database
+    version : str
+        Version to make live; its shadow schemas must exist
+    schema : str
+        Name of the live schema
+    tap_schema : str
+        Name of the live TAP_SCHEMA. Default: TAP_SCHEMA
+    keep : int
+        Number of previous versions to keep for rollback. Default: 1
+    """
+    with engine.begin() as conn:
+        _swap(conn, schema, tap_schema, _versioned(schema, version), _versioned(tap_schema, version))
+    logger.info(f"Version {version} is live as {schema}")
+
+    retired = [row["version"] for row in list_versions(engine, schema, tap_schema) if not row["live"]]
+    with engine.begin() as conn:
+        for old_version in retired[keep:]:
+            logger.info(f"Dropping version {old_version}")
+            _drop_version(conn, schema, tap_schema, old_version)
+
+
+def rollback(engine, schema, tap_schema=TAP_SCHEMA_NAME, version=None):
+    """
+    Make a kept version live again; the current live version is kept in its place.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Engine of the PostgreSQL database
+    schema : str
+        Name of the live schema
+    tap_schema : str
+        Name of the live TAP_SCHEMA. Default: TAP_SCHEMA
+    version : str
+        Version to restore. Default: the most recently retired version
+
+    Returns
+    -------
+    version : str
+        Version made live
+    """
+    retired = [row["version"] for row in list_versions(engine, schema, tap_schema) if not row["live"]]
+    if version is None:
+        if not retired:
+            raise AstroDBError(f"No previous version of {schema} to roll back to")
+        version = retired[0]
+    elif version not in retired:
+        raise AstroDBError(f"Version {version} of {schema} not found; kept versions: {retired}")
+
+    with engine.begin() as conn:
+        _swap(conn, schema, tap_schema, _versioned(schema, version), _versioned(tap_schema, version))
+    logger.info(f"Rolled back {schema} to version {version}")
+    return version
+
+
+def blue_green_build(  # noqa: PLR0913
+    connection_string,
+    settings_file="database.toml",
+    *,
+    felis_path=None,
+    data_path=None,
+    schema=None,
+    tap_schema=TAP_SCHEMA_NAME,
+    keep=KEEP_VERSIONS,
+    workers=None,
+):
+    """
+    Build the current version in a shadow schema, validate it, and swap it in.
+
+    Parameters
+    ----------
+    connection_string : str
+        SQLAlchemy connection string of the PostgreSQL database
+    settings_file : str
+        Name of the TOML file containing the database settings. Default: database.toml
+    felis_path, data_path : str
+        Override the paths of the TOML file. Default: None
+    schema : str
+        Name of the live schema. Default: the name of the Felis schema
+    tap_schema : str
+        Name of the live TAP_SCHEMA. Default: TAP_SCHEMA
+    keep : int
+        Number of previous versions to keep for rollback. Default: 1
+    workers : int
+        Number of parser processes. Default: None, uses the number of CPUs
+
+    Returns
+    -------
+    version : str
+        Version that is live
+    """
+    db_settings = read_settings(settings_file, felis_path=felis_path, data_path=data_path)
+    if schema is None:
+        schema = read_schema_yaml(db_settings.felis_path)["name"]
+    version = data_version(db_settings)
+
+    engine = create_engine(connection_string)
+    try:
+        with engine.connect() as conn:
+            live = _comment(conn, schema)
+        if live is not None and live.get("version") == version:
+            logger.info(f"Version {version} is already live as {schema}")
+            return version
+
+        db, counts = build_shadow(connection_string, db_settings, version, schema, tap_schema, workers=workers)
+        try:
+            validate_shadow(db, counts, felis_path=db_settings.felis_path)
+        finally:
+            db.engine.dispose()
+        swap_in(engine, version, schema, tap_schema, keep=keep)
+    finally:
+        engine.dispose()
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the PostgreSQL database without downtime.")
+    parser.add_argument(
+        "settings_file",
+        nargs="?",
+        default="database.toml",
+        help="Name of the TOML file containing database settings (default: database.toml)",
+    )
+    parser.add_argument(
+        "--keep", type=int, default=KEEP_VERSIONS, help=f"Previous versions to keep (default: {KEEP_VERSIONS})"
+    )
+    parser.add_argument("--list", action="store_true", help="List the live and kept versions")
+    parser.add_argument("--rollback", nargs="?", const="", metavar="VERSION", help="Make a kept version live again")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv  # only needed on the command line
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    connection_string = os.environ.get("TEMPLATE_CONNECTION_STRING")
+    if connection_string is None:
+        print("TEMPLATE_CONNECTION_STRING is not set")
+        return 1
+
+    db_settings = read_settings(args.settings_file)
+    schema = read_schema_yaml(db_settings.felis_path)["name"]
+
+    if args.list or args.rollback is not None:
+        engine = create_engine(connection_string)
+        if args.rollback is not None:
+            rollback(engine, schema, version=args.rollback or None)
+        list_versions(engine, schema).pprint_all()
+        engine.dispose()
+        return 0
+
+    blue_green_build(connection_string, args.settings_file, keep=args.keep)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# Persistent cache of responses from external services (SIMBAD, SVO, ...)
+#
+# Responses are stored as JSON in an SQLite file, one table per service, with
+# the time they were fetched. Entries older than the time-to-live are treated
+# as missing, so only those are requested again. Caches can be exported to and
+# loaded from JSON fixture files, which lets the checks run fully offline.
+#
+# Usage:
+#     cache = ResponseCache(".astrodb_cache/responses.sqlite", "simbad", ttl=30 * 86400)
+#     fresh = cache.get_many(names)
+#     cache.put_many({name: fetch(name) for name in names if name not in fresh})
+
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from scripts.cache_utils import CACHE_DIRECTORY
+
+__all__ = [
+    "DEFAULT_CACHE_FILE",
+    "ResponseCache",
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = os.path.join(CACHE_DIRECTORY, "responses.sqlite")
+CHUNK_SIZE = 500
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of JSON-serializable responses keyed by string.
+
+    Parameters
+    ----------
+    path : str
+        SQLite file holding the cache, or ":memory:"
+    table : str
+        Name of the table for this service, eg simbad
+    ttl : float
+        Time-to-live of the entries in seconds. None means entries never expire. Default: None
+    """
+
+    def __init__(self, path, table, ttl=None):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" (key TEXT PRIMARY KEY, value TEXT, fetched_at REAL NOT NULL)'
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute(f'SELECT count(*) FROM "{self.table}"').fetchone()[0]
+
+    def get_many(self, keys, include_stale=False):
+        """
+        Cached responses for the given keys.
+
+        Parameters
+        ----------
+        keys : list of str
+            Keys to look up
+        include_stale : bool
+            Also return entries older than the time-to-live. Default: False
+
+        Returns
+        -------
+        responses : dict
+            Response for each key found in the cache
+        """
+        keys = list(dict.fromkeys(keys))
+        oldest = None if (self.ttl is None or include_stale) else time.time() - self.ttl
+        responses = {}
+        for i in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[i : i + CHUNK_SIZE]
+            query = f'SELECT key, value FROM "{self.table}" WHERE key IN ({",".join("?" * len(chunk))})'
+            parameters = list(chunk)
+            if oldest is not None:
+                query += " AND fetched_at >= ?"
+                parameters.append(oldest)
+            for key, value in self.conn.execute(query, parameters):
+                responses[key] = json.loads(value)
+        return responses
+
+    def fetched_at(self, keys):
+        """Time each cached key was fetched, as a Unix timestamp"""
+        keys = list(dict.fromkeys(keys))
+        times = {}
+        for i in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[i : i + CHUNK_SIZE]
+            query = f'SELECT key, fetched_at FROM "{self.table}" WHERE key IN ({",".join("?" * len(chunk))})'
+            times.update(self.conn.execute(query, chunk))
+        return times
+
+    def missing(self, keys):
+        """Keys without a fresh cache entry, in input order"""
+        found = self.get_many(keys)
+        return [key for key in dict.fromkeys(keys) if key not in found]
+
+    def put_many(self, responses, fetched_at=None):
+        """
+        Store responses.
+
+        Parameters
+        ----------
+        responses : dict
+            JSON-serializable response for each key
+        fetched_at : float
+            Unix time of the responses. Default: now
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self.conn:
+            self.conn.executemany(
+                f'INSERT OR REPLACE INTO "{self.table}" VALUES (?, ?, ?)',
+                ((key, json.dumps(value, sort_keys=True), fetched_at) for key, value in responses.items()),
+            )
+
+    def load_fixture(self, path):
+        """Load responses from a JSON fixture file (see `export`). Fixture entries never expire."""
+        with open(path, "r", encoding="utf-8") as f:
+            responses = json.load(f)
+        # Far in the future, so fixtures are always fresh
+        self.put_many(responses, fetched_at=float("inf"))
+        return len(responses)
+
+    def export(self, path):
+        """Write all cached responses to a JSON fixture file"""
+        rows = self.conn.execute(f'SELECT key, value FROM "{self.table}" ORDER BY key')
+        responses = {key: json.loads(value) for key, value in rows}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(responses, f, indent=4, sort_keys=True)
+            f.write("\n")
+        return len(responses)
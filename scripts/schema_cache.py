@@ -0,0 +1,215 @@
+# Cached loading of the Felis schema
+#
+# Parsing schema.yaml, validating it with Felis, and building its SQLAlchemy
+# MetaData takes a noticeable fraction of a second, and every tool used to do
+# it again. Here the YAML is parsed with the libyaml-based CSafeLoader (when
+# available) and the parsed data, the validated felis Schema, and the MetaData
+# are pickled together in .astrodb_cache/schema next to the schema file. The
+# cache file is keyed by a hash of the schema file and of the felis, pydantic,
+# and SQLAlchemy versions; within a process the pickles are also kept in memory,
+# keyed by the file's modification time and size. Each call unpickles a fresh
+# copy, so callers may modify what they get.
+#
+# Usage:
+#     from scripts.schema_cache import load_schema, load_metadata
+#     schema = load_schema("schema.yaml")  # felis.datamodel.Schema
+#     metadata = load_metadata("schema.yaml")  # sqlalchemy.MetaData
+#     python scripts/schema_cache.py [schema.yaml]  # refresh the cache
+
+import argparse
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import sys
+from importlib.metadata import version
+
+import yaml
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.cache_utils import CACHE_DIRECTORY  # noqa: E402
+
+__all__ = [
+    "create_schema_tables",
+    "load_metadata",
+    "load_schema",
+    "read_schema_yaml",
+]
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CACHE_VERSION = 1
+# Pickles are only valid for the versions of the packages that made them
+PICKLED_PACKAGES = ["lsst-felis", "pydantic", "SQLAlchemy"]
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_MEMORY = {}  # absolute path of the schema file: (mtime_ns, size, pickles)
+
+
+def _cache_key(content):
+    versions = "|".join([str(SCHEMA_CACHE_VERSION)] + [version(package) for package in PICKLED_PACKAGES])
+    return hashlib.sha256(versions.encode("utf-8") + content).hexdigest()[:16]
+
+
+def _parse(content):
+    """Pickles of the parsed data, the validated Schema, and the MetaData of a schema file"""
+    # felis takes about a second to import: only when the cache is missed (read_schema_yaml never needs it)
+    from felis.datamodel import Schema  # noqa: PLC0415
+    from felis.metadata import MetaDataBuilder  # noqa: PLC0415
+
+    data = yaml.load(content, Loader=YAML_LOADER)  # noqa: S506 (safe loader)
+    schema = Schema.model_validate(data)
+    metadata = MetaDataBuilder(schema).build()
+    return {
+        name: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        for name, value in (("data", data), ("schema", schema), ("metadata", metadata))
+    }
+
+
+def _read_cache(cache_file):
+    try:
+        with open(cache_file, "rb") as f:
+            pickles = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    return pickles if isinstance(pickles, dict) and set(pickles) == {"data", "schema", "metadata"} else None
+
+
+def _pickles(felis_path, cache_dir=None):
+    path = os.path.abspath(felis_path)
+    stat = os.stat(path)
+    memo = _MEMORY.get(path)
+    if memo is not None and memo[:2] == (stat.st_mtime_ns, stat.st_size):
+        return memo[2]
+
+    with open(path, "rb") as f:
+        content = f.read()
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path), CACHE_DIRECTORY, "schema")
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_file = os.path.join(cache_dir, f"{stem}.{_cache_key(content)}.pkl")
+
+    pickles = _read_cache(cache_file) if os.path.exists(cache_file) else None
+    if pickles is None:
+        logger.info(f"Parsing and validating {felis_path}")
+        pickles = _parse(content)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            pickle.dump(pickles, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+        for old_file in glob.glob(os.path.join(cache_dir, f"{glob.escape(stem)}.*.pkl")):
+            if old_file != cache_file:
+                try:
+                    os.remove(old_file)
+                except FileNotFoundError:
+                    pass  # removed by another process refreshing the cache at the same time
+
+    _MEMORY[path] = (stat.st_mtime_ns, stat.st_size, pickles)
+    return pickles
+
+
+def read_schema_yaml(felis_path="schema.yaml", cache_dir=None):
+    """
+    Contents of a Felis schema file, as parsed from the YAML.
+
+    Parameters
+    ----------
+    felis_path : str
+        Path to the Felis schema. Default: schema.yaml
+    cache_dir : str
+        Directory of the cache. Default: .astrodb_cache/schema next to the schema file
+
+    Returns
+    -------
+    data : dict
+        Parsed YAML
+    """
+    return pickle.loads(_pickles(felis_path, cache_dir)["data"])
+
+
+def load_schema(felis_path="schema.yaml", cache_dir=None):
+    """
+    Validated Felis schema, from the cache when the file has not changed.
+
+    Parameters
+    ----------
+    felis_path : str
+        Path to the Felis schema. Default: schema.yaml
+    cache_dir : str
+        Directory of the cache. Default: .astrodb_cache/schema next to the schema file
+
+    Returns
+    -------
+    schema : felis.datamodel.Schema
+        Validated schema
+
+    Raises
+    ------
+    pydantic.ValidationError
+        If the schema is not valid
+    """
+    return pickle.loads(_pickles(felis_path, cache_dir)["schema"])
+
+
+def load_metadata(felis_path="schema.yaml", cache_dir=None):
+    """
+    SQLAlchemy MetaData of a Felis schema (as built by felis.metadata.MetaDataBuilder), from the cache.
+
+    Parameters
+    ----------
+    felis_path : str
+        Path to the Felis schema. Default: schema.yaml
+    cache_dir : str
+        Directory of the cache. Default: .astrodb_cache/schema next to the schema file
+
+    Returns
+    -------
+    metadata : sqlalchemy.MetaData
+        Tables of the schema, qualified with the schema name
+    """
+    return pickle.loads(_pickles(felis_path, cache_dir)["metadata"])
+
+
+def create_schema_tables(connection_string, felis_path="schema.yaml"):
+    """
+    Create the tables of a Felis schema, as `astrodbkit.astrodb.create_database` does, from the cached MetaData.
+
+    Parameters
+    ----------
+    connection_string : str
+        Connection string of the database
+    felis_path : str
+        Path to the Felis schema. Default: schema.yaml
+    """
+    from sqlalchemy import create_engine, text  # noqa: PLC0415
+    from sqlalchemy.schema import CreateSchema  # noqa: PLC0415
+
+    metadata = load_metadata(felis_path)
+    schema_name = read_schema_yaml(felis_path)["name"]
+    engine = create_engine(connection_string)
+    try:
+        with engine.begin() as conn:
+            if engine.dialect.name == "sqlite":
+                # Tables are qualified with the schema name: attach the file under that name
+                conn.execute(text(f"ATTACH '{engine.url.database}' AS {schema_name}"))
+            elif engine.dialect.name == "postgresql":
+                conn.execute(CreateSchema(schema_name, if_not_exists=True))
+            metadata.create_all(conn)
+    finally:
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse and validate a Felis schema and cache the result.")
+    parser.add_argument("felis_path", nargs="?", default="schema.yaml", help="Felis schema (default: schema.yaml)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    schema = load_schema(args.felis_path)
+    print(f"{args.felis_path}: {len(schema.tables)} tables")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
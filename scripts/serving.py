@@ -0,0 +1,294 @@
+# Read-only serving mode for the SQLite database file
+#
+# Web and notebook processes that only query the database open it as
+# `scripts.db_snapshot.read_only_database` does (mode=ro&immutable=1: no locks,
+# no change checks), and every pooled connection is set up for reading:
+#   - PRAGMA mmap_size: pages are read from the memory-mapped file, so the OS page
+#     cache is shared by every connection and process instead of each copying pages
+#   - PRAGMA cache_size: page cache of each connection, for what is not memory-mapped
+#   - PRAGMA query_only: any write fails, whatever the URI
+# The pool keeps pool_size connections, opened and warmed up (schema parsed)
+# before the database is returned.
+# `prewarm` reads the hot tables and their indexes once, so the first queries of
+# every process are served from memory; `lookup_latency` measures p50/p99
+# latencies of Sources and Photometry lookups from concurrent processes.
+#
+# Usage:
+#     from scripts.serving import serving_database
+#     db = serving_database("astrodb-template.sqlite")
+#     python scripts/serving.py prewarm [--db-name NAME] [--tables Sources Names Photometry]
+#     python scripts/serving.py benchmark [--db-name NAME] [--processes 4] [--queries 4000]
+
+import argparse
+import logging
+import random
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astrodbkit.astrodb import Database
+from astropy.table import Table as AstropyTable
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.db_snapshot import read_only_database, sqlite_uri, sqlite_url  # noqa: E402
+from scripts.json_loader import read_settings  # noqa: E402
+
+__all__ = [
+    "HOT_TABLES",
+    "LOOKUPS",
+    "lookup_latency",
+    "prewarm",
+    "serving_database",
+]
+
+logger = logging.getLogger(__name__)
+
+MMAP_SIZE = 1024**3  # bytes of the file memory-mapped by each connection (address space, not memory)
+CACHE_SIZE = 64 * 1024  # KiB of page cache per connection
+POOL_SIZE = 8
+POOL_TIMEOUT = 30  # seconds to wait for a free connection
+PROCESSES = 4  # concurrent processes of the latency benchmark
+HOT_TABLES = ["Sources", "Names", "Photometry"]
+# Typical lookups of a source by its name
+LOOKUPS = {
+    "Sources": 'SELECT * FROM "Sources" WHERE source = ?',
+    "Photometry": 'SELECT * FROM "Photometry" WHERE source = ?',
+}
+
+
+def _serving_pragmas(mmap_size, cache_size):
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={-int(cache_size)}")  # negative: in KiB
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return connect
+
+
+def serving_database(  # noqa: PLR0913
+    db_file,
+    lookup_tables=None,
+    *,
+    mmap_size=MMAP_SIZE,
+    cache_size=CACHE_SIZE,
+    pool_size=POOL_SIZE,
+    pool_timeout=POOL_TIMEOUT,
+):
+    """
+    Read-only database for serving queries, with a pool of connections tuned for reading.
+
+    The file must not change while it is open (see `scripts.db_snapshot.read_only_database`);
+    to publish a new version, replace the file and open it again.
+
+    Parameters
+    ----------
+    db_file : str
+        Path of the SQLite database file, eg astrodb-template.sqlite
+    lookup_tables : list
+        Lookup tables of the database. Default: None, reads from database.toml
+    mmap_size : int
+        Bytes of the file to memory-map (PRAGMA mmap_size). Default: 1 GiB
+    cache_size : int
+        KiB of page cache per connection (PRAGMA cache_size). Default: 64 MiB
+    pool_size : int
+        Number of connections kept open, which is also the maximum number of
+        concurrent queries. Default: 8
+    pool_timeout : float
+        Seconds to wait for a free connection before raising an error. Default: 30
+
+    Returns
+    -------
+    db : astrodbkit.astrodb.Database
+        Database whose pool_size connections are open and warmed up
+    """
+    db = read_only_database(db_file, lookup_tables=lookup_tables)
+    uri = sqlite_uri(db_file, mode="ro", immutable=1)
+    engine = create_engine(
+        sqlite_url(uri),
+        creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=pool_timeout,
+    )
+    event.listen(engine, "connect", _serving_pragmas(mmap_size, cache_size))
+    # Serve the astrodbkit Database (tables already reflected) from the pooled engine
+    db.engine.dispose()
+    db.engine = engine
+    db.session.bind = engine
+
+    # Open every connection now, and make each parse the schema, rather than on the first queries
+    connections = [db.engine.connect() for _ in range(pool_size)]
+    for conn in connections:
+        conn.exec_driver_sql("SELECT count(*) FROM sqlite_master").scalar()
+        conn.close()
+    return db
+
+
+def prewarm(db, tables=None):
+    """
+    Read every page of tables and of their indexes, to load them in the OS page cache.
+
+    With memory-mapped reads the OS page cache is shared by every process
+    opening the file, so running this once (eg, `python scripts/serving.py
+    prewarm` after deploying the file) warms every serving process.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        SQLite database
+    tables : list
+        Tables to read. Default: None, HOT_TABLES
+
+    Returns
+    -------
+    report : astropy.table.Table
+        Table, index ("" for the table itself), number of rows read, and seconds taken
+    """
+    rows = []
+    with db.engine.connect() as conn:
+        for table in tables or HOT_TABLES:
+            if table not in db.metadata.tables:
+                raise KeyError(f"Table not in the database: {table}")
+            start = time.perf_counter()
+            n_rows = sum(1 for _ in conn.exec_driver_sql(f'SELECT * FROM "{table}"'))
+            rows.append((table, "", n_rows, time.perf_counter() - start))
+            for _, index, _, _, partial in conn.exec_driver_sql(f'PRAGMA index_list("{table}")').all():
+                if partial:
+                    continue  # only usable by queries implying its WHERE clause
+                start = time.perf_counter()
+                n_rows = conn.exec_driver_sql(f'SELECT count(*) FROM "{table}" INDEXED BY "{index}"').scalar()
+                rows.append((table, index, n_rows, time.perf_counter() - start))
+    return AstropyTable(rows=rows, names=["table", "index", "rows", "seconds"], dtype=[str, str, int, float])
+
+
+def _open(db_file, serving, lookup_tables):
+    if serving:
+        return serving_database(db_file, lookup_tables=lookup_tables, pool_size=1)
+    return Database("sqlite:///" + db_file, lookup_tables=lookup_tables)
+
+
+def _timed_lookups(db_file, serving, lookup_tables, sql, params):
+    """Latencies of the queries run by one process, each on a connection checked out of the pool"""
+    db = _open(db_file, serving, lookup_tables)
+    latencies = []
+    try:
+        start = time.perf_counter()
+        for param in params:
+            query_start = time.perf_counter()
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql(sql, param).all()
+            latencies.append(time.perf_counter() - query_start)
+        return latencies, time.perf_counter() - start
+    finally:
+        db.engine.dispose()
+
+
+def lookup_latency(  # noqa: PLR0913
+    db_file,
+    serving=True,
+    lookup_tables=None,
+    lookups=None,
+    processes=PROCESSES,
+    queries=4000,
+    seed=0,
+):
+    """
+    Latency of source lookups run concurrently by several processes, each opening the database.
+
+    Parameters
+    ----------
+    db_file : str
+        Path of the SQLite database file
+    serving : bool
+        Open the database with `serving_database`; with False, with default settings. Default: True
+    lookup_tables : list
+        Lookup tables of the database. Default: None, reads from database.toml
+    lookups : list
+        Names of LOOKUPS to run. Default: None, all of them
+    processes : int
+        Number of concurrent processes. Default: 4
+    queries : int
+        Number of queries of each lookup, for random sources of the database. Default: 4000
+    seed : int
+        Seed of the random choice of sources. Default: 0
+
+    Returns
+    -------
+    latencies : astropy.table.Table
+        Lookup, number of queries, p50, p99, and maximum latency in milliseconds,
+        and queries per second of all processes together
+    """
+    if lookup_tables is None:
+        lookup_tables = read_settings().lookup_tables
+    with sqlite3.connect(sqlite_uri(db_file, mode="ro"), uri=True) as conn:
+        sources = [source for (source,) in conn.execute('SELECT source FROM "Sources"')]
+    if not sources:
+        raise ValueError("No sources to look up")
+    rng = random.Random(seed)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for name in lookups or list(LOOKUPS):
+            params = [(rng.choice(sources),) for _ in range(queries)]
+            futures = [
+                executor.submit(_timed_lookups, db_file, serving, lookup_tables, LOOKUPS[name], params[i::processes])
+                for i in range(processes)
+            ]
+            results = [future.result() for future in futures]
+            latencies = np.concatenate([times for times, _ in results]) * 1000
+            elapsed = max(seconds for _, seconds in results)
+            p50, p99 = np.percentile(latencies, [50, 99])
+            rows.append((name, queries, p50, p99, latencies.max(), queries / elapsed))
+    return AstropyTable(
+        rows=rows,
+        names=["lookup", "queries", "p50_ms", "p99_ms", "max_ms", "qps"],
+        dtype=[str, int, float, float, float, float],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prewarm or benchmark the database opened for read-only serving.")
+    parser.add_argument("action", choices=["prewarm", "benchmark"], help="Read the hot tables, or time lookups")
+    parser.add_argument(
+        "--db-name",
+        default=None,
+        help="Name of the SQLite database, without the .sqlite extension (default: from database.toml)",
+    )
+    parser.add_argument("--tables", nargs="+", help=f"Tables to prewarm (default: {' '.join(HOT_TABLES)})")
+    parser.add_argument(
+        "--processes", type=int, default=PROCESSES, help=f"Concurrent benchmark processes (default: {PROCESSES})"
+    )
+    parser.add_argument("--queries", type=int, default=4000, help="Queries per lookup (default: 4000)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db_settings = read_settings(db_name=args.db_name)
+    db_file = db_settings.db_name + ".sqlite"
+    if args.action == "prewarm":
+        db = serving_database(db_file, lookup_tables=db_settings.lookup_tables, pool_size=1)
+        prewarm(db, args.tables).pprint_all()
+        db.engine.dispose()
+        return 0
+
+    # Default settings, as every process opened the file before, against the serving mode
+    for serving in (False, True):
+        print("\nserving:" if serving else "\ndefault:")
+        lookup_latency(
+            db_file,
+            serving=serving,
+            lookup_tables=db_settings.lookup_tables,
+            processes=args.processes,
+            queries=args.queries,
+        ).pprint_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+# Batch SIMBAD identifier validation with a local response cache
+#
+# The main_id and ids of each name are cached in .astrodb_cache/responses.sqlite
+# (see scripts/response_cache.py). Only names without a fresh cache entry are
+# sent to SIMBAD, in chunks queried in parallel. All SIMBAD identifiers are then
+# checked against Sources and Names with one join on the normalized name index
+# (scripts/name_index.py), instead of one database query per object.
+#
+# Usage:
+#     python scripts/simbad_check.py [--offline] [--fixture FILE] [--record FILE]
+
+import argparse
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from astrodb_utils import read_db_from_file
+from astrodbkit.utils import _name_formatter
+from astropy.table import Table as AstropyTable
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.name_index import NameIndex  # noqa: E402
+from scripts.response_cache import DEFAULT_CACHE_FILE, ResponseCache  # noqa: E402
+
+__all__ = [
+    "check_simbad_names",
+    "fetch_simbad",
+    "resolve_simbad",
+]
+
+logger = logging.getLogger(__name__)
+
+CACHE_TABLE = "simbad"
+CACHE_TTL = 30 * 86400  # the scheduled checks run monthly
+CHUNK_SIZE = 200
+WORKERS = 4  # stay well below the SIMBAD rate limit
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return str(value)
+
+
+def _query_chunk(names):
+    # Imported here so the offline checks do not need astroquery
+    from astroquery.simbad import Simbad
+
+    simbad = Simbad()
+    simbad.add_votable_fields("ids")
+    results = simbad.query_objects(names)
+
+    responses = {name: None for name in names}
+    if results is None:
+        return responses
+    for row in results:
+        main_id = row["main_id"]
+        if getattr(main_id, "mask", False) or _decode(main_id) == "":
+            continue
+        if "user_specified_id" in results.colnames:
+            name = _decode(row["user_specified_id"])
+        else:
+            name = names[int(row["object_number"]) - 1]
+        responses[name] = {"main_id": _decode(main_id), "ids": _decode(row["ids"]).split("|")}
+    return responses
+
+
+def fetch_simbad(names, chunk_size=CHUNK_SIZE, workers=WORKERS):
+    """
+    Query SIMBAD for the main identifier and all identifiers of each name.
+
+    Parameters
+    ----------
+    names : list of str
+        Names to query
+    chunk_size : int
+        Number of names per SIMBAD query. Default: 200
+    workers : int
+        Number of queries run in parallel. Default: 4
+
+    Returns
+    -------
+    responses : dict
+        {"main_id": str, "ids": list of str} for each name, or None when SIMBAD does not know it
+    """
+    names = list(dict.fromkeys(names))
+    chunks = [names[i : i + chunk_size] for i in range(0, len(names), chunk_size)]
+    responses = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as executor:
+        for chunk_responses in executor.map(_query_chunk, chunks):
+            responses.update(chunk_responses)
+    return responses
+
+
+def resolve_simbad(names, cache=None, offline=False, chunk_size=CHUNK_SIZE, workers=WORKERS):
+    """
+    SIMBAD identifiers of each name, fetching only names missing from the cache.
+
+    Parameters
+    ----------
+    names : list of str
+        Names to resolve
+    cache : ResponseCache
+        Cache of SIMBAD responses. Default: the simbad table of .astrodb_cache/responses.sqlite
+    offline : bool
+        Never query SIMBAD; names missing from the cache resolve to None. Default: False
+    chunk_size, workers : int
+        See `fetch_simbad`
+
+    Returns
+    -------
+    responses : dict
+        {"main_id": str, "ids": list of str} or None for each name
+    """
+    own_cache = cache is None
+    if own_cache:
+        cache = ResponseCache(DEFAULT_CACHE_FILE, CACHE_TABLE, ttl=CACHE_TTL)
+
+    names = list(dict.fromkeys(names))
+    try:
+        responses = cache.get_many(names)
+        missing = [name for name in names if name not in responses]
+        if missing and offline:
+            logger.warning(f"{len(missing)} name(s) not in the SIMBAD cache: {missing}")
+        elif missing:
+            logger.info(f"Querying SIMBAD for {len(missing)} of {len(names)} name(s)")
+            fetched = fetch_simbad(missing, chunk_size=chunk_size, workers=workers)
+            cache.put_many(fetched)
+            responses.update(fetched)
+    finally:
+        if own_cache:
+            cache.close()
+    return {name: responses.get(name) for name in names}
+
+
+def check_simbad_names(db, responses):
+    """
+    Check that the SIMBAD identifiers of each object match exactly one source.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to check against
+    responses : dict
+        SIMBAD response for each name, as returned by `resolve_simbad`
+
+    Returns
+    -------
+    report : astropy.table.Table
+        One row per name with the SIMBAD main_id, the number of SIMBAD names,
+        the matching sources, and a status: unique, duplicate, no_db_match or no_simbad
+    """
+    names = list(responses)
+    simbad_names = []
+    for name in names:
+        response = responses[name] or {"ids": []}
+        formatted = (_name_formatter(s) for s in response["ids"])
+        simbad_names.append([s for s in formatted if s != "" and s is not None])
+
+    index = NameIndex.for_database(db)
+    try:
+        matches = index.resolve_sets(simbad_names)
+    finally:
+        index.close()
+
+    status = []
+    for ids, sources in zip(simbad_names, matches):
+        if len(ids) == 0:
+            status.append("no_simbad")
+        elif len(sources) == 0:
+            status.append("no_db_match")
+        elif len(sources) > 1:
+            status.append("duplicate")
+        else:
+            status.append("unique")
+
+    return AstropyTable(
+        [
+            names,
+            [(responses[name] or {}).get("main_id", "") for name in names],
+            [len(ids) for ids in simbad_names],
+            ["|".join(sources) for sources in matches],
+            status,
+        ],
+        names=["name", "main_id", "n_ids", "sources", "status"],
+        dtype=[str, str, int, str, str],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every source has a SIMBAD-resolvable name.")
+    parser.add_argument(
+        "--db-name",
+        default="astrodb-template",
+        help="Name of the SQLite database, without the .sqlite extension (default: astrodb-template)",
+    )
+    parser.add_argument("--offline", action="store_true", help="Only use cached SIMBAD responses")
+    parser.add_argument("--fixture", help="JSON fixture of SIMBAD responses to load into the cache first")
+    parser.add_argument("--record", help="Write the cached SIMBAD responses to a JSON fixture file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = read_db_from_file(args.db_name)
+    cache = ResponseCache(DEFAULT_CACHE_FILE, CACHE_TABLE, ttl=CACHE_TTL)
+    if args.fixture:
+        cache.load_fixture(args.fixture)
+
+    names = [row[0] for row in db.query(db.Sources.c.source).all()]
+    report = check_simbad_names(db, resolve_simbad(names, cache=cache, offline=args.offline))
+    if args.record:
+        cache.export(args.record)
+    cache.close()
+
+    report.pprint_all()
+    return 0 if all(report["status"] == "unique") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+# Cached, concurrent lookups of photometry filters in the SVO Filter Profile Service
+#
+# SVO responses are reduced to the PhotometryFilters columns (filter ID,
+# effective wavelength and effective width in Angstroms) and cached per band in
+# .astrodb_cache/responses.sqlite (see scripts/response_cache.py). Bands missing
+# from the cache are fetched by a bounded thread pool with one HTTP session per
+# thread. A band that fails (HTTP error, unexpected units, unreachable service)
+# gets an {"error": ...} response instead of stopping the other lookups, and is
+# not cached. The service URL can point to a local stand-in server, and the
+# cache can be filled from a JSON fixture to run fully offline.
+#
+# Usage:
+#     from scripts.svo_filters import filter_columns
+#     db.PhotometryFilters.insert().values(ucd="em.IR.H", **filter_columns("2MASS/2MASS.H"))
+# or
+#     python scripts/svo_filters.py [--offline] [--fixture FILE] [--record FILE] [--url URL]
+
+import argparse
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import requests
+from astrodb_utils import AstroDBError, read_db_from_file
+from astropy.io.votable import parse
+from astropy.table import Table as AstropyTable
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.response_cache import DEFAULT_CACHE_FILE, ResponseCache  # noqa: E402
+
+__all__ = [
+    "SVO_URL",
+    "check_filters",
+    "fetch_filters",
+    "filter_columns",
+    "resolve_filters",
+]
+
+logger = logging.getLogger(__name__)
+
+SVO_URL = "http://svo2.cab.inta-csic.es/svo/theory/fps3/fps.php"
+CACHE_TABLE = "svo"
+CACHE_TTL = 180 * 86400  # filter profiles rarely change
+WORKERS = 8
+TIMEOUT = 30  # seconds
+RELATIVE_TOLERANCE = 1e-4  # database values are rounded SVO values
+COMPARED_COLUMNS = ["effective_wavelength_angstroms", "width_angstroms"]
+
+_sessions = threading.local()
+
+
+def _session():
+    if not hasattr(_sessions, "session"):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def _parse_votable(content, band):
+    """Filter ID, effective wavelength and effective width from an SVO VOTable, or None if not found"""
+    votable = parse(BytesIO(content))
+    try:
+        filter_id = votable.get_field_by_id("filterID").value
+    except KeyError:
+        return None
+
+    wave_eff = votable.get_field_by_id("WavelengthEff")
+    width_effective = votable.get_field_by_id("WidthEff")
+    if wave_eff.unit != "AA" or width_effective.unit != "AA":
+        raise AstroDBError(
+            f"Wavelengths from SVO for {band} may not be Angstroms as expected: "
+            f"{wave_eff.unit}, {width_effective.unit}."
+        )
+
+    if isinstance(filter_id, bytes):
+        filter_id = filter_id.decode("utf-8")
+    return {
+        "filter_id": str(filter_id),
+        "effective_wavelength_angstroms": float(wave_eff.value),
+        "width_angstroms": float(width_effective.value),
+    }
+
+
+def _fetch_filter(band, url, timeout):
+    try:
+        response = _session().get(url, params={"ID": band}, timeout=timeout)
+        if response.status_code != 200:
+            raise AstroDBError(f"Error retrieving {response.url}. Status code: {response.status_code}")
+        return _parse_votable(response.content, band)
+    except (AstroDBError, ValueError, requests.exceptions.RequestException) as e:  # ValueError: invalid VOTable
+        logger.warning(f"SVO lookup of {band} failed: {e}")
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def _failed(response):
+    return response is not None and "error" in response
+
+
+def fetch_filters(bands, url=SVO_URL, workers=WORKERS, timeout=TIMEOUT):
+    """
+    Fetch filters from the SVO Filter Profile Service in parallel.
+
+    Parameters
+    ----------
+    bands : list of str
+        SVO filter IDs, in the "Facility/Instrument.Filter" convention used by PhotometryFilters.band
+    url : str
+        URL of the service, or of a local stand-in. Default: SVO_URL
+    workers : int
+        Maximum number of concurrent requests. Default: 8
+    timeout : float
+        Timeout of each request in seconds. Default: 30
+
+    Returns
+    -------
+    responses : dict
+        filter_id, effective_wavelength_angstroms and width_angstroms for each band,
+        None when SVO does not know the band, or {"error": message} when the lookup
+        failed (service error or unreachable, units not Angstroms)
+    """
+    bands = list(dict.fromkeys(bands))
+    if len(bands) == 0:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(bands)))) as executor:
+        results = executor.map(lambda band: _fetch_filter(band, url, timeout), bands)
+        return dict(zip(bands, results))
+
+
+def resolve_filters(bands, cache=None, offline=False, url=SVO_URL, workers=WORKERS, timeout=TIMEOUT):
+    """
+    SVO information of each band, fetching only bands missing from the cache.
+
+    Parameters
+    ----------
+    bands : list of str
+        SVO filter IDs
+    cache : ResponseCache
+        Cache of SVO responses. Default: the svo table of .astrodb_cache/responses.sqlite
+    offline : bool
+        Never query SVO; bands missing from the cache resolve to None. Default: False
+    url, workers, timeout
+        See `fetch_filters`
+
+    Returns
+    -------
+    responses : dict
+        See `fetch_filters`
+    """
+    own_cache = cache is None
+    if own_cache:
+        cache = ResponseCache(DEFAULT_CACHE_FILE, CACHE_TABLE, ttl=CACHE_TTL)
+
+    bands = list(dict.fromkeys(bands))
+    try:
+        responses = cache.get_many(bands)
+        missing = [band for band in bands if band not in responses]
+        if missing and offline:
+            logger.warning(f"{len(missing)} band(s) not in the SVO cache: {missing}")
+        elif missing:
+            logger.info(f"Querying SVO for {len(missing)} of {len(bands)} band(s)")
+            fetched = fetch_filters(missing, url=url, workers=workers, timeout=timeout)
+            cache.put_many({band: response for band, response in fetched.items() if not _failed(response)})
+            responses.update(fetched)
+    finally:
+        if own_cache:
+            cache.close()
+    return {band: responses.get(band) for band in bands}
+
+
+def filter_columns(band, cache=None, offline=False, url=SVO_URL):
+    """
+    PhotometryFilters column values for a band, from the cache or SVO.
+
+    Parameters
+    ----------
+    band : str
+        SVO filter ID, eg 2MASS/2MASS.H
+    cache, offline, url
+        See `resolve_filters`
+
+    Returns
+    -------
+    columns : dict
+        band, effective_wavelength_angstroms and width_angstroms
+
+    Raises
+    ------
+    AstroDBError
+        If the band is not found in SVO, or the lookup failed
+    """
+    response = resolve_filters([band], cache=cache, offline=offline, url=url)[band]
+    if response is None:
+        raise AstroDBError(f"Filter {band} not found in SVO.")
+    if _failed(response):
+        raise AstroDBError(f"SVO lookup of {band} failed: {response['error']}")
+    return {
+        "band": response["filter_id"],
+        "effective_wavelength_angstroms": response["effective_wavelength_angstroms"],
+        "width_angstroms": response["width_angstroms"],
+    }
+
+
+def _matches(row, response):
+    """Whether the values of a PhotometryFilters row agree with the SVO response"""
+    for column in COMPARED_COLUMNS:
+        value, svo_value = row[column], response.get(column)
+        if value is None or svo_value is None or np.ma.is_masked(value):
+            return False
+        if abs(float(value) - float(svo_value)) > RELATIVE_TOLERANCE * abs(float(svo_value)):
+            return False
+    return True
+
+
+def check_filters(db, responses):
+    """
+    Compare PhotometryFilters with SVO.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to check
+    responses : dict
+        SVO response for each band, as returned by `resolve_filters`
+
+    Returns
+    -------
+    report : astropy.table.Table
+        One row per band with the database and SVO effective wavelengths and widths,
+        whether the band was found in SVO, whether both values agree with SVO
+        within RELATIVE_TOLERANCE, and the error of failed lookups
+    """
+    filters = db.query(db.PhotometryFilters).table()
+    svo = [responses.get(band) or {} for band in filters["band"]]
+    return AstropyTable(
+        [
+            filters["band"],
+            [len(r) > 0 and "error" not in r for r in svo],
+            [_matches(row, r) for row, r in zip(filters, svo)],
+            [r.get("error") for r in svo],
+            filters["effective_wavelength_angstroms"],
+            [r.get("effective_wavelength_angstroms") for r in svo],
+            filters["width_angstroms"],
+            [r.get("width_angstroms") for r in svo],
+        ],
+        names=[
+            "band",
+            "in_svo",
+            "matches_svo",
+            "error",
+            "effective_wavelength_angstroms",
+            "svo_effective_wavelength_angstroms",
+            "width_angstroms",
+            "svo_width_angstroms",
+        ],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every PhotometryFilters band is a valid SVO filter.")
+    parser.add_argument(
+        "--db-name",
+        default="astrodb-template",
+        help="Name of the SQLite database, without the .sqlite extension (default: astrodb-template)",
+    )
+    parser.add_argument("--url", default=SVO_URL, help=f"URL of the SVO service or a stand-in (default: {SVO_URL})")
+    parser.add_argument("--offline", action="store_true", help="Only use cached SVO responses")
+    parser.add_argument("--fixture", help="JSON fixture of SVO responses to load into the cache first")
+    parser.add_argument("--record", help="Write the cached SVO responses to a JSON fixture file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = read_db_from_file(args.db_name)
+    cache = ResponseCache(DEFAULT_CACHE_FILE, CACHE_TABLE, ttl=CACHE_TTL)
+    if args.fixture:
+        cache.load_fixture(args.fixture)
+
+    bands = [row[0] for row in db.query(db.PhotometryFilters.c.band).all()]
+    report = check_filters(db, resolve_filters(bands, cache=cache, offline=args.offline, url=args.url))
+    if args.record:
+        cache.export(args.record)
+    cache.close()
+
+    report.pprint_all()
+    for band in report["band"][report["in_svo"] & ~report["matches_svo"]]:
+        logger.warning(f"{band}: values differ from SVO")
+    return 0 if all(report["in_svo"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+# Synthetic source JSON files at scale, for benchmarks
+#
+# Each synthetic source starts from one of the real source files in
+# data/source (the templates), so tables such as Names or ModeledParameters keep
+# a realistic shape. The schema drives what is changed:
+#   - the primary key of Sources and the aliases in Names are made unique
+#     ("Synthetic 0000042", "Synthetic 0000042 1", ...),
+#   - every table with ra_deg/dec_deg columns gets the coordinates of the source,
+#     drawn uniformly on the sky,
+#   - every foreign key to a lookup table that is not part of the primary key
+#     (and does not overlap another foreign key) is redrawn from the values in
+#     data/reference, so the rows spread over the lookup tables.
+# Tables that no template has rows for (eg, Photometry) are generated from the
+# column types: foreign keys are drawn from the lookup tables, numbers within
+# the bounds of the Check constraints, and the first row of a source is the
+# adopted one. The lookup tables are copied unchanged next to the source files.
+#
+# Usage:
+#     python scripts/synthetic_data.py OUTPUT_PATH --n-sources 100000 [--seed 0]
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import shutil
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.cone_search import DEC_COLUMN, RA_COLUMN  # noqa: E402
+from scripts.dirty_save import source_filename  # noqa: E402
+from scripts.json_loader import (  # noqa: E402
+    REFERENCE_DIRECTORY,
+    SOURCE_DIRECTORY,
+    read_settings,
+    reference_file,
+    source_files,
+)
+from scripts.schema_cache import load_schema  # noqa: E402
+
+__all__ = [
+    "ROWS_PER_SOURCE",
+    "generate_data",
+    "source_name",
+]
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_TABLE = "Sources"
+PRIMARY_TABLE_KEY = "source"
+ALIAS_TABLE = "Names"
+ALIAS_COLUMN = "other_name"
+ADOPTED_COLUMN = "adopted"
+NAME_PREFIX = "Synthetic"
+ROWS_PER_SOURCE = {"Photometry": 5}  # rows of each generated table per source, default 1
+MAX_DRAWS = 10  # attempts at drawing a row with a new primary key
+FIRST_DATE = datetime(2000, 1, 1)
+BOUND_PATTERN = re.compile(r"(\w+)\s*(>=|>|<=|<)\s*(-?\d+(?:\.\d*)?)")
+
+TablePlan = namedtuple("TablePlan", ["name", "columns", "primary_key", "foreign_keys", "redrawn", "bounds"])
+TablePlan.__doc__ = "How to generate the rows of a table: columns are (name, datatype, required) tuples"
+
+
+def source_name(i):
+    """Name of the i-th synthetic source"""
+    return f"{NAME_PREFIX} {i:07d}"
+
+
+def _column_name(column_id):
+    # Felis column ids look like #Photometry.band
+    return column_id.split(".")[-1]
+
+
+def _bounds(table):
+    """Lower and upper bounds of numeric columns, from the Check constraints of a table"""
+    bounds = {}
+    for constraint in table.constraints:
+        if constraint.type != "Check":
+            continue
+        for column, operator, value in BOUND_PATTERN.findall(constraint.expression):
+            lower, upper = bounds.get(column, (None, None))
+            if operator.startswith(">"):
+                lower = float(value)
+            else:
+                upper = float(value)
+            bounds[column] = (lower, upper)
+    return bounds
+
+
+def _plans(schema, lookup_rows):
+    """TablePlan of each table of the schema that is not a lookup table"""
+    plans = {}
+    for table in schema.tables:
+        if table.name in lookup_rows:
+            continue
+        primary_key = table.primary_key if isinstance(table.primary_key, list) else [table.primary_key]
+        primary_key = tuple(_column_name(column) for column in primary_key if column)
+
+        foreign_keys = []
+        for constraint in table.constraints:
+            if constraint.type != "ForeignKey":
+                continue
+            referenced_table = constraint.referenced_columns[0].lstrip("#").split(".")[0]
+            if referenced_table not in lookup_rows:
+                continue
+            columns = tuple(_column_name(column) for column in constraint.columns)
+            referenced = tuple(_column_name(column) for column in constraint.referenced_columns)
+            values = sorted(
+                {tuple(row.get(column) for column in referenced) for row in lookup_rows[referenced_table]},
+                key=str,
+            )
+            if values:
+                foreign_keys.append((columns, values))
+        foreign_keys.sort(key=lambda foreign_key: -len(foreign_key[0]))
+
+        usage = {}
+        for columns, _ in foreign_keys:
+            for column in columns:
+                usage[column] = usage.get(column, 0) + 1
+        redrawn = [
+            (columns, values)
+            for columns, values in foreign_keys
+            if not set(primary_key) & set(columns) and all(usage[column] == 1 for column in columns)
+        ]
+
+        columns = [
+            (column.name, column.datatype, column.nullable is False or column.name in primary_key)
+            for column in table.columns
+        ]
+        plans[table.name] = TablePlan(table.name, columns, primary_key, foreign_keys, redrawn, _bounds(table))
+    return plans
+
+
+def _template_rows(plan, rows, name, ra, dec, rng):
+    new_rows = []
+    for k, row in enumerate(rows):
+        row = dict(row)
+        if plan.name == PRIMARY_TABLE or PRIMARY_TABLE_KEY in row:
+            row[PRIMARY_TABLE_KEY] = name
+        if plan.name == ALIAS_TABLE:
+            row[ALIAS_COLUMN] = name if k == 0 else f"{name} {k}"
+        if RA_COLUMN in row and DEC_COLUMN in row:
+            row[RA_COLUMN], row[DEC_COLUMN] = ra, dec
+        for columns, values in plan.redrawn:
+            row.update(zip(columns, rng.choice(values)))
+        new_rows.append(row)
+    return new_rows
+
+
+def _value(plan, column, datatype, required, k, rng):
+    if datatype in ("double", "float", "int", "long", "short"):
+        lower, upper = plan.bounds.get(column, (None, None))
+        lower = 0.0 if lower is None else lower
+        upper = lower + 1.0 if upper is None else upper
+        value = rng.uniform(lower, upper)
+        return round(value) if datatype in ("int", "long", "short") else round(value, 4)
+    if datatype == "boolean":
+        return k == 0 if column == ADOPTED_COLUMN else rng.random() < 0.5
+    if datatype == "timestamp":
+        return (FIRST_DATE + timedelta(days=k)).isoformat()
+    return f"{column} {k}" if required else None
+
+
+def _generated_rows(plan, n_rows, name, ra, dec, rng):
+    # Rows without the source column, as in the JSON files written by astrodbkit
+    rows, keys = [], set()
+    for k in range(n_rows):
+        for _ in range(MAX_DRAWS):
+            row = {}
+            for columns, values in plan.foreign_keys:
+                if not set(columns) & set(row):
+                    row.update(zip(columns, rng.choice(values)))
+            key = tuple(row.get(column, k) for column in plan.primary_key if column != PRIMARY_TABLE_KEY)
+            if key not in keys:
+                break
+        else:
+            continue
+        keys.add(key)
+
+        for column, datatype, required in plan.columns:
+            if column == PRIMARY_TABLE_KEY or column in row:
+                continue
+            if column in (RA_COLUMN, DEC_COLUMN):
+                row[column] = ra if column == RA_COLUMN else dec
+            else:
+                row[column] = _value(plan, column, datatype, required, len(rows), rng)
+        rows.append({column: row[column] for column, _, _ in plan.columns if column in row})
+    return rows
+
+
+def generate_data(  # noqa: PLR0913
+    output_path,
+    n_sources,
+    *,
+    seed=0,
+    rows_per_source=None,
+    settings_file="database.toml",
+    data_path=None,
+    felis_path=None,
+    overwrite=False,
+):
+    """
+    Write synthetic source JSON files, with the lookup tables they refer to.
+
+    Parameters
+    ----------
+    output_path : str
+        Data directory to create, with reference and source sub-directories
+    n_sources : int
+        Number of synthetic sources
+    seed : int
+        Seed of the random number generator; the same seed gives the same files. Default: 0
+    rows_per_source : dict
+        Number of rows per source of each table generated from the column types
+        (tables no template has rows for); other tables get 1. Default: ROWS_PER_SOURCE
+    settings_file : str
+        Name of the TOML file containing the database settings. Default: database.toml
+    data_path : str
+        Data directory with the lookup tables and template source files. Default: None, reads from TOML file
+    felis_path : str
+        Path to the Felis schema. Default: None, reads from TOML file
+    overwrite : bool
+        Replace the source files of an existing output directory. Default: False
+
+    Returns
+    -------
+    names : list of str
+        Names of the synthetic sources
+    """
+    rows_per_source = ROWS_PER_SOURCE if rows_per_source is None else rows_per_source
+    db_settings = read_settings(settings_file, data_path=data_path, felis_path=felis_path)
+    if os.path.abspath(output_path) == os.path.abspath(db_settings.data_path):
+        raise ValueError("The output directory must not be the data directory of the database")
+
+    source_directory = os.path.join(output_path, SOURCE_DIRECTORY)
+    if os.path.isdir(source_directory) and os.listdir(source_directory):
+        if not overwrite:
+            raise FileExistsError(f"{source_directory} is not empty; use overwrite=True to replace it")
+        shutil.rmtree(source_directory)
+    os.makedirs(source_directory, exist_ok=True)
+    os.makedirs(os.path.join(output_path, REFERENCE_DIRECTORY), exist_ok=True)
+
+    lookup_rows = {}
+    for table in db_settings.lookup_tables:
+        path = reference_file(db_settings.data_path, table)
+        if os.path.exists(path):
+            shutil.copy(path, os.path.join(output_path, REFERENCE_DIRECTORY, table + ".json"))
+            with open(path, "r", encoding="utf-8") as f:
+                lookup_rows[table] = json.load(f)
+
+    schema = load_schema(db_settings.felis_path)
+    plans = _plans(schema, lookup_rows)
+
+    directory, files = source_files(db_settings.data_path, db_settings.lookup_tables)
+    templates = []
+    for file in files:
+        with open(os.path.join(directory, file), "r", encoding="utf-8") as f:
+            templates.append(json.load(f))
+    if len(templates) == 0:
+        raise ValueError(f"No template source files in {directory}")
+    covered = {table for template in templates for table, rows in template.items() if rows}
+    generated = [
+        plan
+        for plan in plans.values()
+        if plan.name not in covered and PRIMARY_TABLE_KEY in {column for column, _, _ in plan.columns}
+    ]
+
+    rng = random.Random(seed)
+    names = []
+    for i in range(n_sources):
+        name = source_name(i)
+        ra = round(rng.uniform(0, 360), 6)
+        dec = round(math.degrees(math.asin(rng.uniform(-1, 1))), 6)
+
+        data = {
+            table: _template_rows(plans[table], rows, name, ra, dec, rng)
+            for table, rows in rng.choice(templates).items()
+        }
+        for plan in generated:
+            data[plan.name] = _generated_rows(plan, rows_per_source.get(plan.name, 1), name, ra, dec, rng)
+
+        with open(os.path.join(source_directory, source_filename(name)), "w", encoding="utf-8") as f:
+            f.write(json.dumps(data, indent=4))
+        names.append(name)
+        if (i + 1) % 100000 == 0:
+            logger.info(f"Wrote {i + 1} of {n_sources} source files")
+
+    logger.info(f"Wrote {n_sources} synthetic source files to {source_directory}")
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic source JSON files for benchmarks.")
+    parser.add_argument("output_path", help="Data directory to create, with reference and source sub-directories")
+    parser.add_argument("--n-sources", type=int, default=1000, help="Number of synthetic sources (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random number generator (default: 0)")
+    parser.add_argument("--overwrite", action="store_true", help="Replace existing synthetic source files")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    generate_data(args.output_path, args.n_sources, seed=args.seed, overwrite=args.overwrite)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+# Populate TAP_SCHEMA in-process instead of with the felis command line
+#
+# `felis init-tap-schema` and `felis load-tap-schema` each start a new Python
+# process, parse the schema again, and open new connections. Here the TAP
+# metadata rows are generated from an already validated felis Schema (with the
+# same record generation as `felis load-tap-schema`) and synchronized with the
+# TAP_SCHEMA tables over an existing engine, in one transaction: the rows
+# describing the schema are compared with those in the database by primary key,
+# and only new, changed, and removed rows are written, with bulk inserts.
+# The rows describing TAP_SCHEMA itself (`felis init-tap-schema --insert-metadata`)
+# are synchronized the same way.
+#
+# Usage:
+#     python scripts/tap_metadata.py [schema.yaml] [--tap-schema-name TAP_SCHEMA]
+# or
+#     from scripts.tap_metadata import sync_tap_schema
+#     sync_tap_schema(db.engine, felis_schema)
+# The command line reads the connection string from TEMPLATE_CONNECTION_STRING (or a .env file).
+
+import argparse
+import csv
+import io
+import logging
+import os
+import sys
+
+from astropy.table import Table as AstropyTable
+from felis.tap_schema import DataLoader, TableManager
+from lsst.resources import ResourcePath
+from sqlalchemy import and_, create_engine
+from sqlalchemy.schema import CreateSchema
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.schema_cache import load_schema  # noqa: E402
+
+__all__ = [
+    "TAP_SCHEMA_NAME",
+    "sync_tap_schema",
+    "tap_records",
+]
+
+logger = logging.getLogger(__name__)
+
+TAP_SCHEMA_NAME = "TAP_SCHEMA"
+SELF_SCHEMA_NAME = "tap_schema"  # name under which felis describes TAP_SCHEMA itself
+TAP_TABLES = TableManager.get_table_names_std()  # in foreign key order: schemas, tables, columns, keys, key_columns
+
+
+# _insert and _generate_all_inserts are private to felis: lsst-felis is capped in the
+# workflows, and tests/test_tap_metadata.py::test_felis_hooks fails if they change
+class _RecordCollector(DataLoader):
+    """felis DataLoader keeping the generated records instead of building insert statements"""
+
+    def __init__(self, schema, mgr, tap_schema_index, unique_keys):
+        super().__init__(
+            schema, mgr, db_context=None, tap_schema_index=tap_schema_index, dry_run=True, unique_keys=unique_keys
+        )
+        self.records = {name: [] for name in TAP_TABLES}
+
+    def _insert(self, table_name, record):
+        self.records[table_name].append(dict(record))
+
+
+def _self_records():
+    """Rows describing TAP_SCHEMA itself, as inserted by `felis init-tap-schema`"""
+    records = {}
+    for name in TAP_TABLES:
+        content = ResourcePath(f"resource://felis/config/tap_schema/{name}.csv").read().decode("utf-8")
+        records[name] = [
+            {key: None if value == "\\N" else value for key, value in row.items()}
+            for row in csv.DictReader(io.StringIO(content))
+        ]
+    return records
+
+
+def tap_records(felis_schema, tap_schema_index=None, describe_tap_schema=True, unique_keys=False):
+    """
+    TAP_SCHEMA rows describing a schema.
+
+    Parameters
+    ----------
+    felis_schema : felis.datamodel.Schema
+        Validated Felis schema
+    tap_schema_index : int
+        Index of the schema in TAP_SCHEMA.schemas. Default: None
+    describe_tap_schema : bool
+        Include the rows describing TAP_SCHEMA itself. Default: True
+    unique_keys : bool
+        Prefix the key ids with the schema name, for several schemas in one TAP_SCHEMA. Default: False
+
+    Returns
+    -------
+    records : dict
+        List of rows (dicts) for each TAP_SCHEMA table
+    """
+    collector = _RecordCollector(felis_schema, TableManager(), tap_schema_index, unique_keys)
+    collector._generate_all_inserts()
+    records = collector.records
+    if describe_tap_schema:
+        for name, rows in _self_records().items():
+            records[name] = rows + records[name]
+    return records
+
+
+def _normalize(table, row):
+    """Row with every column of the table, values converted to the column types"""
+    normalized = {}
+    for column in table.columns:
+        value = row.get(column.name)
+        if value is not None:
+            try:
+                value = column.type.python_type(value)
+            except NotImplementedError:
+                pass
+        normalized[column.name] = value
+    return normalized
+
+
+def _row_key(table, row):
+    columns = [column.name for column in table.primary_key] or [column.name for column in table.columns]
+    return tuple(row[column] for column in columns)
+
+
+def _scope(name, rows, schema_names, key_ids):
+    """Rows of a TAP_SCHEMA table belonging to the given schemas"""
+
+    def prefix(table_name):
+        return table_name.split(".", 1)[0]
+
+    if name in ("schemas", "tables"):
+        return [row for row in rows if row["schema_name"] in schema_names]
+    if name == "columns":
+        return [row for row in rows if prefix(row["table_name"]) in schema_names]
+    if name == "keys":
+        return [row for row in rows if prefix(row["from_table"]) in schema_names]
+    return [row for row in rows if row["key_id"] in key_ids]
+
+
+def _match(table, row):
+    columns = [column for column in table.primary_key] or list(table.columns)
+    return and_(*[column == row[column.name] for column in columns])
+
+
+def sync_tap_schema(  # noqa: PLR0913
+    engine,
+    felis_schema,
+    tap_schema=TAP_SCHEMA_NAME,
+    tap_schema_index=None,
+    describe_tap_schema=True,
+    unique_keys=False,
+    conn=None,
+):
+    """
+    Create the TAP_SCHEMA tables if needed and bring the rows describing a schema up to date.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Engine of the database
+    felis_schema : felis.datamodel.Schema
+        Validated Felis schema
+    tap_schema : str
+        Name of the TAP_SCHEMA schema in the database (ignored for SQLite). Default: TAP_SCHEMA
+    tap_schema_index : int
+        Index of the schema in TAP_SCHEMA.schemas. Default: None
+    describe_tap_schema : bool
+        Also keep the rows describing TAP_SCHEMA itself. Default: True
+    unique_keys : bool
+        Prefix the key ids with the schema name, for several schemas in one TAP_SCHEMA. Default: False
+    conn : sqlalchemy.engine.Connection
+        Connection whose transaction the changes are part of. Default: None, uses
+        a new transaction of engine
+
+    Returns
+    -------
+    changes : astropy.table.Table
+        Number of rows inserted, updated, and deleted in each TAP_SCHEMA table
+    """
+    if conn is None:
+        with engine.begin() as conn:
+            return sync_tap_schema(
+                engine, felis_schema, tap_schema, tap_schema_index, describe_tap_schema, unique_keys, conn
+            )
+
+    mgr = TableManager(engine_url=engine.url.render_as_string(hide_password=True), schema_name=tap_schema)
+    if mgr.apply_schema_to_metadata:
+        conn.execute(CreateSchema(tap_schema, if_not_exists=True))
+    mgr.metadata.create_all(conn)
+
+    records = tap_records(felis_schema, tap_schema_index, describe_tap_schema, unique_keys)
+    schema_names = {felis_schema.name} | ({SELF_SCHEMA_NAME} if describe_tap_schema else set())
+    new, old = {}, {}
+    for name in TAP_TABLES:
+        table = mgr[name]
+        new[name] = {_row_key(table, row): row for row in (_normalize(table, row) for row in records[name])}
+        existing = [_normalize(table, row._mapping) for row in conn.execute(table.select())]
+        key_ids = {row["key_id"] for row in [*new.get("keys", {}).values(), *old.get("keys", {}).values()]}
+        old[name] = {_row_key(table, row): row for row in _scope(name, existing, schema_names, key_ids)}
+
+    # Removed rows first, children before parents, then new and changed rows, parents before children
+    n_deleted = {}
+    for name in reversed(TAP_TABLES):
+        table = mgr[name]
+        deleted = [row for key, row in old[name].items() if key not in new[name]]
+        for row in deleted:
+            conn.execute(table.delete().where(_match(table, row)))
+        n_deleted[name] = len(deleted)
+
+    changes = []
+    for name in TAP_TABLES:
+        table = mgr[name]
+        inserted = [row for key, row in new[name].items() if key not in old[name]]
+        if inserted:
+            conn.execute(table.insert(), inserted)
+        updated = [row for key, row in new[name].items() if key in old[name] and old[name][key] != row]
+        for row in updated:
+            conn.execute(table.update().where(_match(table, row)).values(row))
+        changes.append((name, len(inserted), len(updated), n_deleted[name]))
+        logger.info(f"{name}: {len(inserted)} inserted, {len(updated)} updated, {n_deleted[name]} deleted")
+
+    return AstropyTable(
+        rows=changes,
+        names=["table", "inserted", "updated", "deleted"],
+        dtype=[str, int, int, int],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the TAP metadata of a Felis schema into TAP_SCHEMA.")
+    parser.add_argument("felis_path", nargs="?", default="schema.yaml", help="Felis schema (default: schema.yaml)")
+    parser.add_argument(
+        "--tap-schema-name",
+        default=TAP_SCHEMA_NAME,
+        help=f"Name of the TAP_SCHEMA schema in the database (default: {TAP_SCHEMA_NAME})",
+    )
+    parser.add_argument("--tap-schema-index", type=int, help="Index of the schema in TAP_SCHEMA")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv  # only needed on the command line
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    connection_string = os.environ.get("TEMPLATE_CONNECTION_STRING")
+    if connection_string is None:
+        print("TEMPLATE_CONNECTION_STRING is not set")
+        return 1
+
+    felis_schema = load_schema(args.felis_path)
+    engine = create_engine(connection_string)
+    sync_tap_schema(engine, felis_schema, args.tap_schema_name, args.tap_schema_index).pprint_all()
+    engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
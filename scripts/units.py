@@ -0,0 +1,365 @@
+# Unit normalization for the parameter tables (ModeledParameters, CompanionParameters)
+#
+# Only the distinct unit strings are read from the database, in one grouped
+# query over all parameter tables, and each string is parsed by astropy once:
+# parsing is memoized in an LRU cache shared by all tables. Each unit is mapped
+# to its SI equivalent (eg, Gyr -> 3.15576e16 s), giving a canonical unit and a
+# conversion factor per ParameterList.parameter. `to_si` applies the factors in
+# SQL, so values can be compared without parsing units row by row.
+#
+# The canonical units and factors are stored in a ParameterUnits table in a side
+# SQLite file in .astrodb_cache, as the name index is: the database schema is
+# untouched, and the table is filled when the database is built
+# (scripts/json_loader.py, scripts/incremental_build.py) and rebuilt whenever the
+# database file changes. `to_si` reads the factors from it, so the units are
+# only parsed once per database.
+#
+# Usage:
+#     from scripts.units import to_si
+#     t = to_si(db, "ModeledParameters")  # adds value_si, error_si, ... and unit_si columns
+# or
+#     python scripts/units.py [--db-name astrodb-template] [--store]
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import uuid
+from functools import lru_cache
+
+from astrodb_utils import read_db_from_file
+from astropy import units as u
+from astropy.table import Table as AstropyTable
+from sqlalchemy import and_, case, func, literal, select, union_all
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.cache_utils import cache_path, database_fingerprint  # noqa: E402
+
+__all__ = [
+    "check_units",
+    "parameter_tables",
+    "parameter_units",
+    "parse_unit",
+    "si_conversion",
+    "store_parameter_units",
+    "stored_parameter_units",
+    "to_si",
+]
+
+logger = logging.getLogger(__name__)
+
+UNIT_CACHE_SIZE = 1024
+VALUE_COLUMNS = ("value", "error", "error_upper", "error_lower")
+CACHE_SUFFIX = "units.sqlite"
+UNITS_VERSION = "1"
+
+
+@lru_cache(maxsize=UNIT_CACHE_SIZE)
+def parse_unit(unit):
+    """Parse a unit string with astropy (memoized). Returns None if the string is not a valid unit."""
+    try:
+        return u.Unit(unit, parse_strict="raise")
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=UNIT_CACHE_SIZE)
+def si_conversion(unit):
+    """
+    Canonical SI unit and conversion factor of a unit string (memoized).
+
+    Units without an SI equivalent (eg, mag, dex) are their own canonical unit, with a factor of 1.
+    Returns None if the string is not a valid unit.
+    """
+    parsed = parse_unit(unit)
+    if parsed is None:
+        return None
+    try:
+        si = parsed.si
+    except u.UnitsError:
+        return parsed.to_string(), 1.0
+    canonical = u.CompositeUnit(1, si.bases, si.powers)
+    return canonical.to_string(), float(si.scale)
+
+
+def parameter_tables(db):
+    """Names of the tables with parameter, value, and unit columns"""
+    return [
+        name
+        for name, table in db.metadata.tables.items()
+        if {"parameter", "value", "unit"} <= set(table.columns.keys())
+    ]
+
+
+def _unit_counts(db, tables):
+    """(table, parameter, unit, number of rows) for each distinct unit, in one query"""
+    selects = [
+        select(literal(name).label("table"), table.c.parameter, table.c.unit, func.count().label("n_rows"))
+        .where(table.c.unit.is_not(None))
+        .group_by(table.c.parameter, table.c.unit)
+        for name, table in ((name, db.metadata.tables[name]) for name in tables)
+    ]
+    if len(selects) == 0:
+        return []
+    with db.engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(union_all(*selects))]
+
+
+def check_units(db, tables=None):
+    """
+    Unit strings that astropy cannot parse.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to check
+    tables : list of str
+        Tables to check. Default: all tables with parameter, value, and unit columns
+
+    Returns
+    -------
+    failures : astropy.table.Table
+        Table, unit string, and number of rows for each unit that did not resolve
+    """
+    tables = parameter_tables(db) if tables is None else tables
+    counts = {}
+    for table, _, unit, n_rows in _unit_counts(db, tables):
+        if parse_unit(unit) is None:
+            counts[(table, unit)] = counts.get((table, unit), 0) + n_rows
+    rows = [(table, unit, n_rows) for (table, unit), n_rows in sorted(counts.items())]
+    return AstropyTable(rows=rows, names=["table", "unit", "n_rows"], dtype=[str, str, int])
+
+
+def parameter_units(db, tables=None):
+    """
+    Canonical unit and SI conversion factor of each unit used for each parameter.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to inspect
+    tables : list of str
+        Tables to include. Default: all tables with parameter, value, and unit columns
+
+    Returns
+    -------
+    units : astropy.table.Table
+        One row per parameter and unit string with the canonical unit, the factor
+        converting values to it (None for invalid units), and whether all units
+        of the parameter share the same canonical unit (consistent)
+    """
+    tables = parameter_tables(db) if tables is None else tables
+    pairs = sorted({(parameter, unit) for _, parameter, unit, _ in _unit_counts(db, tables)})
+
+    conversions = {pair: si_conversion(pair[1]) for pair in pairs}
+    canonical = {}
+    for (parameter, _), conversion in conversions.items():
+        canonical.setdefault(parameter, set()).add(conversion[0] if conversion else None)
+
+    rows = [
+        (
+            parameter,
+            unit,
+            conversion[0] if conversion else "",
+            conversion[1] if conversion else None,
+            len(canonical[parameter]) == 1 and None not in canonical[parameter],
+        )
+        for (parameter, unit), conversion in conversions.items()
+    ]
+    return AstropyTable(
+        rows=rows,
+        names=["parameter", "unit", "canonical_unit", "si_factor", "consistent"],
+        dtype=[str, str, str, object, bool],
+    )
+
+
+def _write_units(path, units, fingerprint):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            with conn:
+                conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+                conn.execute(
+                    "CREATE TABLE ParameterUnits (parameter TEXT NOT NULL, unit TEXT NOT NULL, canonical_unit TEXT, "
+                    "si_factor REAL, consistent INTEGER NOT NULL, PRIMARY KEY (parameter, unit))"
+                )
+                conn.executemany(
+                    "INSERT INTO ParameterUnits VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (parameter, unit, canonical or None, factor, int(consistent))
+                        for parameter, unit, canonical, factor, consistent in units.iterrows()
+                    ],
+                )
+                conn.executemany(
+                    "INSERT INTO meta VALUES (?, ?)", [("version", UNITS_VERSION), ("fingerprint", fingerprint)]
+                )
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _read_units(path, fingerprint):
+    """Stored ParameterUnits rows, or None if the file is missing or out of date"""
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        if meta.get("version") != UNITS_VERSION or meta.get("fingerprint") != fingerprint:
+            return None
+        return conn.execute(
+            "SELECT parameter, unit, canonical_unit, si_factor, consistent FROM ParameterUnits ORDER BY parameter, unit"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def store_parameter_units(db, cache_dir=None):
+    """
+    Store the canonical unit and SI factor of each parameter and unit in the ParameterUnits side table.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to inspect
+    cache_dir : str
+        Directory for the side file. Default: .astrodb_cache next to the database file
+
+    Returns
+    -------
+    path : str
+        Path of the side file, None for databases that are not SQLite files (nothing is stored)
+    """
+    fingerprint = database_fingerprint(db)
+    if fingerprint is None:
+        return None
+    path = cache_path(db, CACHE_SUFFIX, cache_dir=cache_dir)
+    logger.info(f"Storing parameter units in {path}")
+    _write_units(path, parameter_units(db), fingerprint)
+    return path
+
+
+def stored_parameter_units(db, cache_dir=None):
+    """
+    Canonical unit and SI factor of each parameter and unit, from the ParameterUnits side table.
+
+    The side table is (re)built if it is missing or the database changed since it was stored.
+    For databases that are not SQLite files the units are computed with `parameter_units`.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to inspect
+    cache_dir : str
+        Directory for the side file. Default: .astrodb_cache next to the database file
+
+    Returns
+    -------
+    units : astropy.table.Table
+        Same columns as `parameter_units`, for all parameter tables
+    """
+    fingerprint = database_fingerprint(db)
+    if fingerprint is None:
+        return parameter_units(db)
+    path = cache_path(db, CACHE_SUFFIX, cache_dir=cache_dir)
+    rows = _read_units(path, fingerprint)
+    if rows is None:
+        store_parameter_units(db, cache_dir=cache_dir)
+        rows = _read_units(path, fingerprint)
+    return AstropyTable(
+        rows=[
+            (parameter, unit, canonical or "", factor, bool(consistent))
+            for parameter, unit, canonical, factor, consistent in rows
+        ],
+        names=["parameter", "unit", "canonical_unit", "si_factor", "consistent"],
+        dtype=[str, str, str, object, bool],
+    )
+
+
+def to_si(db, table, fmt="astropy", cache_dir=None):
+    """
+    Rows of a parameter table with their values converted to canonical SI units.
+
+    The conversion is done in SQL with one CASE expression over the (parameter, unit)
+    pairs of the ParameterUnits side table (see `stored_parameter_units`).
+    Rows with a missing or invalid unit get NULL converted values.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to query
+    table : str
+        Table with parameter, value, and unit columns (eg, ModeledParameters)
+    fmt : str
+        Format to return results in (pandas, astropy/table, default). Default is astropy table
+    cache_dir : str
+        Directory of the ParameterUnits side file. Default: .astrodb_cache next to the database file
+
+    Returns
+    -------
+    results
+        Rows of the table with additional <column>_si columns for the value and
+        error columns, and a unit_si column with the canonical unit
+    """
+    sql_table = db.metadata.tables[table]
+    conversions = {
+        (row["parameter"], row["unit"]): (row["canonical_unit"], row["si_factor"])
+        for row in stored_parameter_units(db, cache_dir=cache_dir)
+        if row["si_factor"] is not None
+    }
+
+    def match(parameter, unit):
+        return and_(sql_table.c.parameter == parameter, sql_table.c.unit == unit)
+
+    columns = [sql_table]
+    if conversions:
+        factor = case(*[(match(*pair), factor) for pair, (_, factor) in conversions.items()], else_=None)
+        unit_si = case(*[(match(*pair), unit) for pair, (unit, _) in conversions.items()], else_=None)
+        columns += [(sql_table.columns[name] * factor).label(f"{name}_si") for name in VALUE_COLUMNS]
+        columns.append(unit_si.label("unit_si"))
+    else:
+        columns += [literal(None).label(f"{name}_si") for name in VALUE_COLUMNS] + [literal(None).label("unit_si")]
+
+    with db.engine.connect() as conn:
+        rows = conn.execute(select(*columns)).all()
+    if len(rows) > 0 or fmt.lower() not in ("astropy", "table", "pandas"):
+        return db._handle_format(rows, fmt)
+
+    results = AstropyTable(names=sql_table.columns.keys() + [f"{name}_si" for name in VALUE_COLUMNS] + ["unit_si"])
+    return results.to_pandas() if fmt.lower() == "pandas" else results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the units of the parameter tables and their SI conversions.")
+    parser.add_argument(
+        "--db-name",
+        default="astrodb-template",
+        help="Name of the SQLite database, without the .sqlite extension (default: astrodb-template)",
+    )
+    parser.add_argument(
+        "--store", action="store_true", help="Store the units in the ParameterUnits side table of .astrodb_cache"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = read_db_from_file(args.db_name)
+    if args.store:
+        store_parameter_units(db)
+    parameter_units(db).pprint_all()
+
+    failures = check_units(db)
+    if len(failures) > 0:
+        print("\nUnits that are not recognized astropy units:")
+        failures.pprint_all()
+    return 0 if len(failures) == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+# Schema-driven data-quality validation
+#
+# Rules are read from validation.yaml, keyed by table and column (required
+# values, min/max bounds, and allowed values), and from schema.yaml: every
+# Check constraint (eg, check_ra) and every column declared with
+# `nullable: false`. The rules of validation.yaml are not database constraints,
+# so they find the rows that break them in any database. The rules of
+# schema.yaml are enforced by the database when it is built from schema.yaml,
+# so they only find rows in databases built without the constraints (eg, from
+# an older schema, or loaded with PRAGMA ignore_check_constraints).
+# The rules of a table are compiled into a single aggregated query, so each
+# table is scanned once no matter how many rules it has:
+#     SELECT count(*), sum(CASE WHEN NOT (<check 1>) THEN 1 ELSE 0 END), ... FROM <table>
+# As in SQL, a Check, range, or enum rule whose expression is NULL is not a
+# violation; NULL values are caught by the not_null rules.
+#
+# Usage:
+#     python scripts/validation.py [--db-name NAME] [--felis-path schema.yaml] [--rules-path validation.yaml]
+
+import argparse
+import logging
+import sys
+from collections import namedtuple
+
+from astrodb_utils import read_db_from_file
+from astropy.table import Table as AstropyTable
+import yaml
+from sqlalchemy import case, func, or_, select, text
+
+sys.path.append("./")  # needed to find the scripts module when run from the repository root
+from scripts.schema_cache import load_schema  # noqa: E402
+
+__all__ = [
+    "Rule",
+    "failed_rules",
+    "load_rules",
+    "validate_database",
+    "violating_rows",
+]
+
+logger = logging.getLogger(__name__)
+
+Rule = namedtuple("Rule", ["table", "name", "kind", "expression"])
+Rule.__doc__ = "Validation rule: kind is check, range, enum (expression must not be false), or not_null (a column)"
+RULE_KEYS = {"not_null", "min", "max", "enum"}
+
+
+def _literal(value):
+    """SQL literal of a number or string of validation.yaml"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Unsupported value in validation rules: {value!r}")
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def _column_rules(table, column, spec):
+    """Rules of one column of validation.yaml"""
+    unknown = set(spec) - RULE_KEYS
+    if unknown:
+        raise ValueError(f"Unknown validation rules for {table}.{column}: {sorted(unknown)}")
+
+    rules = []
+    if spec.get("not_null"):
+        rules.append(Rule(table, f"{column}_not_null", "not_null", column))
+    bounds = [f"{column} >= {_literal(spec['min'])}"] if "min" in spec else []
+    bounds += [f"{column} <= {_literal(spec['max'])}"] if "max" in spec else []
+    if bounds:
+        rules.append(Rule(table, f"{column}_range", "range", " AND ".join(bounds)))
+    if "enum" in spec:
+        values = ", ".join(_literal(value) for value in spec["enum"])
+        rules.append(Rule(table, f"{column}_enum", "enum", f"{column} IN ({values})"))
+    return rules
+
+
+def load_rules(felis_path="schema.yaml", rules_path="validation.yaml"):
+    """
+    Validation rules declared in validation.yaml and in a Felis schema.
+
+    Parameters
+    ----------
+    felis_path : str
+        Path to the Felis schema. Default: schema.yaml
+    rules_path : str
+        Path to the validation rules, or None to only use those of the schema. Default: validation.yaml
+
+    Returns
+    -------
+    rules : dict
+        List of Rule for each table
+    """
+    schema = load_schema(felis_path)
+    columns = {table.name: {column.name for column in table.columns} for table in schema.tables}
+
+    rules = {}
+    for table in schema.tables:
+        rules[table.name] = [
+            Rule(table.name, f"{column.name}_not_null", "not_null", column.name)
+            for column in table.columns
+            if column.nullable is False
+        ]
+        rules[table.name] += [
+            Rule(table.name, constraint.name, "check", constraint.expression)
+            for constraint in table.constraints
+            if constraint.type == "Check"
+        ]
+
+    if rules_path is not None:
+        with open(rules_path) as f:
+            declared = yaml.safe_load(f) or {}
+        for table, table_spec in declared.items():
+            for column, spec in table_spec.items():
+                if column not in columns.get(table, ()):
+                    raise ValueError(f"Validation rules for a column not in {felis_path}: {table}.{column}")
+                names = {rule.name for rule in rules[table]}
+                rules[table] += [rule for rule in _column_rules(table, column, spec) if rule.name not in names]
+
+    return {table: table_rules for table, table_rules in rules.items() if table_rules}
+
+
+def _violation(table, rule):
+    if rule.kind == "not_null":
+        return table.columns[rule.expression].is_(None)
+    return text(f"NOT ({rule.expression})")
+
+
+def _table_query(table, rules):
+    counts = [
+        func.coalesce(func.sum(case((_violation(table, rule), 1), else_=0)), 0).label(f"rule_{i}")
+        for i, rule in enumerate(rules)
+    ]
+    return select(func.count().label("n_rows"), *counts).select_from(table)
+
+
+def validate_database(db, rules=None, tables=None, felis_path="schema.yaml", rules_path="validation.yaml"):
+    """
+    Count the rows violating each rule, scanning each table once.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to validate
+    rules : dict
+        List of Rule for each table. Default: the rules declared in rules_path and felis_path
+    tables : list of str
+        Only validate these tables. Default: all tables with rules
+    felis_path : str
+        Path to the Felis schema, used when rules is not given. Default: schema.yaml
+    rules_path : str
+        Path to the validation rules, used when rules is not given. Default: validation.yaml
+
+    Returns
+    -------
+    report : astropy.table.Table
+        One row per rule with the table, rule name, kind, expression,
+        number of rows in the table, and number of violating rows
+    """
+    if rules is None:
+        rules = load_rules(felis_path, rules_path)
+
+    rows = []
+    with db.engine.connect() as conn:
+        for table_name, table_rules in rules.items():
+            if (tables is not None and table_name not in tables) or table_name not in db.metadata.tables:
+                continue
+            result = conn.execute(_table_query(db.metadata.tables[table_name], table_rules)).one()
+            for rule, n_violations in zip(table_rules, result[1:]):
+                rows.append((table_name, rule.name, rule.kind, rule.expression, result[0], int(n_violations)))
+
+    return AstropyTable(
+        rows=rows,
+        names=["table", "rule", "kind", "expression", "n_rows", "n_violations"],
+        dtype=[str, str, str, str, int, int],
+    )
+
+
+def failed_rules(report, table=None):
+    """Rows of a validation report with violations, optionally only for one table"""
+    failed = report[report["n_violations"] > 0]
+    if table is not None:
+        failed = failed[failed["table"] == table]
+    return failed
+
+
+def violating_rows(  # noqa: PLR0913
+    db, table, rules=None, limit=100, fmt="astropy", felis_path="schema.yaml", rules_path="validation.yaml"
+):
+    """
+    Rows of a table violating any of its rules.
+
+    Parameters
+    ----------
+    db : astrodbkit.astrodb.Database
+        Database to inspect
+    table : str
+        Table to inspect
+    rules : list of Rule
+        Rules to apply. Default: the rules declared for the table in rules_path and felis_path
+    limit : int
+        Maximum number of rows to return. Default: 100
+    fmt : str
+        Format to return results in (pandas, astropy/table, default). Default is astropy table
+    felis_path : str
+        Path to the Felis schema, used when rules is not given. Default: schema.yaml
+    rules_path : str
+        Path to the validation rules, used when rules is not given. Default: validation.yaml
+    """
+    if rules is None:
+        rules = load_rules(felis_path, rules_path).get(table, [])
+    sql_table = db.metadata.tables[table]
+
+    rows = []
+    if len(rules) > 0:
+        query = select(sql_table).where(or_(*[_violation(sql_table, rule) for rule in rules])).limit(limit)
+        with db.engine.connect() as conn:
+            rows = conn.execute(query).all()
+
+    if len(rows) > 0 or fmt.lower() not in ("astropy", "table", "pandas"):
+        return db._handle_format(rows, fmt)
+    results = AstropyTable(names=sql_table.columns.keys())
+    return results.to_pandas() if fmt.lower() == "pandas" else results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate the database against the rules and the schema.")
+    parser.add_argument(
+        "--db-name",
+        default="astrodb-template",
+        help="Name of the SQLite database, without the .sqlite extension (default: astrodb-template)",
+    )
+    parser.add_argument("--felis-path", default="schema.yaml", help="Path to the Felis schema (default: schema.yaml)")
+    parser.add_argument(
+        "--rules-path", default="validation.yaml", help="Path to the validation rules (default: validation.yaml)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = read_db_from_file(args.db_name)
+    report = validate_database(db, felis_path=args.felis_path, rules_path=args.rules_path)
+    report.pprint_all()
+
+    failed = failed_rules(report)
+    for table in sorted(set(failed["table"])):
+        print(f"\n{table} rows failing validation:")
+        violating_rows(db, table, felis_path=args.felis_path, rules_path=args.rules_path).pprint_all()
+    return 0 if len(failed) == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,26 +2,80 @@ import os
 import pytest
 import logging
 
-# from astrodbkit.astrodb import Database, create_database
 import astrodb_utils
-from astrodb_utils import build_db_from_json
+
+from scripts.adopted import check_adopted
+from scripts.db_snapshot import build_snapshot, memory_copy, read_only_database
+from scripts.validation import validate_database
 
 logger = logging.getLogger(__name__)
 
-# Create a fresh template database for the data and integrity tests
-@pytest.fixture(scope="session", autouse=True)
-def db():
+
+# The database snapshot is built (or found in .astrodb_cache/snapshots) once, by
+# the controller process when running in parallel with pytest-xdist (pytest -n auto).
+# Tests open the snapshot itself read-only, so the tracked astrodb-template.sqlite
+# is never rewritten and workers never race on the file. The caches derived from
+# it and shared by the workers in .astrodb_cache (KD-tree pickle, name index,
+# parsed schema) are written to temporary files renamed into place, so concurrent
+# builders never see each other's partial files; keep new shared caches that way.
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "mutates_db: the test writes to the database, so db is a private copy for this test"
+    )
+    if hasattr(config, "workerinput"):
+        config.astrodb_snapshot = config.workerinput["astrodb_snapshot"]
+        return
+
     logger.info(f"Using version {astrodb_utils.__version__} of astrodb_utils")
+    config.astrodb_snapshot = build_snapshot()
+
+
+# Hook of pytest-xdist, called in the controller for each worker it starts
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    node.workerinput["astrodb_snapshot"] = node.config.astrodb_snapshot
+
+
+@pytest.fixture(scope="session")
+def db_snapshot(pytestconfig):
+    return pytestconfig.astrodb_snapshot
 
-    db = build_db_from_json()
 
+# Template database for the data and integrity tests, shared read-only by all tests of a process
+@pytest.fixture(scope="session")
+def db_readonly(db_snapshot):
     # Confirm file was created
-    assert os.path.exists(
-        "astrodb-template.sqlite"
-    ), "Database file 'astrodb-template.sqlite' was not created."
+    assert os.path.exists(db_snapshot), f"Database snapshot '{db_snapshot}' was not created."
+
+    db = read_only_database(db_snapshot)
+    logger.info(f"Opened AstroDB Template database snapshot {db_snapshot} read-only")
+    yield db
+    db.engine.dispose()
+
+
+# Private in-memory copy of the template database for tests that write to it
+@pytest.fixture
+def db_copy(db_snapshot, db_readonly):
+    copy = memory_copy(db_snapshot, lookup_tables=db_readonly._lookup_tables)
+    yield copy
+    copy.engine.dispose()
+
+
+# Tests marked with @pytest.mark.mutates_db get a private copy, the others the shared read-only database
+@pytest.fixture
+def db(request, db_readonly):
+    if request.node.get_closest_marker("mutates_db") is not None:
+        return request.getfixturevalue("db_copy")
+    return db_readonly
+
+
+# Validate every table against the rules in validation.yaml and schema.yaml, scanning each table once
+@pytest.fixture(scope="session")
+def validation_report(db_readonly):
+    return validate_database(db_readonly)
 
-    logger.info(
-        "Loaded AstroDB Template database using build_db_from_json function in conftest.py"
-    )
 
-    return db
+# Sources without exactly one adopted measurement, in every table with an adopted flag
+@pytest.fixture(scope="session")
+def adopted_report(db_readonly):
+    return check_adopted(db_readonly)
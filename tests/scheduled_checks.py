@@ -9,59 +9,33 @@ the results of the tests, and the -rpP flags are used to suppress the output of
 
 """
 import pytest
-import tqdm
-import requests
-from astroquery.simbad import Simbad
 
-from astrodbkit.utils import _name_formatter
 from astrodb_utils import internet_connection
-from astrodb_utils.photometry import fetch_svo
+
+from scripts.link_check import check_spectra_urls
+from scripts.simbad_check import check_simbad_names, resolve_simbad
+from scripts.svo_filters import check_filters, resolve_filters
 
 
 def test_SIMBAD_resolvable(db):
-    # Verify that sources have SIMBAD-resolvable names
+    # Verify that sources have SIMBAD-resolvable names.
+    # SIMBAD responses are cached in .astrodb_cache/responses.sqlite for 30 days, so only new
+    # names are queried, and all SIMBAD identifiers are checked against the database in one join.
 
     all_sources = db.query(db.Sources.c.source).all()
     name_list = [s[0] for s in all_sources]  # Convert table to list of names
 
-    # Include all SIMBAD Identifiers and our provided name to the SIMBAD query results table.
-    Simbad.add_votable_fields("ids")
-
-    simbad_results = Simbad.query_objects(name_list)
-    no_result_rows = []
-    duplicate_rows = []
-    no_db_matches = []
-    unique_matches = []
-    for row in simbad_results[["main_id", "ids"]].iterrows():
-        try:
-            name, ids = row[0].decode("utf-8"), row[1].decode("utf-8")
-        except AttributeError:
-            # Catch decoding error
-            name, ids = row[0], row[1]
-
-        simbad_names = [
-            _name_formatter(s)
-            for s in ids.split("|")
-            if _name_formatter(s) != "" and _name_formatter(s) is not None
-        ]
-        if len(simbad_names) == 0:
-            no_result_rows += [row]
-            print(f"No SIMBAD names for {name}")
-
-        # Examine DB for each input, displaying results when more than one source matches
-        t = db.search_object(
-            simbad_names, output_table="Sources", fmt="astropy", fuzzy_search=False
-        )
-        if len(t) > 1:
-            duplicate_rows += [row]
-            print(f"Duplicate rows for {name}\n")
-            print(f"   Searched simbad names: {simbad_names}")
-            print(f"   Database matches: \n {t}")
-        elif len(t) == 0:
-            no_db_matches += [row]
-            print(f"No database matches for {name}")
-        else:
-            unique_matches += [row]
+    report = check_simbad_names(db, resolve_simbad(name_list))
+    for status in ("no_simbad", "duplicate", "no_db_match"):
+        rows = report[report["status"] == status]
+        if len(rows) > 0:
+            print(f"{status}:")
+            rows.pprint_all()
+
+    no_result_rows = list(report["name"][report["status"] == "no_simbad"])
+    duplicate_rows = list(report["name"][report["status"] == "duplicate"])
+    no_db_matches = list(report["name"][report["status"] == "no_db_match"])
+    unique_matches = list(report["name"][report["status"] == "unique"])
 
     assert len(no_result_rows) == 0, f"No SIMBAD names for {no_result_rows}"
     assert len(duplicate_rows) == 0, f" duplicate rows for {duplicate_rows}"
@@ -74,36 +48,33 @@ def test_SIMBAD_resolvable(db):
 def test_filters_resolvable_in_svo(db):
     # Verify that every PhotometryFilters.band is a valid SVO Filter Profile Service ID,
     # in the "Facility/Instrument.Filter" naming convention used by SVO.
+    # SVO responses are cached in .astrodb_cache/responses.sqlite and missing bands are fetched concurrently.
 
-    filters_table = db.query(db.PhotometryFilters).astropy()
-    unresolved = []
-    for band in filters_table["band"]:
-        telescope, _, rest = band.partition("/")
-        instrument, _, filter_name = rest.partition(".")
-        try:
-            fetch_svo(telescope=telescope, instrument=instrument, filter_name=filter_name)
-        except Exception as e:
-            unresolved.append((band, str(e)))
-            print(f"Could not resolve {band} in SVO: {e}")
+    bands = [row[0] for row in db.query(db.PhotometryFilters.c.band).all()]
+    report = check_filters(db, resolve_filters(bands))
+    unresolved = list(report["band"][~report["in_svo"]])
+    for row in report[~report["in_svo"]]:
+        print(f"Could not resolve {row['band']} in SVO" + (f": {row['error']}" if row["error"] else ""))
+    mismatched = list(report["band"][report["in_svo"] & ~report["matches_svo"]])
+    for band in mismatched:
+        print(f"Wavelength or width of {band} differs from SVO")
 
     assert len(unresolved) == 0, f"{len(unresolved)} PhotometryFilters bands failed SVO checks: {unresolved}"
+    assert len(mismatched) == 0, f"{len(mismatched)} PhotometryFilters bands differ from SVO: {mismatched}"
 
 
 @pytest.mark.skip(reason="There are no spectra yet in the template")
 def test_spectra_urls(db):
-    spectra_urls = db.query(db.Spectra.c.access_url).astropy()
-    broken_urls = []
-    codes = []
+    # Results are cached in .astrodb_cache/responses.sqlite: working URLs are rechecked after 7 days,
+    # failed ones after 1 hour
     internet, _ = internet_connection()
-    if internet:
-        for spectrum_url in tqdm.tqdm(spectra_urls["access_url"]):
-            request_response = requests.head(spectrum_url)
-            status_code = request_response.status_code
-            # The website is up if the status code is 200
-            # cuny academic commons links give 301 status code
-            if status_code not in (200, 301):
-                broken_urls.append(spectrum_url)
-                codes.append(status_code)
+    if not internet:
+        pytest.skip("No internet connection")
+
+    report = check_spectra_urls(db)
+    broken = report[~report["ok"]]
+    broken_urls = list(broken["access_url"])
+    codes = list(broken["status"])
 
     # Display broken spectra regardless if it's the number we expect or not
     print(f"found {len(broken_urls)} broken spectra urls: {broken_urls}, {codes}")
@@ -0,0 +1,67 @@
+"""
+Tests for the adopted-flag checks in scripts/adopted.py
+"""
+
+import pytest
+from sqlalchemy import text
+
+from scripts.adopted import INDEX_SUFFIX, adopted_tables, check_adopted, fix_adopted
+from scripts.json_loader import build_db_parallel
+
+SOURCE = "2MASS J21140802-2251358"
+
+
+def test_adopted_tables():
+    tables = adopted_tables("schema.yaml")
+    assert {"Parallaxes", "RadialVelocities", "ProperMotions", "Morphology", "RotationalParameters"} <= set(tables)
+    assert "Photometry" not in tables
+
+
+def _adopted_reference(db):
+    rows = db.query(db.RadialVelocities.c.reference).filter(
+        db.RadialVelocities.c.source == SOURCE, db.RadialVelocities.c.adopted.is_(True)
+    )
+    return [row[0] for row in rows.all()]
+
+
+@pytest.mark.mutates_db
+def test_fix_adopted(db):
+    assert len(check_adopted(db)) == 0
+
+    # Three adopted radial velocities for the same source
+    with db.engine.begin() as conn:
+        for reference, error in (("Rubin80", 0.5), ("Riess98", 2.0)):
+            conn.execute(
+                db.RadialVelocities.insert().values(
+                    source=SOURCE, rv_kms=1.0, rv_error=error, adopted=True, reference=reference
+                )
+            )
+
+    flagged = check_adopted(db)
+    assert list(flagged["table"]) == ["RadialVelocities"]
+    assert list(flagged["source"]) == [SOURCE]
+    assert flagged["n_rows"][0] == 3 and flagged["n_adopted"][0] == 3
+
+    assert list(fix_adopted(db, rule="newest_reference", dry_run=True)["reference"]) == ["Alle16"]
+    assert len(_adopted_reference(db)) == 3
+
+    changes = fix_adopted(db, rule="smallest_error")
+    assert list(changes["reference"]) == ["Rubin80"]
+    assert _adopted_reference(db) == ["Rubin80"]
+    assert len(check_adopted(db)) == 0
+
+
+def test_partial_index(tmp_path):
+    db = build_db_parallel(db_name=str(tmp_path / "adopted_index"), workers=1)
+    with db.engine.connect() as conn:
+        plan = conn.execute(
+            text("EXPLAIN QUERY PLAN SELECT source FROM Parallaxes WHERE adopted AND source = 'TWA 26'")
+        ).all()
+    assert "Parallaxes_adopted_source" in " ".join(str(row) for row in plan)
+
+
+def test_snapshot_indexes(db_readonly):
+    # The test database is built by scripts/db_snapshot.py, as the other builds it has the partial indexes
+    with db_readonly.engine.connect() as conn:
+        indexes = {name for (name,) in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    assert {table + INDEX_SUFFIX for table in adopted_tables()} <= indexes
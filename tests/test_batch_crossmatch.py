@@ -0,0 +1,47 @@
+"""
+Tests for the KD-tree cross-match in scripts/batch_crossmatch.py
+"""
+
+import numpy as np
+import pytest
+from astropy import units as u
+from astropy.table import Table
+
+from scripts.batch_crossmatch import SourceTree, batch_crossmatch
+from scripts.json_loader import build_db_parallel
+
+
+def test_batch_crossmatch(db):
+    catalog = Table(
+        {
+            "ra": [92.6442, 55.6326, 318.533, 10.0, np.nan],
+            "dec": [-21.8646, 12.2729, -22.86, 10.0, 0.0],
+        }
+    )
+    matches = batch_crossmatch(db, catalog, radius=2 * u.arcsec)
+
+    assert list(matches["source"]) == ["Gl 229b", "HAT-P-12b", "2MASS J21140802-2251358", "", ""]
+    assert list(matches["match_index"][3:]) == [-1, -1]
+    assert matches["separation_arcsec"][0] == pytest.approx(0, abs=1e-6)
+    assert not any(matches["ambiguous"])
+
+    # HAT-P-12b and WASP-76b are 2 degrees apart
+    matches = batch_crossmatch(db, {"ra": [56.6326], "dec": [12.2729]}, radius=1.01 * u.deg)
+    assert matches["ambiguous"][0]
+    assert matches["n_sources"][0] == 2
+
+
+def test_tree_cache(tmp_path):
+    db = build_db_parallel(db_name=str(tmp_path / "kdtree"), workers=1)
+
+    tree = SourceTree.from_database(db)
+    assert not tree.from_cache
+    assert (tmp_path / ".astrodb_cache" / "kdtree.kdtree.pkl").exists()
+    assert SourceTree.from_database(db).from_cache
+
+    # Writing to the database invalidates the cached tree
+    with db.engine.begin() as conn:
+        conn.execute(db.Sources.insert().values(source="Fake", ra_deg=1.0, dec_deg=1.0, reference="Naka95"))
+    tree = SourceTree.from_database(db)
+    assert not tree.from_cache
+    assert tree.match([1.0], [1.0])["source"][0] == "Fake"
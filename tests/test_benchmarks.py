@@ -0,0 +1,62 @@
+"""
+Tests for the synthetic data generator and the benchmark runner
+(scripts/synthetic_data.py, scripts/benchmarks.py)
+"""
+
+import json
+
+import pytest
+
+from scripts.adopted import check_adopted
+from scripts.benchmarks import compare_to_baseline, read_baselines, run_benchmarks, save_baseline
+from scripts.json_loader import build_db_parallel
+from scripts.synthetic_data import generate_data, source_name
+from scripts.validation import failed_rules, validate_database
+
+
+def test_synthetic_data(tmp_path):
+    names = generate_data(str(tmp_path / "data"), 30, seed=1)
+    assert names == [source_name(i) for i in range(30)]
+    files = sorted((tmp_path / "data" / "source").iterdir())
+    assert len(files) == 30
+    assert (tmp_path / "data" / "reference" / "Publications.json").exists()
+
+    # Same seed, same files
+    generate_data(str(tmp_path / "again"), 30, seed=1)
+    assert [f.read_bytes() for f in files] == [
+        f.read_bytes() for f in sorted((tmp_path / "again" / "source").iterdir())
+    ]
+    with pytest.raises(FileExistsError):
+        generate_data(str(tmp_path / "data"), 30, seed=1)
+
+    # The generated rows satisfy the foreign keys, the Check constraints, and the adopted flags
+    db = build_db_parallel(db_name=str(tmp_path / "synthetic"), data_path=str(tmp_path / "data"), workers=1)
+    assert db.query(db.Sources).count() == 30
+    assert db.query(db.Photometry).count() == 30 * 5
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA foreign_key_check").all() == []
+    assert len(failed_rules(validate_database(db))) == 0
+    assert len(check_adopted(db)) == 0
+
+
+def test_run_benchmarks(tmp_path):
+    cases = ["cone_search", "name_resolution", "validation"]
+    results = run_benchmarks(n_sources=20, cases=cases, repeat=1, work_dir=str(tmp_path))
+    assert list(results) == cases
+    assert all(result["best"] > 0 and result["repeat"] == 1 for result in results.values())
+
+    path = str(tmp_path / "baselines.json")
+    machine = {"platform": "test", "calibration": 0.5}
+    save_baseline(results, 20, machine=machine, path=path)
+    assert read_baselines(path)["20"] == json.loads(json.dumps({**results, "machine": machine}))
+
+    # Twice as slow as the baseline is a regression, cases without baseline are not
+    baseline = {"cone_search": {"best": results["cone_search"]["best"] / 2}}
+    comparison = compare_to_baseline(results, baseline, threshold=0.25)
+    assert list(comparison["case"][comparison["regression"]]) == ["cone_search"]
+    assert comparison["baseline_s"][1] is None
+
+    # The baseline is scaled by the calibration times: on a machine twice as slow, it is not a regression
+    baseline["machine"] = {"calibration": 0.5}
+    comparison = compare_to_baseline(results, baseline, threshold=0.25, machine={"calibration": 1.0})
+    assert not any(comparison["regression"])
@@ -0,0 +1,37 @@
+"""
+Tests for the incremental schema documentation in scripts/build_schema_docs.py
+"""
+
+import os
+import shutil
+
+from scripts.build_schema_docs import SCHEMA_SUB_DIR, SCHEMA_TOC_NAME, build_docs
+
+
+def test_build_docs(tmp_path):
+    docs_dir = str(tmp_path / "docs")
+    manifest = str(tmp_path / "manifest.json")
+    schema_path = tmp_path / "schema.yaml"
+    shutil.copy("schema.yaml", schema_path)
+
+    # Same pages as the committed ones, rendered in parallel
+    written = build_docs(str(schema_path), docs_dir, manifest, workers=2)
+    committed = sorted(os.listdir(os.path.join("docs", SCHEMA_SUB_DIR)))
+    assert sorted(os.listdir(os.path.join(docs_dir, SCHEMA_SUB_DIR))) == committed
+    assert len(written) == len(committed) + 1
+    for name in committed:
+        with open(os.path.join("docs", SCHEMA_SUB_DIR, name), "rb") as f:
+            assert (tmp_path / "docs" / SCHEMA_SUB_DIR / name).read_bytes() == f.read(), name
+
+    # Nothing changed, nothing written
+    assert build_docs(str(schema_path), docs_dir, manifest) == []
+
+    # Only the edited table is written; a page edited by hand is restored
+    content = schema_path.read_text()
+    schema_path.write_text(content.replace("The Sources table contains all objects", "Edited: all objects", 1))
+    page = tmp_path / "docs" / SCHEMA_SUB_DIR / "Telescopes.md"
+    page.write_text("edited by hand")
+    written = build_docs(str(schema_path), docs_dir, manifest)
+    assert sorted(os.path.basename(path) for path in written) == ["Sources.md", "Telescopes.md"]
+    assert "Edited" in (tmp_path / "docs" / SCHEMA_SUB_DIR / "Sources.md").read_text()
+    assert (tmp_path / "docs" / SCHEMA_TOC_NAME).exists()
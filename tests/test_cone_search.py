@@ -0,0 +1,79 @@
+"""
+Tests for the indexed cone search in scripts/cone_search.py
+"""
+
+import pytest
+from astropy import units as u
+from astropy.table import Table
+from sqlalchemy import event
+
+from scripts.cone_search import _search_ranges, cone_search, crossmatch
+
+
+def test_cone_search(db):
+    t = cone_search(db, 92.6442, -21.8646, 10 * u.arcsec)
+    assert list(t["source"]) == ["Gl 229b"]
+    assert t["separation_arcsec"][0] == pytest.approx(0, abs=1e-6)
+
+    # HAT-P-12b and WASP-76b are 2 degrees apart
+    t = cone_search(db, 56.6326, 12.2729, 1.01 * u.deg)
+    assert sorted(t["source"]) == ["HAT-P-12b", "WASP-76b"]
+
+    t = cone_search(db, 318.533, -22.86, 1 * u.arcsec, table="Positions")
+    assert list(t["source"]) == ["2MASS J21140802-2251358"]
+
+    assert len(cone_search(db, 0, 0, 10)) == 0
+
+
+def test_cone_search_uses_index(db):
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM Sources "
+            "WHERE dec_deg BETWEEN -22 AND -21 AND ra_deg BETWEEN 92 AND 93"
+        ).all()
+    assert "IDX_Sources_dec_deg_ra_deg" in str(plan)
+
+
+def test_search_ranges():
+    # Right ascension wraps around 0/360
+    (dec_min, dec_max), ra_ranges = _search_ranges(359.9, 0, 0.5)
+    assert (dec_min, dec_max) == (-0.5, 0.5)
+    assert ra_ranges[0][1] == 360.0 and ra_ranges[1][0] == 0.0
+    assert ra_ranges[1][1] == pytest.approx(0.4)
+
+    # Full right ascension range at the poles
+    assert _search_ranges(10, 89.9, 0.5)[1] == [(0.0, 360.0)]
+    assert _search_ranges(10, -89.5, 0.5)[1] == [(0.0, 360.0)]
+    # Close to a pole the half-width tends to 90 degrees
+    ra_ranges = _search_ranges(180, 89.0, 0.999999)[1]
+    assert len(ra_ranges) == 1 and 90 < ra_ranges[0][0] < ra_ranges[0][1] < 270
+
+
+def test_crossmatch(db):
+    catalog = Table({"ra": [92.6442, 174.96308, 10.0], "dec": [-21.8646, -31.989305, 10.0]})
+    matches = crossmatch(db, catalog, radius=2 * u.arcsec)
+    assert list(matches["catalog_index"]) == [0, 1]
+    assert list(matches["source"]) == ["Gl 229b", "TWA 26"]
+
+
+def test_crossmatch_one_query(db):
+    # Two Sources within 1.1 degrees of the first row, the second row is unmatched, the third is not finite
+    catalog = Table({"ra": [56.7, 10.0, float("nan")], "dec": [12.2729, 10.0, 0.0]})
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        matches = crossmatch(db, catalog, radius=1.1 * u.deg)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    assert len(statements) == 1
+    assert list(matches["catalog_index"]) == [0, 0]
+    assert list(matches["source"]) == ["WASP-76b", "HAT-P-12b"]
+    assert matches["separation_arcsec"][0] < matches["separation_arcsec"][1]
+
+    nearest = crossmatch(db, catalog, radius=1.1 * u.deg, nearest=True)
+    assert list(nearest["source"]) == ["WASP-76b"]
+    assert len(crossmatch(db, catalog[1:], radius=1 * u.arcsec)) == 0
@@ -3,7 +3,7 @@ Functions to test the database contents
 As users add their own data, these tests should be modified to reflect the new data.
 """
 
-from sqlalchemy import or_
+from scripts.validation import failed_rules, violating_rows
 
 
 def test_table_presence(db):
@@ -42,25 +42,15 @@ def test_table_presence(db):
     assert "Spectra" in db.metadata.tables.keys()
 
 
-def test_magnitudes(db):
-    # Check that magnitudes make sense.
-    t = (
-        db.query(db.Photometry.c.magnitude)
-        .filter(
-            or_(
-                db.Photometry.c.magnitude.is_(None),
-                db.Photometry.c.magnitude > 100,
-                db.Photometry.c.magnitude < -1,
-            )
-        )
-        .astropy()
-    )
+def test_magnitudes(db, validation_report):
+    # Check that magnitudes make sense (rules declared for Photometry in validation.yaml)
+    failed = failed_rules(validation_report, "Photometry")
 
-    if len(t) > 0:
-        print(f"\n{len(t)} Photometry failed magnitude checks")
-        print(t)
+    if len(failed) > 0:
+        print(f"\n{max(failed['n_violations'])} Photometry failed magnitude checks")
+        print(violating_rows(db, "Photometry"))
 
-    assert len(t) == 0, f"{len(t)} Photometry failed magnitude checks"
+    assert len(failed) == 0, f"Photometry failed checks: {list(failed['rule'])}"
 
 
 def test_companion_relationships(db):
@@ -71,3 +61,11 @@ def test_companion_relationships(db):
     assert (
         len(t) == n_companion_relationships
     ), f"Found {len(t)} entries in the Companion Relationships table, expected {n_companion_relationships}"
+
+
+def test_adopted(adopted_report):
+    # Test that there is one adopted measurement per source in every table with an adopted flag
+    if len(adopted_report) > 0:
+        print(adopted_report)
+
+    assert len(adopted_report) == 0, f"Found {len(adopted_report)} sources with incorrect 'adopted' labels"
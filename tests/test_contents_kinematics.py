@@ -3,10 +3,10 @@ Test kinematic and astrometry data
 As users add their own data, these tests should be modified to reflect the new data.
 """
 
-from sqlalchemy import func, or_
+from sqlalchemy import or_
 
 
-def test_radial_velocities(db):
+def test_radial_velocities(db, adopted_report):
     # Test that Radial Velocities has expected number of entries
     t = db.query(db.RadialVelocities.c.rv_kms).astropy()
 
@@ -16,22 +16,14 @@ def test_radial_velocities(db):
     ), f"Found {len(t)} entries in the Radial Velocities table, expected {n_radial_velocities}"
 
     # Test that there is one adopted radial velocity measurement per source
-    t = (
-        db.query(
-            db.RadialVelocities.c.source,
-            func.sum(db.RadialVelocities.c.adopted).label("adopted_counts"),
-        )
-        .group_by(db.RadialVelocities.c.source)
-        .having(func.sum(db.RadialVelocities.c.adopted) != 1)
-        .astropy()
-    )
+    t = adopted_report[adopted_report["table"] == "RadialVelocities"]
 
     assert (
         len(t) == 0
     ), f"Found {len(t)} radial velocity measurements with incorrect 'adopted' labels"
 
 
-def test_proper_motions(db):
+def test_proper_motions(db, adopted_report):
     # Test that Radial Velocities has expected number of entries
     t = db.query(db.ProperMotions.c.pm_ra).astropy()
 
@@ -41,22 +33,14 @@ def test_proper_motions(db):
     ), f"Found {len(t)} entries in the Proper Motions table, expected {n_proper_motions}"
 
     # Test that there is one adopted proper motion measurement per source
-    t = (
-        db.query(
-            db.ProperMotions.c.source,
-            func.sum(db.ProperMotions.c.adopted).label("adopted_counts"),
-        )
-        .group_by(db.ProperMotions.c.source)
-        .having(func.sum(db.ProperMotions.c.adopted) != 1)
-        .astropy()
-    )
+    t = adopted_report[adopted_report["table"] == "ProperMotions"]
 
     assert (
         len(t) == 0
     ), f"Found {len(t)} proper motion measurements with incorrect 'adopted' labels"
 
 
-def test_parallaxes(db):
+def test_parallaxes(db, adopted_report):
     # Test that Parallaxes has expected number of entries
     t = db.query(db.Parallaxes.c.parallax_mas).astropy()
 
@@ -66,15 +50,7 @@ def test_parallaxes(db):
     ), f"Found {len(t)} entries in the Parallaxes table, expected {n_parallaxes}"
 
     # Test that there is one adopted parallax measurement per source
-    t = (
-        db.query(
-            db.Parallaxes.c.source,
-            func.sum(db.Parallaxes.c.adopted).label("adopted_counts"),
-        )
-        .group_by(db.Parallaxes.c.source)
-        .having(func.sum(db.Parallaxes.c.adopted) != 1)
-        .astropy()
-    )
+    t = adopted_report[adopted_report["table"] == "Parallaxes"]
 
     assert (
         len(t) == 0
@@ -2,7 +2,7 @@
 Functions to test the contents of the Morphology table.
 """
 
-from sqlalchemy import or_
+from scripts.validation import failed_rules, violating_rows
 
 
 def test_morphology(db):
@@ -12,23 +12,7 @@ def test_morphology(db):
     assert len(t) == n_morphology, f"Found {len(t)} entries in the Morphology table, expected {n_morphology}"
 
 
-def test_for_valid_morphology(db):
-    # Verify that all sources have valid morphology
-    t = (
-        db.query(db.Morphology.c.source, db.Morphology.c.position_angle_deg, db.Morphology.c.ellipticity, db.Morphology.c.half_light_radius_arcmin)
-        .filter(
-            or_(
-                db.Morphology.c.position_angle_deg.is_(None),
-                db.Morphology.c.position_angle_deg < 0,
-                db.Morphology.c.position_angle_deg > 360,
-                db.Morphology.c.ellipticity.is_(None),
-                db.Morphology.c.ellipticity < 0,
-                db.Morphology.c.ellipticity > 1,
-                db.Morphology.c.half_light_radius_arcmin.is_(None),
-                db.Morphology.c.half_light_radius_arcmin < 0,
-            )
-        )
-        .astropy()
-    )
-
-    assert len(t) == 0, f"{len(t)} Morphology failed morphology checks: {t}"
+def test_for_valid_morphology(db, validation_report):
+    # Verify that all sources have valid morphology (rules declared for Morphology in validation.yaml)
+    failed = failed_rules(validation_report, "Morphology")
+    assert len(failed) == 0, f"Morphology failed morphology checks {list(failed['rule'])}: {violating_rows(db, 'Morphology')}"
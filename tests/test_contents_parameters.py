@@ -2,7 +2,7 @@
 Functions to test the contents of the various Parameters tables.
 As users add their own data, these tests should be modified to reflect the new data.
 """
-from astropy import units as u
+from scripts.units import check_units
 
 
 def test_companion_parameters(db):
@@ -13,26 +13,11 @@ def test_companion_parameters(db):
         len(t) == n_companion_parameters
     ), f"Found {len(t)} entries in the Companion Parameters table, expected {n_companion_parameters}"
 
-    # Test units are astropy.unit resolvable
-    t = (
-        db.query(db.CompanionParameters)
-        .filter(db.CompanionParameters.c.unit.is_not(None))
-        .distinct()
-        .astropy()
-    )
-    unit_fail = []
-    for x in t:
-        unit = x["unit"]
-        try:
-            assert u.Unit(unit, parse_strict="raise")
-        except ValueError:
-            print(f"{unit} is not a recognized astropy unit")
-            counts = (
-                db.query(db.CompanionParameters)
-                .filter(db.CompanionParameters.c.unit == unit)
-                .count()
-            )
-            unit_fail.append({unit: counts})  # count of how many of that unit there is
+    # Test units are astropy.unit resolvable (each distinct unit string is parsed once)
+    failures = check_units(db, tables=["CompanionParameters"])
+    for unit in failures["unit"]:
+        print(f"{unit} is not a recognized astropy unit")
+    unit_fail = [{row["unit"]: row["n_rows"]} for row in failures]  # count of how many of that unit there is
 
     assert len(unit_fail) == 0, f"Some parameter units did not resolve: {unit_fail}"
 
@@ -44,26 +29,11 @@ def test_modeled_parameters(db):
     n_parameters = 2
     assert len(t) == n_parameters, f"Found {len(t)} entries in the ModeledParameters table, expected {n_parameters}"
 
-    # Test units are astropy.unit resolvable
-    t = (
-        db.query(db.ModeledParameters)
-        .filter(db.ModeledParameters.c.unit.is_not(None))
-        .distinct()
-        .astropy()
-    )
-    unit_fail = []
-    for x in t:
-        unit = x["unit"]
-        try:
-            assert u.Unit(unit, parse_strict="raise")
-        except ValueError:
-            print(f"{unit} is not a recognized astropy unit")
-            counts = (
-                db.query(db.ModeledParameters)
-                .filter(db.ModeledParameters.c.unit == unit)
-                .count()
-            )
-            unit_fail.append({unit: counts})  # count of how many of that unit there is
+    # Test units are astropy.unit resolvable (each distinct unit string is parsed once)
+    failures = check_units(db, tables=["ModeledParameters"])
+    for unit in failures["unit"]:
+        print(f"{unit} is not a recognized astropy unit")
+    unit_fail = [{row["unit"]: row["n_rows"]} for row in failures]  # count of how many of that unit there is
 
     assert len(unit_fail) == 0, f"Some parameter units did not resolve: {unit_fail}"
 
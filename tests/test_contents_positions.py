@@ -2,7 +2,7 @@
 Functions to test the contents of the Positions table.
 """
 
-from sqlalchemy import or_
+from scripts.validation import failed_rules, violating_rows
 
 
 def test_positions(db):
@@ -12,21 +12,7 @@ def test_positions(db):
     assert len(t) == n_positions, f"Found {len(t)} entries in the Positions table, expected {n_positions}"
 
 
-def test_for_valid_coordinates(db):
-    # Verify that all sources have valid coordinates
-    t = (
-        db.query(db.Positions.c.source, db.Positions.c.ra_deg, db.Positions.c.dec_deg)
-        .filter(
-            or_(
-                db.Positions.c.ra_deg.is_(None),
-                db.Positions.c.ra_deg < 0,
-                db.Positions.c.ra_deg > 360,
-                db.Positions.c.dec_deg.is_(None),
-                db.Positions.c.dec_deg < -90,
-                db.Positions.c.dec_deg > 90,
-            )
-        )
-        .astropy()
-    )
-
-    assert len(t) == 0, f"{len(t)} Positions failed coordinate checks: {t}"
\ No newline at end of file
+def test_for_valid_coordinates(db, validation_report):
+    # Verify that all sources have valid coordinates (rules declared for Positions in validation.yaml)
+    failed = failed_rules(validation_report, "Positions")
+    assert len(failed) == 0, f"Positions failed coordinate checks {list(failed['rule'])}: {violating_rows(db, 'Positions')}"
\ No newline at end of file
@@ -5,7 +5,8 @@ As users add their own data, these tests should be modified to reflect the new d
 """
 
 import pytest
-from sqlalchemy import or_
+
+from scripts.validation import failed_rules, violating_rows
 
 
 def test_sources(db):
@@ -23,21 +24,7 @@ def test_sources_reference(db, reference, value):
     assert n_sources == value, f"found {n_sources} sources for {reference}"
 
 
-def test_coordinates(db):
-    # Verify that all sources have valid coordinates
-    t = (
-        db.query(db.Sources.c.source, db.Sources.c.ra_deg, db.Sources.c.dec_deg)
-        .filter(
-            or_(
-                db.Sources.c.ra_deg.is_(None),
-                db.Sources.c.ra_deg < 0,
-                db.Sources.c.ra_deg > 360,
-                db.Sources.c.dec_deg.is_(None),
-                db.Sources.c.dec_deg < -90,
-                db.Sources.c.dec_deg > 90,
-            )
-        )
-        .astropy()
-    )
-
-    assert len(t) == 0, f"{len(t)} Sources failed coordinate checks: {t}"
+def test_coordinates(db, validation_report):
+    # Verify that all sources have valid coordinates (rules declared for Sources in validation.yaml)
+    failed = failed_rules(validation_report, "Sources")
+    assert len(failed) == 0, f"Sources failed coordinate checks {list(failed['rule'])}: {violating_rows(db, 'Sources')}"
@@ -1,11 +1,15 @@
 """
 Tests that the database functions work as expected.
 Users should hopefully not need to modify these tests.
+These tests write to the database, so they are marked mutates_db and get a
+private copy of it, discarded after each test.
 """
 
+import pytest
 from sqlalchemy.ext.automap import automap_base
 
 
+@pytest.mark.mutates_db
 def test_orm_use(db):
     # Tests validation using the SQLAlchemy ORM
 
@@ -16,7 +20,7 @@ def test_orm_use(db):
     Sources = Base.classes.Sources
     Names = Base.classes.Names
 
-    # Adding and removing a basic source
+    # Adding a basic source
     s = Sources(source="V4046 Sgr", ra_deg=273.54, dec_deg=-32.79, reference="Cohe03")
     n = Names(source="V4046 Sgr", other_name="Hen 3-1636")
     with db.session as session:
@@ -27,15 +31,8 @@ def test_orm_use(db):
     assert db.query(db.Sources).filter(db.Sources.c.source == "V4046 Sgr").count() == 1
     assert db.query(db.Names).filter(db.Names.c.other_name == "Hen 3-1636").count() == 1
 
-    # Remove added source so other tests don't include it
-    with db.session as session:
-        session.delete(n)  # delete Names before Sources
-        session.delete(s)
-        session.commit()
-
-    assert db.query(db.Sources).filter(db.Sources.c.source == "V4046 Sgr").count() == 0
-
 
+@pytest.mark.mutates_db
 def test_adding_data(db):
 
     # Confirm the source isn't already present
@@ -101,15 +98,3 @@ def test_adding_data(db):
         db.query(db.Photometry).filter(db.Photometry.c.source == "V4046 Sgr").count()
         == 1
     )
-
-    # Clean up — remove in reverse FK order so constraints aren't violated
-    with db.session as session:
-        session.delete(phot)
-        session.commit()
-    with db.session as session:
-        session.delete(s)
-        session.delete(ref)
-        session.delete(tel)
-        session.delete(pf)
-        session.delete(reg)
-        session.commit()
@@ -0,0 +1,81 @@
+"""
+Tests for the cached database snapshots in scripts/db_snapshot.py
+"""
+
+import os
+import shutil
+
+import pytest
+from astrodb_utils.loaders import build_db_from_json
+from sqlalchemy.exc import OperationalError
+
+from scripts.db_snapshot import build_snapshot, memory_copy, restore_snapshot
+
+
+def test_snapshot_reused(tmp_path):
+    shutil.copytree("data", tmp_path / "data")
+    cache_dir = str(tmp_path / "snapshots")
+    kwargs = {"db_name": "snapshot", "data_path": str(tmp_path / "data"), "cache_dir": cache_dir}
+
+    path = build_snapshot(**kwargs)
+    mtime = os.stat(path).st_mtime_ns
+    assert build_snapshot(**kwargs) == path
+    assert os.stat(path).st_mtime_ns == mtime
+
+    # Changing a data file gives a new snapshot and removes the old one
+    source_file = tmp_path / "data" / "source" / "gl_229b.json"
+    source_file.write_text(source_file.read_text().replace("Gl 229b", "Gl 229 B"))
+    new_path = build_snapshot(**kwargs)
+    assert new_path != path
+    assert not os.path.exists(path)
+    assert sorted(os.listdir(cache_dir)) == sorted([os.path.basename(new_path), "snapshot.manifest.json"])
+
+    db = restore_snapshot(new_path, str(tmp_path / "restored.sqlite"))
+    assert db.query(db.Sources).filter(db.Sources.c.source == "Gl 229 B").count() == 1
+    assert os.stat(tmp_path / "restored.sqlite").st_mtime_ns == os.stat(new_path).st_mtime_ns
+
+
+def test_memory_copy_isolated(db, db_snapshot):
+    n_sources = db.query(db.Sources).count()
+    copy = memory_copy(db_snapshot, lookup_tables=db._lookup_tables)
+    assert copy.query(copy.Sources).count() == n_sources
+
+    with copy.engine.begin() as conn:
+        conn.execute(copy.Names.delete())
+        conn.execute(copy.Sources.insert().values(source="V4046 Sgr", ra_deg=273.54, dec_deg=-32.79, reference="Cohe03"))
+    assert copy.query(copy.Sources).count() == n_sources + 1
+    assert copy.query(copy.Names).count() == 0
+
+    # Neither the snapshot nor another copy see the changes
+    other = memory_copy(db_snapshot, lookup_tables=db._lookup_tables)
+    assert other.query(other.Sources).count() == n_sources
+    assert other.query(other.Names).count() == db.query(db.Names).count()
+    assert db.query(db.Sources).count() == n_sources
+    copy.engine.dispose()
+    other.engine.dispose()
+
+
+def test_db_read_only(db):
+    with pytest.raises(OperationalError, match="readonly"):
+        with db.engine.begin() as conn:
+            conn.execute(db.Names.delete())
+
+
+@pytest.mark.mutates_db
+def test_mutates_db_private_copy(db, db_readonly):
+    with db.engine.begin() as conn:
+        conn.execute(db.Names.delete())
+    assert db.query(db.Names).count() == 0
+    assert db_readonly.query(db_readonly.Names).count() > 0
+
+
+def test_snapshot_matches_build_db_from_json(tmp_path, db):
+    # The tests use the snapshot, so check it against the loader that builds the released database
+    reference = build_db_from_json(db_name=str(tmp_path / "reference"))
+    try:
+        for table in reference.metadata.sorted_tables:
+            assert sorted(map(tuple, db.query(db.metadata.tables[table.name]).all()), key=str) == sorted(
+                map(tuple, reference.query(table).all()), key=str
+            ), f"{table.name} differs from build_db_from_json"
+    finally:
+        reference.engine.dispose()
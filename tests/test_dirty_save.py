@@ -0,0 +1,63 @@
+"""
+Tests for the dirty-tracking save in scripts/dirty_save.py
+"""
+
+import json
+import os
+import shutil
+
+from scripts.dirty_save import track_changes
+from scripts.json_loader import build_db_parallel
+
+
+def test_save_only_modified_files(tmp_path):
+    data_path = tmp_path / "data"
+    shutil.copytree("data", data_path)
+    db = build_db_parallel(db_name=str(tmp_path / "dirty"), data_path=str(data_path), workers=1)
+
+    tracker = track_changes(db)
+    with db.engine.begin() as conn:
+        conn.execute(db.Names.insert().values(source="Gl 229b", other_name="Fake Gl 229b"))
+        conn.execute(db.Publications.insert().values(reference="Fake25"))
+        for table in (db.Names, db.Morphology, db.Sources):
+            conn.execute(table.delete().where(table.c.source == "Draco II"))
+    assert tracker.sources == {"Gl 229b", "Draco II"}
+    assert tracker.lookup_tables == {"Publications"}
+
+    for path in (data_path / "source" / "twa_26.json", data_path / "reference" / "Telescopes.json"):
+        os.utime(path, ns=(0, 0))
+    tracker.save_database(str(data_path))
+
+    # Modified source rewritten, deleted source removed, other sources untouched
+    data = json.loads((data_path / "source" / "gl_229b.json").read_text())
+    assert {"other_name": "Fake Gl 229b"} in data["Names"]
+    assert not (data_path / "source" / "draco2.json").exists()
+    assert os.stat(data_path / "source" / "twa_26.json").st_mtime_ns == 0
+    assert "Fake25" in (data_path / "reference" / "Publications.json").read_text()
+    assert os.stat(data_path / "reference" / "Telescopes.json").st_mtime_ns == 0
+    assert tracker.sources == set()
+
+
+def test_new_sources_do_not_scan_files(tmp_path):
+    data_path = tmp_path / "data"
+    shutil.copytree("data", data_path)
+    db = build_db_parallel(db_name=str(tmp_path / "dirty"), data_path=str(data_path), workers=1)
+
+    tracker = track_changes(db)
+    with db.engine.begin() as conn:
+        conn.execute(db.Sources.insert().values(source="New Source", ra_deg=1.0, dec_deg=2.0, reference="Naka95"))
+        conn.execute(db.Names.insert().values(source="New Source", other_name="New Source"))
+        conn.execute(db.Names.insert().values(source="Gl 229b", other_name="Fake Gl 229b"))
+    tracker.save_database(str(data_path))
+
+    # Created and conventionally named sources are saved without parsing the source directory
+    assert tracker._file_index is None
+    assert json.loads((data_path / "source" / "new_source.json").read_text())["Sources"][0]["ra_deg"] == 1.0
+
+    # An existing source whose file is not named after it (draco2.json) is found, and renamed
+    with db.engine.begin() as conn:
+        conn.execute(db.Sources.update().where(db.Sources.c.source == "Draco II").values(comments="Updated"))
+    tracker.save_database(str(data_path))
+    assert not (data_path / "source" / "draco2.json").exists()
+    assert json.loads((data_path / "source" / "draco_ii.json").read_text())["Sources"][0]["comments"] == "Updated"
+    assert tracker._file_index[1]["Draco II"] == "draco_ii.json"
@@ -1,17 +1,16 @@
 # Test using the Felis validation tools
 
-import yaml
 from pydantic import ValidationError
 
-from felis.datamodel import Schema
 from astrodb_utils.loaders import DatabaseSettings
+from scripts.schema_cache import load_schema
 
 def test_schema():
     db_settings = DatabaseSettings(settings_file="database.toml")
     schema_path = db_settings.felis_path
-    data = yaml.safe_load(open(schema_path, "r"))
 
+    # Validated when first parsed, then cached until schema.yaml changes
     try:
-        schema = Schema.model_validate(data)  # noqa: F841
+        schema = load_schema(schema_path)  # noqa: F841
     except ValidationError as e:
         raise AssertionError(f"Schema failed Felis validation:\n{e}") from e
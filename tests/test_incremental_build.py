@@ -0,0 +1,47 @@
+"""
+Tests for the incremental JSON-to-SQLite rebuild in scripts/incremental_build.py
+"""
+
+import json
+import os
+import shutil
+
+from scripts.incremental_build import build_db_incremental, manifest_path
+
+
+def _build(tmp_path, name="incremental", **kwargs):
+    return build_db_incremental(
+        db_name=str(tmp_path / name),
+        data_path=str(tmp_path / "data"),
+        **kwargs,
+    )
+
+
+def test_incremental_build(tmp_path):
+    shutil.copytree("data", tmp_path / "data")
+
+    db = _build(tmp_path)
+    manifest_file = manifest_path(str(tmp_path / "incremental.sqlite"))
+    assert db.query(db.Sources).count() == 7
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        assert json.load(f)["source"]["draco2.json"]["source"] == "Draco II"
+
+    # Add a name to one source and remove another source entirely
+    source_file = tmp_path / "data" / "source" / "gl_229b.json"
+    data = json.loads(source_file.read_text())
+    data["Names"].append({"other_name": "Fake Gl 229b"})
+    source_file.write_text(json.dumps(data, indent=4))
+    os.remove(tmp_path / "data" / "source" / "draco2.json")
+
+    db = _build(tmp_path)
+    assert db.query(db.Sources).count() == 6
+    assert db.query(db.Names).filter(db.Names.c.other_name == "Fake Gl 229b").count() == 1
+    assert db.query(db.Sources).filter(db.Sources.c.source == "Draco II").count() == 0
+    assert db.query(db.Names).filter(db.Names.c.source == "Gl 229b").count() == 3
+
+    # Compare against a full rebuild of the same data
+    full = _build(tmp_path, name="full", full=True)
+    for table in full.metadata.sorted_tables:
+        assert sorted(map(tuple, db.query(table).all()), key=str) == sorted(
+            map(tuple, full.query(table).all()), key=str
+        ), f"{table.name} differs from a full rebuild"
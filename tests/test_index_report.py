@@ -0,0 +1,42 @@
+"""
+Tests for the foreign key index report in scripts/index_report.py
+"""
+
+import yaml
+
+from scripts.index_report import foreign_key_indexes, query_plans, suggested_indexes, unindexed_foreign_keys
+
+
+def test_foreign_keys_indexed():
+    assert len(unindexed_foreign_keys()) == 0, unindexed_foreign_keys().pformat_all()
+
+    # Foreign keys on source are covered by the primary keys
+    report = foreign_key_indexes()
+    assert set(report[report["columns"] == "source"]["index"]) == {"primary key"}
+    # One index covers the telescope and instrument foreign keys of Spectra
+    spectra = report[report["table"] == "Spectra"]
+    assert set(spectra[spectra["referenced_table"] == "Telescopes"]["index"]) == set(
+        spectra[spectra["referenced_table"] == "Instruments"]["index"]
+    )
+
+
+def test_suggested_indexes():
+    report = foreign_key_indexes()
+    report["index"][report["table"] == "Spectra"] = ""
+    suggested = suggested_indexes(report)
+    assert list(suggested) == ["Spectra"]
+    indexes = yaml.safe_load("\n".join(suggested["Spectra"]))
+    # The telescope foreign key is covered by the index of the composite Instruments foreign key
+    assert [index["name"] for index in indexes] == [
+        "IDX_Spectra_telescope_instrument_mode",
+        "IDX_Spectra_source",
+        "IDX_Spectra_regime",
+        "IDX_Spectra_reference",
+    ]
+    assert indexes[0]["columns"] == ["#Spectra.telescope", "#Spectra.instrument", "#Spectra.mode"]
+
+
+def test_query_plans(db):
+    plans = query_plans(db)
+    assert len(plans) == len(foreign_key_indexes())
+    assert not any(plans["full_scan"]), plans[plans["full_scan"]].pformat_all()
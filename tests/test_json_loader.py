@@ -0,0 +1,41 @@
+"""
+Tests for the parallel JSON loader in scripts/json_loader.py
+"""
+
+import shutil
+
+from astrodbkit.astrodb import Database, create_database
+
+from scripts.json_loader import build_db_parallel, load_database_parallel
+
+
+def test_parallel_load_matches_serial(db, tmp_path):
+    # Start from copies of one empty database, as the order of CREATE INDEX
+    # statements emitted from the Felis schema is not fixed between builds
+    create_database("sqlite:///" + str(tmp_path / "empty.sqlite"), felis_schema="schema.yaml")
+    for name, workers in (("serial", 1), ("parallel", 2)):
+        shutil.copy(tmp_path / "empty.sqlite", tmp_path / f"{name}.sqlite")
+        loaded = Database("sqlite:///" + str(tmp_path / f"{name}.sqlite"), lookup_tables=db._lookup_tables)
+        load_database_parallel(loaded, "data", workers=workers)
+        loaded.engine.dispose()
+
+    # Same bytes regardless of the number of workers
+    assert (tmp_path / "serial.sqlite").read_bytes() == (tmp_path / "parallel.sqlite").read_bytes()
+
+    # Same contents as the astrodbkit loader used by the db fixture
+    for table in db.metadata.sorted_tables:
+        expected = sorted(map(tuple, db.query(table).all()), key=str)
+        assert sorted(map(tuple, loaded.query(table).all()), key=str) == expected, table.name
+
+
+def test_bulk_load(db, tmp_path):
+    bulk = build_db_parallel(db_name=str(tmp_path / "bulk"), workers=1, bulk=True)
+
+    for table in db.metadata.sorted_tables:
+        expected = sorted(map(tuple, db.query(table).all()), key=str)
+        assert sorted(map(tuple, bulk.query(table).all()), key=str) == expected, table.name
+
+    # Bulk loading settings are restored afterwards
+    with bulk.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "delete"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 2
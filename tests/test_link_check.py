@@ -0,0 +1,126 @@
+"""
+Tests for the link checker in scripts/link_check.py, against a local HTTP stand-in
+"""
+
+import threading
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import scripts.link_check
+from scripts.json_loader import build_db_parallel
+from scripts.link_check import LinkChecker, check_spectra_urls, check_urls
+from scripts.response_cache import ResponseCache
+
+ETAG = '"abc123"'
+
+
+@pytest.fixture
+def http_server():
+    requests_seen = Counter()
+    conditional = Counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_HEAD(self):
+            requests_seen[self.path] += 1
+            if self.path == "/spectrum.fits":
+                if self.headers.get("If-None-Match") == ETAG:
+                    conditional[self.path] += 1
+                    self.send_response(304)
+                else:
+                    self.send_response(200)
+                    self.send_header("ETag", ETAG)
+                    self.send_header("Last-Modified", "Wed, 01 Jan 2025 00:00:00 GMT")
+            elif self.path == "/flaky.fits" and requests_seen[self.path] == 1:
+                self.send_response(503)
+            elif self.path == "/flaky.fits":
+                self.send_response(200)
+            else:
+                self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", requests_seen, conditional
+    server.shutdown()
+    server.server_close()
+
+
+def test_check_urls(http_server, tmp_path):
+    base, requests_seen, conditional = http_server
+    urls = [base + "/spectrum.fits", base + "/missing.fits", base + "/flaky.fits", "http://127.0.0.1:1/closed.fits"]
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), "urls", ttl=3600)
+    checker = LinkChecker(workers=4, per_host=2, timeout=2, retries=2, backoff=0.01)
+
+    results = check_urls(urls, cache=cache, checker=checker)
+    assert [results[url]["status"] for url in urls] == [200, 404, 200, None]
+    assert [results[url]["ok"] for url in urls] == [True, False, True, False]
+    assert results[urls[0]]["etag"] == ETAG
+    assert results[urls[0]]["last_modified"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+    assert results[urls[3]]["error"].startswith("ConnectionError")
+    assert requests_seen["/flaky.fits"] == 2  # retried after the 503
+
+    # Fresh results are not checked again
+    requests_seen.clear()
+    check_urls(urls, cache=cache, checker=checker)
+    assert sum(requests_seen.values()) == 0
+
+    # Failed checks are rechecked sooner than working URLs
+    results = check_urls(urls, cache=cache, checker=checker, failure_ttl=0)
+    assert requests_seen == Counter({"/missing.fits": 1})
+    assert results[urls[3]]["error"].startswith("ConnectionError")
+
+    # Stale results are rechecked with conditional requests
+    cache.ttl = 0
+    results = check_urls(urls, cache=cache, checker=checker)
+    assert conditional["/spectrum.fits"] == 1
+    assert results[urls[0]]["status"] == 304 and results[urls[0]]["ok"]
+    assert results[urls[0]]["etag"] == ETAG
+    checker.close()
+
+
+def test_check_spectra_urls(http_server, tmp_path):
+    base, _, _ = http_server
+    db = build_db_parallel(db_name=str(tmp_path / "links"), workers=1)
+    with db.engine.begin() as conn:
+        for day, file in enumerate(("spectrum.fits", "missing.fits"), start=1):
+            conn.execute(
+                db.Spectra.insert().values(
+                    source="TWA 26",
+                    access_url=f"{base}/{file}",
+                    regime="gamma-ray",
+                    telescope="2MASS",
+                    instrument="2MASS",
+                    mode="imaging",
+                    observation_date=datetime(2020, 1, day),
+                    reference="Naka95",
+                )
+            )
+
+    report = check_spectra_urls(db, cache=ResponseCache(":memory:", "urls", ttl=3600))
+    report.sort("access_url")
+    assert list(report["status"]) == [404, 200]
+    assert list(report["ok"]) == [False, True]
+
+
+def test_default_cache_closed(tmp_path, monkeypatch):
+    closed = []
+
+    class RecordingCache(ResponseCache):
+        def close(self):
+            closed.append(self.path)
+            super().close()
+
+    monkeypatch.setattr(scripts.link_check, "DEFAULT_CACHE_FILE", str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr(scripts.link_check, "ResponseCache", RecordingCache)
+    assert check_urls([]) == {}
+    assert closed == [str(tmp_path / "responses.sqlite")]
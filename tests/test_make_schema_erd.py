@@ -0,0 +1,104 @@
+"""
+Tests for the cached ERD rendering in scripts/make_schema_erd.py
+
+Rendering needs eralchemy2 and graphviz; here the renderer is replaced to test
+which diagrams are rendered.
+"""
+
+import os
+import re
+import shutil
+import sys
+import types
+
+import pytest
+
+import scripts.make_schema_erd as erd
+from scripts.schema_cache import load_metadata, load_schema
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    calls = []
+
+    def fake_render(schema_path, tables, filename):
+        calls.append(os.path.basename(filename))
+        with open(filename, "w") as f:
+            f.write(str(tables))
+        return filename
+
+    monkeypatch.setattr(erd, "render_diagram", fake_render)
+    return calls
+
+
+def test_diagram_tables():
+    schema = load_schema()
+    assert erd.diagram_tables(schema) == [table.name for table in schema.tables]
+    # Group tables and the tables they reference
+    assert set(erd.diagram_tables(schema, erd.GROUPS["companions"])) == {
+        "CompanionRelationships",
+        "CompanionParameters",
+        "CompanionList",
+        "Sources",
+        "Publications",
+    }
+
+
+def test_make_erd_skips_unchanged(tmp_path, renders):
+    schema_path = tmp_path / "schema.yaml"
+    shutil.copy("schema.yaml", schema_path)
+    kwargs = {
+        "schema_path": str(schema_path),
+        "figures_dir": str(tmp_path / "figures"),
+        "manifest_path": str(tmp_path / "manifest.json"),
+        "workers": 1,
+    }
+
+    erd.make_erd(fmt="svg", groups=True, **kwargs)
+    assert sorted(renders) == sorted(["schema_erd.svg"] + [f"schema_erd_{group}.svg" for group in erd.GROUPS])
+
+    # Descriptions are not in the diagrams
+    renders.clear()
+    content = schema_path.read_text()
+    schema_path.write_text(content.replace("The Sources table contains all objects", "All objects", 1))
+    assert erd.make_erd(fmt="svg", groups=True, **kwargs) == []
+
+    # A removed foreign key changes the diagrams showing its table
+    fk = """      - name: Morphology_reference_Publications_reference
+        "@type": "ForeignKey"
+        "@id": "#FK_Morphology_reference_Publications_reference"
+        description: Link Morphology reference to Publications table
+        columns:
+        - "#Morphology.reference"
+        referencedColumns:
+        - "#Publications.reference"
+"""
+    assert fk in content
+    schema_path.write_text(content.replace(fk, ""))
+    erd.make_erd(fmt="svg", groups=True, **kwargs)
+    assert sorted(renders) == ["schema_erd.svg", "schema_erd_parameters.svg"]
+
+    with pytest.raises(ValueError, match="format"):
+        erd.make_erd(fmt="gif", **kwargs)
+
+
+def test_render_diagram_tables(tmp_path, monkeypatch):
+    # eralchemy2 is replaced at its entry point, so the tables it is given are checked
+    calls = []
+    eralchemy2 = types.SimpleNamespace(render_er=lambda metadata, filename, **kwargs: calls.append((metadata, kwargs)))
+    monkeypatch.setitem(sys.modules, "eralchemy2", eralchemy2)
+
+    group = erd.diagram_tables(load_schema(), erd.GROUPS["kinematics"])
+    erd.render_diagram("schema.yaml", group, str(tmp_path / "kinematics.png"))
+    erd.render_diagram("schema.yaml", None, str(tmp_path / "all.png"))
+
+    (metadata, kwargs), (_, all_kwargs) = calls
+    # Filtered as eralchemy2 does: full names matched against the patterns
+    kept = [
+        table.name
+        for table in metadata.tables.values()
+        if any(re.fullmatch(pattern, table.fullname) for pattern in kwargs["include_tables"])
+    ]
+    assert sorted(kept) == sorted(group)
+    assert all_kwargs["include_tables"] is None
+    assert len(load_metadata().tables) > len(kept)
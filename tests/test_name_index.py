@@ -0,0 +1,64 @@
+"""
+Tests for the normalized name index in scripts/name_index.py
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.db_snapshot import read_only_database
+from scripts.json_loader import build_db_parallel
+from scripts.name_index import NameIndex, normalize_name, resolve_names
+
+
+def test_normalize_name():
+    assert normalize_name("V* Gl  229B") == normalize_name("gl 229 b") == "gl229b"
+    assert normalize_name("NAME Crab Nebula") == "crabnebula"
+    assert normalize_name("HIDDEN something") is None
+    assert normalize_name("") is None
+
+
+def test_resolve_names(db):
+    names = ["gl229b", "V* Gl 229B", "HAT-P-12b", "Not in the database"]
+    results = resolve_names(db, names)
+
+    assert list(results["name"]) == names
+    assert list(results["source"]) == ["Gl 229b", "Gl 229b", "HAT-P-12b", ""]
+    assert list(results["n_sources"]) == [1, 1, 1, 0]
+
+
+def test_index_cache(tmp_path):
+    db = build_db_parallel(db_name=str(tmp_path / "names"), workers=1)
+
+    index = NameIndex.for_database(db, fuzzy=True)
+    fingerprint = index.fingerprint
+    assert index.search("229")[0][1] == "Gl 229b"
+    index.close()
+    assert (tmp_path / ".astrodb_cache" / "names.names.sqlite").exists()
+
+    # Writing to the database rebuilds the index
+    with db.engine.begin() as conn:
+        conn.execute(db.Sources.insert().values(source="Fake", ra_deg=1.0, dec_deg=1.0, reference="Naka95"))
+        conn.execute(db.Names.insert().values(source="Fake", other_name="FAKE 1"))
+    index = NameIndex.for_database(db)
+    assert index.fingerprint != fingerprint
+    assert list(index.resolve(["fake1", "gl 229 b"])["source"]) == ["Fake", "Gl 229b"]
+    index.close()
+
+
+def _resolve_in_process(db_file, cache_dir):
+    db = read_only_database(db_file)
+    index = NameIndex.for_database(db, cache_dir=cache_dir)
+    try:
+        return index.resolve(["gl 229 b"])["source"][0]
+    finally:
+        index.close()
+        db.engine.dispose()
+
+
+def test_concurrent_builds(db_snapshot, tmp_path):
+    # Processes building the same cold index do not trip over each other
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        for attempt in range(5):
+            cache_dir = str(tmp_path / str(attempt))
+            futures = [executor.submit(_resolve_in_process, db_snapshot, cache_dir) for _ in range(4)]
+            assert [future.result() for future in futures] == ["Gl 229b"] * 4
+    assert not list(tmp_path.glob("*/*.tmp"))
@@ -0,0 +1,61 @@
+"""
+Tests for the Parquet export and import in scripts/parquet_io.py
+"""
+
+import pytest
+from felis.datamodel import DataType
+from sqlalchemy import select
+
+import scripts.parquet_io as parquet_io
+from scripts.parquet_io import ARROW_TYPES, build_db_from_parquet, export_parquet, read_manifest, source_partition
+
+
+def test_arrow_types():
+    assert set(ARROW_TYPES) == {datatype.value for datatype in DataType}
+    # Stable across processes, unlike hash()
+    assert source_partition("TWA 27") == source_partition("TWA 27")
+    assert {source_partition(f"Source {i}", 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+def test_round_trip(db, tmp_path, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    # Partition every table with a source column, as large tables would be
+    monkeypatch.setattr(parquet_io, "PARTITION_ROWS", 1)
+    directory = str(tmp_path / "parquet")
+    manifest = export_parquet(db, directory, partitions=4)
+    assert read_manifest(directory) == manifest
+    assert manifest["tables"]["Names"]["partition_key"] == "source"
+    assert manifest["tables"]["Publications"]["files"] == ["Publications.parquet"]
+
+    sources = pq.read_table(f"{directory}/Sources").to_pydict()
+    assert len(sources["source"]) == manifest["tables"]["Sources"]["rows"]
+    for path in manifest["tables"]["Sources"]["files"]:
+        part = int(path.split("-")[-1].split(".")[0])
+        assert all(source_partition(s, 4) == part for s in pq.read_table(f"{directory}/{path}")["source"].to_pylist())
+
+    # Types from the Felis datatypes
+    schema = pq.read_schema(f"{directory}/Spectra.parquet")
+    assert schema.field("observation_date").type == pa.timestamp("us")
+    assert schema.field("access_url").type == pa.string()
+    parallaxes = manifest["tables"]["Parallaxes"]["files"][0]
+    assert pq.read_schema(f"{directory}/{parallaxes}").field("adopted").type == pa.bool_()
+
+    # A new database built from the export has the same contents
+    copy = build_db_from_parquet(directory, db_name=str(tmp_path / "from_parquet"))
+    try:
+        with db.engine.connect() as conn, copy.engine.connect() as copy_conn:
+            for table in db.metadata.sorted_tables:
+                statement = select(table).order_by(*table.columns)
+                assert copy_conn.execute(statement).all() == conn.execute(statement).all(), table.name
+    finally:
+        copy.engine.dispose()
+
+    # An export replaces the previous one, but not a directory of other files
+    export_parquet(db, directory)
+    assert read_manifest(directory)["tables"]["Names"]["partition_key"] == "source"
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "notes.txt").write_text("not an export")
+    with pytest.raises(ValueError, match="not a Parquet export"):
+        export_parquet(db, str(tmp_path / "other"))
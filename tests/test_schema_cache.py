@@ -0,0 +1,51 @@
+"""
+Tests for the cached schema loading in scripts/schema_cache.py
+"""
+
+import shutil
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import create_engine, inspect
+
+from scripts.schema_cache import create_schema_tables, load_metadata, load_schema, read_schema_yaml
+
+
+def test_schema_cache(tmp_path):
+    felis_path = tmp_path / "schema.yaml"
+    shutil.copy("schema.yaml", felis_path)
+    cache_dir = tmp_path / "cache"
+
+    schema = load_schema(str(felis_path), cache_dir=str(cache_dir))
+    (cache_file,) = cache_dir.iterdir()
+    data = read_schema_yaml(str(felis_path))
+    assert [table.name for table in schema.tables] == [table["name"] for table in data["tables"]]
+    assert set(load_metadata(str(felis_path), cache_dir=str(cache_dir)).tables) == {
+        f"{schema.name}.{table.name}" for table in schema.tables
+    }
+
+    # Every call gets its own copy
+    schema.tables.pop()
+    again = load_schema(str(felis_path), cache_dir=str(cache_dir))
+    assert len(again.tables) == len(schema.tables) + 1
+
+    # Editing the file replaces the cache entry
+    content = felis_path.read_text()
+    felis_path.write_text(content.replace("Template database", "Edited template database", 1))
+    assert load_schema(str(felis_path), cache_dir=str(cache_dir)).description.startswith("Edited")
+    assert [file.name for file in cache_dir.iterdir()] != [cache_file.name]
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # Invalid schemas are never cached
+    felis_path.write_text(content.replace("name: astrodb_template", "name: 12", 1))
+    with pytest.raises(ValidationError):
+        load_schema(str(felis_path), cache_dir=str(cache_dir))
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+def test_create_schema_tables(tmp_path):
+    db_file = tmp_path / "empty.sqlite"
+    create_schema_tables(f"sqlite:///{db_file}")
+    engine = create_engine(f"sqlite:///{db_file}")
+    assert set(inspect(engine).get_table_names()) == {table.name for table in load_schema().tables}
+    engine.dispose()
@@ -0,0 +1,65 @@
+"""
+Tests for the read-only serving mode in scripts/serving.py
+"""
+
+import shutil
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from scripts.cache_utils import database_file
+from scripts.serving import lookup_latency, prewarm, serving_database
+
+
+@pytest.fixture
+def served(db_snapshot):
+    db = serving_database(db_snapshot, pool_size=2, mmap_size=2**20, cache_size=1024)
+    yield db
+    db.engine.dispose()
+
+
+def test_serving_database(served):
+    # Connections are opened before the first query
+    assert served.engine.pool.size() == 2
+    assert served.engine.pool.checkedin() == 2
+
+    with served.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA query_only").scalar() == 1
+        assert conn.exec_driver_sql("PRAGMA mmap_size").scalar() == 2**20
+        assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == -1024
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql("DELETE FROM Sources")
+    assert served.query(served.Sources).count() > 0
+
+    # Set up by the SQLAlchemy dialect when connecting, as for any other engine
+    sources = served.Sources
+    assert served.query(sources.c.source).filter(sources.c.source.regexp_match("^TWA")).count() > 0
+
+
+def test_serving_path_with_uri_characters(db_snapshot, tmp_path):
+    db_file = tmp_path / "odd?name#1" / "db.sqlite"
+    db_file.parent.mkdir()
+    shutil.copy(db_snapshot, db_file)
+    db = serving_database(str(db_file), pool_size=1)
+    try:
+        assert database_file(db) == str(db_file)
+        assert db.query(db.Sources).count() > 0
+    finally:
+        db.engine.dispose()
+
+
+def test_prewarm(served):
+    report = prewarm(served, ["Sources"])
+    n_sources = served.query(served.Sources).count()
+    assert report["index"][0] == ""
+    assert len(report) > 1
+    assert all(report["rows"] == n_sources)
+    with pytest.raises(KeyError):
+        prewarm(served, ["NotATable"])
+
+
+def test_lookup_latency(db_snapshot):
+    latencies = lookup_latency(db_snapshot, processes=2, queries=20)
+    assert list(latencies["lookup"]) == ["Sources", "Photometry"]
+    assert all(latencies["p50_ms"] <= latencies["p99_ms"])
+    assert all(latencies["qps"] > 0)
@@ -0,0 +1,71 @@
+"""
+Tests for the cached SIMBAD validation in scripts/simbad_check.py, run offline against tests/fixtures/simbad.json
+"""
+
+import os
+
+import scripts.simbad_check
+from scripts.response_cache import ResponseCache
+from scripts.simbad_check import check_simbad_names, resolve_simbad
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "simbad.json")
+
+
+def test_simbad_fixture(db):
+    cache = ResponseCache(":memory:", "simbad")
+    cache.load_fixture(FIXTURE)
+
+    names = [row[0] for row in db.query(db.Sources.c.source).all()]
+    report = check_simbad_names(db, resolve_simbad(names, cache=cache, offline=True))
+    assert list(report["status"]) == ["unique"] * len(names)
+    assert list(report["sources"]) == names
+
+
+def test_check_statuses(db):
+    responses = {
+        "Gl 229b": {"main_id": "Gl 229B", "ids": ["GJ 229 B", "Gl 229B"]},
+        "both": {"main_id": "x", "ids": ["TWA 26", "WASP-76b"]},
+        "unknown": {"main_id": "y", "ids": ["NAME Not in the database"]},
+        "missing": None,
+    }
+    report = check_simbad_names(db, responses)
+    assert list(report["status"]) == ["unique", "duplicate", "no_db_match", "no_simbad"]
+    assert report["sources"][1] == "TWA 26|WASP-76b"
+
+
+def test_fetch_only_misses(tmp_path, monkeypatch):
+    requested = []
+
+    def fake_fetch(names, chunk_size, workers):
+        requested.extend(names)
+        return {name: None for name in names}
+
+    monkeypatch.setattr(scripts.simbad_check, "fetch_simbad", fake_fetch)
+
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), "simbad", ttl=3600)
+    cache.put_many({"TWA 26": {"main_id": "TWA 26", "ids": ["TWA 26"]}})
+    cache.put_many({"stale": {"main_id": "stale", "ids": []}}, fetched_at=0)
+
+    responses = resolve_simbad(["TWA 26", "stale", "new"], cache=cache)
+    assert requested == ["stale", "new"]
+    assert responses["TWA 26"]["main_id"] == "TWA 26"
+    assert responses["new"] is None
+
+    # Misses are cached too
+    requested.clear()
+    resolve_simbad(["TWA 26", "stale", "new"], cache=cache)
+    assert requested == []
+
+
+def test_default_cache_closed(tmp_path, monkeypatch):
+    closed = []
+
+    class RecordingCache(ResponseCache):
+        def close(self):
+            closed.append(self.path)
+            super().close()
+
+    monkeypatch.setattr(scripts.simbad_check, "DEFAULT_CACHE_FILE", str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr(scripts.simbad_check, "ResponseCache", RecordingCache)
+    assert resolve_simbad(["TWA 26"], offline=True) == {"TWA 26": None}
+    assert closed == [str(tmp_path / "responses.sqlite")]
@@ -0,0 +1,108 @@
+"""
+Tests for the cached SVO filter lookups in scripts/svo_filters.py, against a local stand-in for SVO
+"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from astrodb_utils import AstroDBError
+
+import scripts.svo_filters
+from scripts.response_cache import ResponseCache
+from scripts.svo_filters import check_filters, filter_columns, resolve_filters
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture
+def svo_server():
+    with open(os.path.join(FIXTURES, "svo.json"), encoding="utf-8") as f:
+        filters = json.load(f)
+    with open(os.path.join(FIXTURES, "svo_filter.xml"), encoding="utf-8") as f:
+        template = f.read()
+    with open(os.path.join(FIXTURES, "svo_not_found.xml"), encoding="utf-8") as f:
+        not_found = f.read()
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            band = parse_qs(urlparse(self.path).query)["ID"][0]
+            requested.append(band)
+            if band == "Broken/Broken.X":
+                self.send_response(500)
+                self.end_headers()
+                return
+            if band in filters:
+                body = template.format(band=band, **filters[band])
+            else:
+                body = not_found
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml")
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/fps.php", requested
+    server.shutdown()
+    server.server_close()
+
+
+def test_resolve_filters(db, svo_server, tmp_path):
+    url, requested = svo_server
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), "svo", ttl=3600)
+    bands = [row[0] for row in db.query(db.PhotometryFilters.c.band).all()] + ["Fake/Fake.X", "Broken/Broken.X"]
+
+    # A failed lookup does not stop the others
+    responses = resolve_filters(bands, cache=cache, url=url, workers=4)
+    assert sorted(requested) == sorted(bands)
+    assert responses["Fake/Fake.X"] is None
+    assert "Status code: 500" in responses["Broken/Broken.X"]["error"]
+    assert sum(response is not None and "error" in response for response in responses.values()) == 1
+
+    # The fixture values are those of data/reference, except for the width of GAIA/GAIA3.Grp
+    report = check_filters(db, responses)
+    assert all(report["in_svo"])
+    assert list(report["band"][~report["matches_svo"]]) == ["GAIA/GAIA3.Grp"]
+    grp = report[report["band"] == "GAIA/GAIA3.Grp"][0]
+    assert (grp["width_angstroms"], grp["svo_width_angstroms"]) == (2924.4363, 2860.0)
+
+    # Everything, including bands SVO does not know, comes from the cache the second time; failures are retried
+    requested.clear()
+    assert resolve_filters(bands, cache=cache, url=url) == responses
+    assert requested == ["Broken/Broken.X"]
+    with pytest.raises(AstroDBError, match="Status code: 500"):
+        filter_columns("Broken/Broken.X", cache=cache, url=url)
+
+
+def test_filter_columns_offline(db):
+    cache = ResponseCache(":memory:", "svo")
+    cache.load_fixture(os.path.join(FIXTURES, "svo.json"))
+
+    columns = filter_columns("2MASS/2MASS.H", cache=cache, offline=True)
+    assert columns == {"band": "2MASS/2MASS.H", "effective_wavelength_angstroms": 16620.0, "width_angstroms": 2410.1821}
+
+    with pytest.raises(AstroDBError):
+        filter_columns("Fake/Fake.X", cache=cache, offline=True)
+
+
+def test_default_cache_closed(tmp_path, monkeypatch):
+    closed = []
+
+    class RecordingCache(ResponseCache):
+        def close(self):
+            closed.append(self.path)
+            super().close()
+
+    monkeypatch.setattr(scripts.svo_filters, "DEFAULT_CACHE_FILE", str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr(scripts.svo_filters, "ResponseCache", RecordingCache)
+    assert resolve_filters(["2MASS/2MASS.H"], offline=True) == {"2MASS/2MASS.H": None}
+    assert closed == [str(tmp_path / "responses.sqlite")]
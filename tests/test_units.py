@@ -0,0 +1,80 @@
+"""
+Tests for the unit normalization in scripts/units.py
+"""
+
+import pytest
+
+from scripts.json_loader import build_db_parallel
+from scripts.units import (
+    check_units,
+    parameter_units,
+    parse_unit,
+    si_conversion,
+    store_parameter_units,
+    stored_parameter_units,
+    to_si,
+)
+
+
+def test_si_conversion():
+    assert si_conversion("Gyr") == ("s", pytest.approx(3.15576e16))
+    assert si_conversion("km / s") == ("m / s", 1000.0)
+    assert si_conversion("dex") == ("dex", 1.0)
+    assert si_conversion("not a unit") is None
+
+    parse_unit.cache_clear()
+    for _ in range(3):
+        parse_unit("M_jup")
+    assert parse_unit.cache_info().misses == 1
+
+
+def test_to_si(db):
+    t = to_si(db, "ModeledParameters")
+    mass = t[t["parameter"] == "mass"][0]
+    assert mass["unit_si"] == "kg"
+    assert mass["value_si"] == pytest.approx(mass["value"] * 1.8981246e27, rel=1e-6)
+
+    units = parameter_units(db)
+    assert set(units["parameter"]) == {"age", "mass"}
+    assert all(units["consistent"])
+
+
+def test_stored_units(tmp_path):
+    # The build stores the units in the ParameterUnits side table, and to_si reads them from it
+    db = build_db_parallel(db_name=str(tmp_path / "units"), workers=1)
+    assert (tmp_path / ".astrodb_cache" / "units.units.sqlite").exists()
+    assert list(stored_parameter_units(db)["parameter"]) == list(parameter_units(db)["parameter"])
+
+    parse_unit.cache_clear()
+    si_conversion.cache_clear()
+    assert len(to_si(db, "ModeledParameters")) > 0
+    assert parse_unit.cache_info().misses == 0
+
+    # Rebuilt when the database changes
+    path = store_parameter_units(db)
+    with db.engine.begin() as conn:
+        values = {"source": "Gl 229b", "parameter": "metallicity", "reference": "Naka95"}
+        conn.execute(db.ModeledParameters.insert().values(model="a", value=0.1, unit="dex", **values))
+    assert "metallicity" in stored_parameter_units(db)["parameter"]
+    assert path.endswith("units.units.sqlite")
+
+
+def test_mixed_units(tmp_path):
+    db = build_db_parallel(db_name=str(tmp_path / "units"), workers=1)
+    with db.engine.begin() as conn:
+        values = {"source": "Gl 229b", "parameter": "age", "reference": "Naka95"}
+        conn.execute(db.ModeledParameters.insert().values(model="a", value=3800.0, unit="Myr", **values))
+        conn.execute(db.ModeledParameters.insert().values(model="b", value=1.0, unit="furlongs", **values))
+
+    failures = check_units(db)
+    assert list(failures["unit"]) == ["furlongs"]
+    assert list(failures["n_rows"]) == [1]
+
+    t = to_si(db, "ModeledParameters")
+    ages = t[(t["parameter"] == "age") & (t["unit"] != "furlongs")]
+    assert ages["value_si"][0] == pytest.approx(ages["value_si"][1])
+    assert t[t["unit"] == "furlongs"]["value_si"][0] is None
+    assert t[t["unit"] == "furlongs"]["unit_si"][0] is None
+
+    units = parameter_units(db)
+    assert not any(units["consistent"][units["parameter"] == "age"])
@@ -0,0 +1,99 @@
+"""
+Tests for the schema-driven validation in scripts/validation.py
+"""
+
+import pytest
+from sqlalchemy import event, text
+
+from scripts.json_loader import build_db_parallel
+from scripts.validation import Rule, failed_rules, load_rules, validate_database, violating_rows
+
+
+def test_load_rules():
+    rules = load_rules("schema.yaml")
+    sources = {rule.name: rule for rule in rules["Sources"]}
+    assert sources["check_ra"] == Rule("Sources", "check_ra", "check", "ra_deg >= 0 AND ra_deg <= 360")
+    assert sources["ra_deg_not_null"].kind == "not_null"
+    assert sources["equinox_enum"] == Rule("Sources", "equinox_enum", "enum", "equinox IN ('ICRS', 'J2000', 'B1950')")
+    photometry = {rule.name: rule for rule in rules["Photometry"]}
+    assert photometry["magnitude_range"].expression == "magnitude >= -1 AND magnitude <= 100"
+    # Only the rules of the schema
+    assert "magnitude_range" not in {rule.name for rule in load_rules("schema.yaml", None)["Photometry"]}
+
+
+def test_load_rules_errors(tmp_path):
+    rules_file = tmp_path / "validation.yaml"
+    rules_file.write_text("Sources:\n  not_a_column:\n    not_null: true\n")
+    with pytest.raises(ValueError, match="not_a_column"):
+        load_rules("schema.yaml", str(rules_file))
+    rules_file.write_text("Sources:\n  ra_deg:\n    maximum: 360\n")
+    with pytest.raises(ValueError, match="maximum"):
+        load_rules("schema.yaml", str(rules_file))
+
+
+@pytest.mark.mutates_db
+def test_rule_violations(db):
+    # Rules of validation.yaml are not constraints of the database, so breaking rows can be loaded
+    with db.engine.begin() as conn:
+        photometry = {"source": "Crab Nebula", "reference": "Alle16"}
+        conn.execute(db.Photometry.insert().values(band="2MASS/2MASS.J", magnitude=150.0, **photometry))
+        conn.execute(db.Photometry.insert().values(band="2MASS/2MASS.H", magnitude=None, **photometry))
+        relationships = db.CompanionRelationships
+        conn.execute(relationships.update().values(relationship="Cousin"))
+
+    report = validate_database(db, tables=["Photometry", "CompanionRelationships"])
+    failed = failed_rules(report)
+    assert sorted(zip(failed["rule"], failed["n_violations"])) == [
+        ("magnitude_not_null", 1),
+        ("magnitude_range", 1),
+        ("relationship_enum", db.query(relationships).count()),
+    ]
+    assert sorted(violating_rows(db, "Photometry")["band"]) == ["2MASS/2MASS.H", "2MASS/2MASS.J"]
+
+
+def test_one_query_per_table(db):
+    rules = load_rules("schema.yaml")
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        report = validate_database(db, rules=rules)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    assert len(statements) == len(set(report["table"])) == len(rules)
+    assert len(report) == sum(len(table_rules) for table_rules in rules.values())
+    assert len(failed_rules(report)) == 0
+
+
+def test_violations(tmp_path):
+    db = build_db_parallel(db_name=str(tmp_path / "validation"), workers=1)
+
+    # Rows loaded without the CHECK constraints, as in a database built from an older schema
+    with db.engine.begin() as conn:
+        conn.execute(text("PRAGMA ignore_check_constraints = ON"))
+        conn.execute(db.Sources.insert().values(source="Bad", ra_deg=400.0, dec_deg=-95.0, reference="Naka95"))
+        conn.execute(text("PRAGMA ignore_check_constraints = OFF"))
+
+    report = validate_database(db, tables=["Sources"])
+    failed = failed_rules(report, "Sources")
+    assert sorted(failed["rule"]) == ["check_dec", "check_ra"]
+    assert list(failed["n_violations"]) == [1, 1]
+    assert list(violating_rows(db, "Sources")["source"]) == ["Bad"]
+
+    # Custom rules
+    rules = {
+        "Sources": [
+            Rule("Sources", "northern", "check", "dec_deg > 0"),
+            Rule("Sources", "epoch", "not_null", "epoch_year"),
+        ]
+    }
+    report = validate_database(db, rules=rules)
+    n_sources = db.query(db.Sources).count()
+    n_southern = db.query(db.Sources).filter(db.Sources.c.dec_deg <= 0).count()
+    n_no_epoch = db.query(db.Sources).filter(db.Sources.c.epoch_year.is_(None)).count()
+    assert list(report["n_rows"]) == [n_sources, n_sources]
+    assert list(report["n_violations"]) == [n_southern, n_no_epoch]